@@ -1,6 +1,7 @@
 import os
 from celery import Celery
 from celery.schedules import crontab
+from django.conf import settings
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'Drone_Assessment.settings')
 
@@ -16,4 +17,16 @@ app.conf.beat_schedule = {
         'task': 'drones.tasks.check_drone_battery',
         'schedule': crontab(minute='*/1'),
     },
+    'rollup-battery-history-every-hour': {
+        'task': 'drones.tasks.rollup_battery_history',
+        'schedule': crontab(minute=5),
+    },
+    'flush-telemetry': {
+        'task': 'drones.tasks.flush_telemetry',
+        'schedule': settings.TELEMETRY_FLUSH_INTERVAL,
+    },
+    'generate-medication-thumbnails-every-10-minutes': {
+        'task': 'drones.tasks.generate_medication_thumbnails',
+        'schedule': crontab(minute='*/10'),
+    },
 }
@@ -10,11 +10,14 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 
+import sys
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
+TESTING = 'test' in sys.argv
+
 
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/4.2/howto/deployment/checklist/
@@ -85,6 +88,66 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+# Redis is already run for Celery; tests use an in-process cache instead.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': 'redis://localhost:6379/1',
+    }
+}
+if TESTING:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# Seconds a cached drone lookup is served before it is read again
+DRONE_CACHE_TTL = 30
+
+# Battery history sampling. 'delta' records a sample only when a drone's
+# battery level, state or battery health changed since its last sample;
+# 'full' records every drone on every run.
+DRONE_BATTERY_HISTORY_MODE = 'delta'
+# Seconds after which a drone is sampled even if nothing changed, bounding
+# the gaps in its history. None disables the heartbeat.
+DRONE_BATTERY_HISTORY_HEARTBEAT = 15 * 60
+# Number of Celery tasks the per-minute battery sweep is split across.
+# 1 sweeps the whole fleet in a single task.
+DRONE_BATTERY_SWEEP_SHARDS = 1
+# Days raw battery samples and hourly rollups are kept. Daily rollups are
+# kept forever.
+DRONE_BATTERY_HISTORY_RETENTION_DAYS = 7
+DRONE_BATTERY_HOURLY_RETENTION_DAYS = 90
+# Days drone change feed events are kept
+DRONE_EVENT_RETENTION_DAYS = 7
+
+# Drone telemetry ingestion, see drones.telemetry. Readings are buffered
+# in Redis ('redis') and written by the flush_telemetry task every
+# TELEMETRY_FLUSH_INTERVAL seconds, or kept in process memory ('local')
+# and flushed by the ingest request once the interval has passed.
+# A reading reaches the database within the flush interval plus the time
+# to drain the readings ahead of it. Ingest refuses readings with 503
+# once TELEMETRY_BUFFER_MAX_READINGS are waiting, which caps that drain
+# time.
+TELEMETRY_BUFFER = 'local' if TESTING else 'redis'
+TELEMETRY_REDIS_URL = 'redis://localhost:6379/2'
+TELEMETRY_FLUSH_INTERVAL = 2
+TELEMETRY_FLUSH_BATCH_SIZE = 5000
+TELEMETRY_FLUSH_LOCK_TIMEOUT = 60
+TELEMETRY_BUFFER_MAX_READINGS = 100000
+# Minutes a typical mission takes. Drones predicted to reach the minimum
+# battery capacity sooner are not offered as available.
+DRONE_TYPICAL_MISSION_MINUTES = 30
+# Threads decoding and storing images during a medication catalog import
+MEDICATION_IMPORT_IMAGE_WORKERS = 8
+# Longest side, in pixels, of each medication image thumbnail
+MEDICATION_THUMBNAIL_SIZES = (128, 512)
+
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
@@ -148,3 +211,4 @@ CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TIMEZONE = 'Africa/Cairo'
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
+CELERY_TASK_ALWAYS_EAGER = TESTING
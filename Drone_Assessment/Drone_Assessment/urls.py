@@ -2,12 +2,31 @@ from django.contrib import admin
 from django.urls import path
 from drones.views import (
     register_drone,
+    bulk_register_drones_view,
     register_medication,
+    import_medications,
+    get_medication_import,
     load_drone_with_medication,
+    assign_order_to_drones,
+    transition_drone,
+    transition_drones_view,
+    complete_delivery,
+    return_drone,
+    complete_deliveries,
+    return_drones,
     check_drone_battery_level,
     get_loaded_medication,
+    get_battery_history,
     get_available_drones,
     get_all_drones,
+    export_fleet,
+    get_drone_events,
+    ingest_telemetry,
+    stream_drone_events,
+    check_drone_battery_level_async,
+    get_loaded_medication_async,
+    get_available_drones_async,
+    get_all_drones_async,
 )
 from drf_yasg.views import get_schema_view
 from drf_yasg import openapi
@@ -37,21 +56,68 @@ urlpatterns = [
     ),
     path('admin/', admin.site.urls),
     path('drone/register/', register_drone, name='register-drone'),
+    path(
+        'drones/bulk-register/',
+        bulk_register_drones_view,
+        name='bulk-register-drones',
+    ),
     path(
         'medication/register/',
         register_medication,
         name='register-medication',
     ),
+    path(
+        'medications/import/',
+        import_medications,
+        name='import-medications',
+    ),
+    path(
+        'medications/import/<int:import_id>/',
+        get_medication_import,
+        name='get-medication-import',
+    ),
     path(
         'drone/<int:drone_id>/load-medication/',
         load_drone_with_medication,
         name='load-drone-with-medication',
     ),
+    path(
+        'drones/assign/',
+        assign_order_to_drones,
+        name='assign-order-to-drones',
+    ),
+    path(
+        'drone/<int:drone_id>/transition/',
+        transition_drone,
+        name='transition-drone',
+    ),
+    path(
+        'drones/transition/',
+        transition_drones_view,
+        name='transition-drones',
+    ),
+    path(
+        'drone/<int:drone_id>/delivery-complete/',
+        complete_delivery,
+        name='complete-delivery',
+    ),
+    path('drone/<int:drone_id>/return/', return_drone, name='return-drone'),
+    path(
+        'drones/delivery-complete/',
+        complete_deliveries,
+        name='complete-deliveries',
+    ),
+    path('drones/return/', return_drones, name='return-drones'),
     path(
         'drone/<int:drone_id>/battery-level/',
         check_drone_battery_level,
         name='check-drone-battery-level',
     ),
+    path(
+        'drone/<int:drone_id>/battery-history/',
+        get_battery_history,
+        name='get-battery-history',
+    ),
     path(
         'drone/<int:drone_id>/medication/loaded/',
         get_loaded_medication,
@@ -62,5 +128,29 @@ urlpatterns = [
         get_available_drones,
         name='get-available-drones',
     ),
+    path('drones/export/', export_fleet, name='export-fleet'),
+    path('drones/events/', get_drone_events, name='get-drone-events'),
+    path('drones/telemetry/', ingest_telemetry, name='ingest-telemetry'),
+    path(
+        'drones/events/stream/',
+        stream_drone_events,
+        name='stream-drone-events',
+    ),
     path('drones/', get_all_drones, name='get-all-drones'),
+    path(
+        'async/drone/<int:drone_id>/battery-level/',
+        check_drone_battery_level_async,
+        name='check-drone-battery-level-async',
+    ),
+    path(
+        'async/drone/<int:drone_id>/medication/loaded/',
+        get_loaded_medication_async,
+        name='get-loaded-medication-async',
+    ),
+    path(
+        'async/drones/available/',
+        get_available_drones_async,
+        name='get-available-drones-async',
+    ),
+    path('async/drones/', get_all_drones_async, name='get-all-drones-async'),
 ]
@@ -0,0 +1,210 @@
+import heapq
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+from drones.cache import invalidate_drones
+from drones.events import record_drone_events
+from drones.loading import (
+    INVALID_ID,
+    MAX_RESERVATION_ATTEMPTS,
+    NOT_FOUND,
+    ReservationConflict,
+)
+from drones.models import Drone, Medication
+from drones.packing import EPSILON
+from drones.util import available_drones
+
+# Reasons an ordered medication unit is not assigned to a drone
+INVALID_QUANTITY = 'invalid_quantity'
+NO_CAPACITY = 'no_capacity'
+
+# Most units of one order item, and of a whole order. Each unit is planned
+# individually, so these bound the memory an order can take.
+MAX_ITEM_QUANTITY = 1000
+MAX_ORDER_UNITS = 10000
+
+
+def _valid_number(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def _unassigned(med_id, reason, quantity=1):
+    return {"medication": med_id, "quantity": quantity, "reason": reason}
+
+
+# Order items are {"medication": id, "quantity": n} objects.
+# Returns the quantity ordered per valid medication ID and the items that
+# could not be parsed. Items over MAX_ITEM_QUANTITY, or that would take
+# the order past MAX_ORDER_UNITS, are refused as invalid quantities.
+def parse_order(items):
+    quantities, unassigned = {}, []
+    units = 0
+    for item in items:
+        med_id = item.get('medication') if isinstance(item, dict) else item
+        quantity = item.get('quantity', 1) if isinstance(item, dict) else 1
+        if not _valid_number(med_id):
+            unassigned.append(_unassigned(med_id, INVALID_ID))
+        elif (
+            not _valid_number(quantity)
+            or not 1 <= quantity <= MAX_ITEM_QUANTITY
+            or units + quantity > MAX_ORDER_UNITS
+        ):
+            unassigned.append(_unassigned(
+                med_id, INVALID_QUANTITY,
+                quantity if _valid_number(quantity) and quantity > 0 else 1
+            ))
+        else:
+            quantities[med_id] = quantities.get(med_id, 0) + quantity
+            units += quantity
+    return quantities, unassigned
+
+
+def _eligible_drones(limit):
+    drones = available_drones().annotate(
+        remaining_capacity=F('weight_limit') - F('current_medication_weight')
+    ).order_by('-remaining_capacity', 'pk')
+    if connection.features.has_select_for_update:
+        drones = drones.select_for_update()
+    return list(drones[:limit])
+
+
+# Spread the ordered units over the drones with first-fit-decreasing.
+# Drones are tried largest remaining capacity first, so the order ends up
+# on as few drones as possible. A drone carries each medication at most
+# once, so every unit of a medication goes to a different drone.
+# Capacities only shrink as units are placed, so a unit heavier than the
+# largest remaining capacity is left out without scanning the drones, and
+# once a unit of a medication fits nowhere its remaining units do not
+# either. Returns the medications per drone ID and the units that did not
+# fit.
+def plan_assignment(drones, medications, quantities, loaded_pairs):
+    units = sorted(
+        (
+            medications[med_id]
+            for med_id, quantity in quantities.items()
+            for _ in range(quantity)
+        ),
+        key=lambda medication: (-medication.weight, medication.pk)
+    )
+    remaining = [drone.remaining_capacity for drone in drones]
+    # Max-heap of (-remaining capacity, drone index); entries left behind
+    # by a later assignment are skipped when they reach the top
+    largest = [(-capacity, index) for index, capacity in enumerate(remaining)]
+    heapq.heapify(largest)
+    assignments, unassigned, unplaceable = {}, {}, set()
+    for medication in units:
+        while largest and -largest[0][0] != remaining[largest[0][1]]:
+            heapq.heappop(largest)
+        may_fit = (
+            medication.pk not in unplaceable
+            and bool(largest)
+            and medication.weight <= -largest[0][0] + EPSILON
+        )
+        if not (may_fit and _place(
+            medication, drones, remaining, loaded_pairs, assignments, largest
+        )):
+            unplaceable.add(medication.pk)
+            unassigned[medication.pk] = unassigned.get(medication.pk, 0) + 1
+    return assignments, [
+        _unassigned(med_id, NO_CAPACITY, quantity)
+        for med_id, quantity in unassigned.items()
+    ]
+
+
+# Put the unit on the first drone it fits. Returns whether one was found.
+def _place(medication, drones, remaining, loaded_pairs, assignments,
+           largest):
+    for index, drone in enumerate(drones):
+        if (
+            medication.weight <= remaining[index] + EPSILON
+            and (drone.pk, medication.pk) not in loaded_pairs
+        ):
+            remaining[index] -= medication.weight
+            heapq.heappush(largest, (-remaining[index], index))
+            loaded_pairs.add((drone.pk, medication.pk))
+            assignments.setdefault(drone.pk, []).append(medication)
+            return True
+    return False
+
+
+# Assign an order across all eligible IDLE drones in one transaction.
+# Every assigned drone is written with a compare-and-swap on its version;
+# if another dispatcher got there first the whole assignment is rolled
+# back and planned again, a bounded number of times.
+def assign_order(items, attempts=MAX_RESERVATION_ATTEMPTS):
+    quantities, rejected = parse_order(items)
+    medications = Medication.objects.in_bulk(list(quantities))
+    for med_id in list(quantities):
+        if med_id not in medications:
+            rejected.append(
+                _unassigned(med_id, NOT_FOUND, quantities.pop(med_id))
+            )
+
+    for _ in range(attempts):
+        try:
+            with transaction.atomic():
+                return _assign(quantities, medications, rejected)
+        except ReservationConflict:
+            continue
+
+    raise ReservationConflict(
+        "Drones were modified concurrently, try again"
+    )
+
+
+def _assign(quantities, medications, rejected):
+    drones = _eligible_drones(sum(quantities.values()))
+    # Only drones whose medication_count says they carry something can
+    # already hold one of the ordered medications
+    carrying = [drone.pk for drone in drones if drone.medication_count]
+    loaded_pairs = set(
+        Drone.medications.through.objects.filter(
+            drone_id__in=carrying
+        ).values_list('drone_id', 'medication_id')
+    ) if carrying else set()
+    assignments, unassigned = plan_assignment(
+        drones, medications, quantities, loaded_pairs
+    )
+
+    dispatched = [drone for drone in drones if drone.pk in assignments]
+    for drone in dispatched:
+        load_weight = sum(med.weight for med in assignments[drone.pk])
+        reserved = Drone.objects.filter(
+            pk=drone.pk, state='IDLE', version=drone.version
+        ).update(
+            current_medication_weight=(
+                F('current_medication_weight') + load_weight
+            ),
+            medication_count=(
+                F('medication_count') + len(assignments[drone.pk])
+            ),
+            state='LOADED',
+            version=F('version') + 1,
+            updated_at=timezone.now(),
+        )
+        if not reserved:
+            raise ReservationConflict()
+
+    transaction.on_commit(
+        lambda: invalidate_drones([drone.pk for drone in dispatched])
+    )
+    record_drone_events([
+        (drone.pk, 'LOADED', drone.battery_capacity,
+         drone.state, drone.battery_capacity)
+        for drone in dispatched
+    ])
+
+    Drone.medications.through.objects.bulk_create([
+        Drone.medications.through(drone_id=drone_id, medication=medication)
+        for drone_id, loaded in assignments.items()
+        for medication in loaded
+    ])
+
+    return [
+        {
+            "drone": drone.pk,
+            "serial_number": drone.serial_number,
+            "medications": [med.pk for med in assignments[drone.pk]],
+        }
+        for drone in dispatched
+    ], rejected + unassigned
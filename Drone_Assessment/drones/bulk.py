@@ -0,0 +1,80 @@
+import csv
+import io
+from django.db import transaction
+from drones.events import record_drone_events
+from drones.models import Drone
+from drones.serializers import DroneBulkSerializer
+
+# Most rows accepted in one bulk registration request
+BULK_REGISTER_MAX_ROWS = 5000
+# Rows per INSERT when bulk registering
+BULK_CREATE_BATCH_SIZE = 500
+
+DUPLICATE_SERIAL_NUMBER = 'drone with this serial number already exists.'
+
+
+# Rows of an uploaded CSV file with a header row. Empty cells are left
+# out so the serializer applies field defaults.
+def csv_rows(upload):
+    reader = csv.DictReader(io.TextIOWrapper(upload, encoding='utf-8-sig'))
+    return [
+        {field: value for field, value in row.items() if value}
+        for row in reader
+    ]
+
+
+# Validate rows as a batch with serializer_class(many=True).
+# Returns the validated data of each row (None when invalid) and the
+# errors of each row.
+def validate_rows(serializer_class, rows):
+    serializer = serializer_class(data=rows, many=True)
+    if serializer.is_valid():
+        return list(serializer.validated_data), [{}] * len(rows)
+    row_errors = list(serializer.errors)
+    validated = [
+        None if errors else serializer.child.run_validation(row)
+        for row, errors in zip(rows, row_errors)
+    ]
+    return validated, row_errors
+
+
+# Validate drone rows as a batch. Serial number uniqueness, against the
+# database and within the batch, is checked with a single query.
+def validate_drone_rows(rows):
+    validated, row_errors = validate_rows(DroneBulkSerializer, rows)
+
+    serial_numbers = [data['serial_number'] for data in validated if data]
+    taken = set(Drone.objects.filter(
+        serial_number__in=serial_numbers
+    ).values_list('serial_number', flat=True))
+    for index, data in enumerate(validated):
+        if data is None:
+            continue
+        if data['serial_number'] in taken:
+            row_errors[index] = {'serial_number': [DUPLICATE_SERIAL_NUMBER]}
+            validated[index] = None
+        taken.add(data['serial_number'])
+
+    return validated, row_errors
+
+
+# Register drones in batches inside one transaction. In atomic mode
+# nothing is registered if any row is invalid; otherwise the valid rows
+# are registered. Returns the number registered and the per-row errors.
+def bulk_register_drones(rows, atomic=True):
+    validated, row_errors = validate_drone_rows(rows)
+    errors = [
+        {"row": index, "errors": errors}
+        for index, errors in enumerate(row_errors) if errors
+    ]
+    if atomic and errors:
+        return 0, errors
+
+    drones = [Drone(**data) for data in validated if data is not None]
+    with transaction.atomic():
+        Drone.objects.bulk_create(drones, batch_size=BULK_CREATE_BATCH_SIZE)
+        record_drone_events([
+            (drone.pk, drone.state, drone.battery_capacity, None, None)
+            for drone in drones if drone.pk is not None
+        ])
+    return len(drones), errors
@@ -0,0 +1,94 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.http import Http404
+from drones.models import Drone
+
+# Drone fields served from the cache to battery-level polls
+DRONE_SNAPSHOT_FIELDS = (
+    'serial_number', 'battery_capacity', 'state', 'discharge_rate'
+)
+
+CACHE_HITS_KEY = 'drones:cache:hits'
+CACHE_MISSES_KEY = 'drones:cache:misses'
+
+
+def drone_cache_key(drone_id):
+    return f'drones:drone:{drone_id}'
+
+
+def _count(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, timeout=None)
+
+
+# Read-through lookup of the drone fields dashboards poll. A hit is served
+# from the cache without touching the database.
+def get_drone_snapshot(drone_id):
+    key = drone_cache_key(drone_id)
+    snapshot = cache.get(key)
+    if snapshot is not None:
+        _count(CACHE_HITS_KEY)
+        return snapshot
+
+    _count(CACHE_MISSES_KEY)
+    snapshot = Drone.objects.filter(pk=drone_id).values(
+        *DRONE_SNAPSHOT_FIELDS
+    ).first()
+    if snapshot is None:
+        raise Http404
+    cache.set(key, snapshot, timeout=settings.DRONE_CACHE_TTL)
+    return snapshot
+
+
+async def _acount(key):
+    try:
+        await cache.aincr(key)
+    except ValueError:
+        await cache.aset(key, 1, timeout=None)
+
+
+# get_drone_snapshot for async views, with the async cache API and ORM
+async def aget_drone_snapshot(drone_id):
+    key = drone_cache_key(drone_id)
+    snapshot = await cache.aget(key)
+    if snapshot is not None:
+        await _acount(CACHE_HITS_KEY)
+        return snapshot
+
+    await _acount(CACHE_MISSES_KEY)
+    snapshot = await Drone.objects.filter(pk=drone_id).values(
+        *DRONE_SNAPSHOT_FIELDS
+    ).afirst()
+    if snapshot is None:
+        raise Http404
+    await cache.aset(key, snapshot, timeout=settings.DRONE_CACHE_TTL)
+    return snapshot
+
+
+# Refresh the cached snapshots of drones that were just read, given as
+# dicts holding the pk and DRONE_SNAPSHOT_FIELDS
+def refresh_drone_snapshots(drones):
+    cache.set_many(
+        {
+            drone_cache_key(drone['pk']): {
+                field: drone[field] for field in DRONE_SNAPSHOT_FIELDS
+            }
+            for drone in drones
+        },
+        timeout=settings.DRONE_CACHE_TTL
+    )
+
+
+# Drop cached snapshots of drones written outside Model.save(), e.g. by
+# queryset update() calls
+def invalidate_drones(drone_ids):
+    cache.delete_many([drone_cache_key(drone_id) for drone_id in drone_ids])
+
+
+def cache_stats():
+    return {
+        "hits": cache.get(CACHE_HITS_KEY, 0),
+        "misses": cache.get(CACHE_MISSES_KEY, 0),
+    }
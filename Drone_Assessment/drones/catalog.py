@@ -0,0 +1,211 @@
+import io
+import os
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.db.models import F
+from PIL import Image
+from drones.bulk import validate_rows
+from drones.models import Drone, Medication, MedicationImport
+from drones.payload import refresh_payloads
+from drones.serializers import MedicationImportSerializer
+
+# Most rows accepted in one catalog import
+MEDICATION_IMPORT_MAX_ROWS = 100000
+# Rows validated, upserted and committed together
+MEDICATION_IMPORT_CHUNK_SIZE = 1000
+# Row errors kept on an import for reporting, the rest are only counted
+MEDICATION_IMPORT_MAX_ERRORS = 1000
+
+PROGRESS_FIELDS = (
+    'processed_rows', 'created_count', 'updated_count', 'failed_count',
+    'errors',
+)
+
+IMAGE_NOT_IN_ARCHIVE = 'Image not found in the uploaded archive.'
+INVALID_IMAGE = 'Upload a valid image.'
+
+
+# Record a catalog import of rows, with an optional zip archive of the
+# images the rows name in their image column. The import is run by
+# run_import.
+def create_import(rows, images=None):
+    if not isinstance(rows, list) or not (
+        0 < len(rows) <= MEDICATION_IMPORT_MAX_ROWS
+    ):
+        raise ValueError(
+            "Expected a JSON array or CSV file of 1 to "
+            f"{MEDICATION_IMPORT_MAX_ROWS} medications"
+        )
+    if images is not None and not zipfile.is_zipfile(images):
+        raise ValueError("images must be a zip archive")
+    return MedicationImport.objects.create(
+        rows=rows, total_rows=len(rows), images=images
+    )
+
+
+@contextmanager
+def _open_archive(medication_import):
+    if not medication_import.images:
+        yield None
+        return
+    with medication_import.images.open('rb') as images:
+        with zipfile.ZipFile(images) as archive:
+            yield archive
+
+
+# Check the image decodes and save it to the Medication image storage,
+# which stores identical images once. Runs on the image worker pool, so it
+# must not touch the database. Returns the stored name.
+def _store_image(name, data):
+    try:
+        Image.open(io.BytesIO(data)).verify()
+    except Exception:
+        raise ValueError(INVALID_IMAGE)
+    field = Medication._meta.get_field('image')
+    return field.storage.save(
+        field.generate_filename(None, os.path.basename(name)),
+        ContentFile(data)
+    )
+
+
+# Store the images of a chunk's rows on the worker pool.
+# Returns the stored name per row index and the errors per row index.
+def _store_images(pool, archive, images):
+    stored, errors, futures = {}, {}, {}
+    for index, name in images.items():
+        try:
+            data = archive.read(name) if archive else None
+        except KeyError:
+            data = None
+        if data is None:
+            errors[index] = {'image': [IMAGE_NOT_IN_ARCHIVE]}
+        else:
+            futures[index] = pool.submit(_store_image, name, data)
+    for index, future in futures.items():
+        try:
+            stored[index] = future.result()
+        except ValueError as e:
+            errors[index] = {'image': [str(e)]}
+    return stored, errors
+
+
+# Validate, store the images of and upsert one chunk of rows, keyed on
+# code. A code repeated within the chunk keeps its last row. Progress is
+# committed in the same transaction as the upsert.
+def import_chunk(medication_import, start, rows, pool, archive):
+    validated, row_errors = validate_rows(MedicationImportSerializer, rows)
+    row_errors = dict(enumerate(row_errors))
+    stored, image_errors = _store_images(pool, archive, {
+        index: row['image'] for index, row in enumerate(rows)
+        if validated[index] and row.get('image')
+    })
+    row_errors.update(image_errors)
+
+    medications = {}
+    for index, data in enumerate(validated):
+        if data and index not in image_errors:
+            medications[data['code']] = Medication(
+                image=stored.get(index, ''), **data
+            )
+    existing = set(Medication.objects.filter(
+        code__in=list(medications)
+    ).values_list('code', flat=True))
+
+    errors = [
+        {"row": start + index, "errors": errors}
+        for index, errors in row_errors.items() if errors
+    ]
+    with transaction.atomic():
+        for update_fields, batch in (
+            (['name', 'weight', 'image', 'updated_at'],
+             [med for med in medications.values() if med.image]),
+            (['name', 'weight', 'updated_at'],
+             [med for med in medications.values() if not med.image]),
+        ):
+            if batch:
+                Medication.objects.bulk_create(
+                    batch,
+                    update_conflicts=True,
+                    unique_fields=['code'],
+                    update_fields=update_fields,
+                )
+        # Upserts skip signals, so drones carrying a medication whose
+        # weight may have changed are recomputed here
+        if existing:
+            refresh_payloads(Drone.medications.through.objects.filter(
+                medication__code__in=existing
+            ).values('drone_id'))
+        kept = MEDICATION_IMPORT_MAX_ERRORS - len(medication_import.errors)
+        medication_import.errors += errors[:max(kept, 0)]
+        MedicationImport.objects.filter(pk=medication_import.pk).update(
+            processed_rows=start + len(rows),
+            created_count=F('created_count') + len(
+                medications.keys() - existing
+            ),
+            updated_count=F('updated_count') + len(existing),
+            failed_count=F('failed_count') + len(errors),
+            errors=medication_import.errors,
+        )
+
+
+# Run an import from its last committed chunk to the end. Images are
+# decoded and stored on a thread pool while the rows are upserted.
+# progress, if given, is called with the refreshed import after every
+# chunk.
+def run_import(medication_import, progress=None):
+    if medication_import.status == 'COMPLETED':
+        return medication_import
+    medication_import.status = 'RUNNING'
+    medication_import.save(update_fields=['status', 'updated_at'])
+
+    try:
+        with _open_archive(medication_import) as archive, ThreadPoolExecutor(
+            max_workers=settings.MEDICATION_IMPORT_IMAGE_WORKERS
+        ) as pool:
+            for start in range(
+                medication_import.processed_rows,
+                medication_import.total_rows,
+                MEDICATION_IMPORT_CHUNK_SIZE
+            ):
+                import_chunk(
+                    medication_import,
+                    start,
+                    medication_import.rows[
+                        start:start + MEDICATION_IMPORT_CHUNK_SIZE
+                    ],
+                    pool,
+                    archive,
+                )
+                medication_import.refresh_from_db(fields=PROGRESS_FIELDS)
+                if progress:
+                    progress(medication_import)
+    except Exception as e:
+        medication_import.status = 'FAILED'
+        medication_import.message = str(e)[:255]
+        medication_import.save(
+            update_fields=['status', 'message', 'updated_at']
+        )
+        raise
+
+    medication_import.status = 'COMPLETED'
+    medication_import.message = ''
+    medication_import.save(update_fields=['status', 'message', 'updated_at'])
+    return medication_import
+
+
+def import_progress(medication_import):
+    return {
+        "id": medication_import.pk,
+        "status": medication_import.status,
+        "total_rows": medication_import.total_rows,
+        "processed_rows": medication_import.processed_rows,
+        "created": medication_import.created_count,
+        "updated": medication_import.updated_count,
+        "failed": medication_import.failed_count,
+        "errors": medication_import.errors,
+        "message": medication_import.message,
+    }
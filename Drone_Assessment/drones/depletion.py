@@ -0,0 +1,34 @@
+from drones.util import MIN_BATTERY_CAPACITY
+
+# Weight of the newest observation in a drone's discharge rate estimate.
+# Higher values follow changes faster but are noisier.
+DISCHARGE_RATE_SMOOTHING = 0.3
+
+
+# Fold a new battery reading into a drone's discharge rate estimate, in
+# percent per minute, as an exponentially weighted moving average of the
+# rates observed between readings. Each update is O(1): only the last
+# rate, level and time are kept, history is never refitted.
+# Returns the new (rate, sampled level, sampled at) or None when the
+# reading carries no new information.
+def update_discharge_rate(rate, sampled_level, sampled_at, level, now):
+    if sampled_at is None or level > sampled_level:
+        # First reading or the drone was recharged: restart the baseline
+        return rate, level, now
+    minutes = (now - sampled_at).total_seconds() / 60
+    if level == sampled_level or minutes <= 0:
+        return None
+    observed = (sampled_level - level) / minutes
+    return (
+        rate + DISCHARGE_RATE_SMOOTHING * (observed - rate),
+        level,
+        now,
+    )
+
+
+# Predicted minutes until the battery drops to MIN_BATTERY_CAPACITY, or
+# None when the drone is not discharging
+def minutes_to_reserve(level, rate):
+    if rate <= 0:
+        return None
+    return max(level - MIN_BATTERY_CAPACITY, 0) / rate
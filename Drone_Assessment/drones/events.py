@@ -0,0 +1,168 @@
+import asyncio
+import json
+import time
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import Max
+from drones.models import DroneEvent
+
+# Drone fields whose changes are published on the change feed
+EVENT_FIELDS = ('state', 'battery_capacity')
+
+# Events returned per request by default and at most
+DEFAULT_EVENT_LIMIT = 100
+MAX_EVENT_LIMIT = 1000
+# Seconds a long-poll waits for new events by default and at most
+DEFAULT_LONG_POLL_TIMEOUT = 25
+MAX_LONG_POLL_TIMEOUT = 30
+# Seconds between checks of the change marker while waiting
+EVENT_POLL_INTERVAL = 0.25
+# Seconds between keep-alive comments on an idle event stream
+EVENT_STREAM_HEARTBEAT = 15
+# Seconds an event stream stays open. Django does not notice clients that
+# went away, so streams end on their own and live clients reconnect with
+# Last-Event-ID.
+EVENT_STREAM_MAX_AGE = 300
+
+# Bumped after every commit that recorded events, so waiting clients only
+# query the database when something changed
+EVENTS_CHANGED_KEY = 'drones:events:changed'
+
+
+# Query parameters of the change feed: `after` (sequence number, defaults
+# to the latest event), `drone`, `limit` and `timeout` (long-poll only).
+# Returns them as a dict, or None when one is invalid.
+def parse_feed_params(params, last_event_id=None):
+    parsed = {}
+    for name, default, maximum in (
+        ('after', last_event_id, None),
+        ('drone', None, None),
+        ('limit', DEFAULT_EVENT_LIMIT, MAX_EVENT_LIMIT),
+        ('timeout', DEFAULT_LONG_POLL_TIMEOUT, MAX_LONG_POLL_TIMEOUT),
+    ):
+        value = params.get(name, default)
+        if value is not None:
+            if not str(value).isdigit():
+                return None
+            value = int(value)
+            if maximum is not None and value > maximum:
+                return None
+        parsed[name] = value
+    if parsed['limit'] == 0:
+        return None
+    return parsed
+
+
+def latest_sequence():
+    return DroneEvent.objects.aggregate(latest=Max('pk'))['latest'] or 0
+
+
+def _mark_changed():
+    try:
+        cache.incr(EVENTS_CHANGED_KEY)
+    except ValueError:
+        cache.set(EVENTS_CHANGED_KEY, 1, timeout=None)
+
+
+# Record changes of drones' state or battery capacity. Changes are
+# (drone_id, state, battery_capacity, previous_state,
+# previous_battery_capacity) tuples; previous values are None for new
+# drones. Writers that bypass Model.save() call this themselves.
+def record_drone_events(changes):
+    events = DroneEvent.objects.bulk_create([
+        DroneEvent(
+            drone_id=drone_id,
+            state=state,
+            battery_capacity=battery_capacity,
+            previous_state=previous_state or '',
+            previous_battery_capacity=previous_battery_capacity,
+        )
+        for (
+            drone_id, state, battery_capacity,
+            previous_state, previous_battery_capacity
+        ) in changes
+    ])
+    if events:
+        transaction.on_commit(_mark_changed)
+    return events
+
+
+# Events with a sequence number above `after`, oldest first, optionally
+# for one drone only
+def events_after(after, limit=DEFAULT_EVENT_LIMIT, drone_id=None):
+    events = DroneEvent.objects.filter(pk__gt=after).order_by('pk')
+    if drone_id is not None:
+        events = events.filter(drone_id=drone_id)
+    return [
+        {
+            "sequence": event['pk'],
+            "drone": event['drone_id'],
+            "serial_number": event['drone__serial_number'],
+            "state": event['state'],
+            "previous_state": event['previous_state'] or None,
+            "battery_capacity": event['battery_capacity'],
+            "previous_battery_capacity": event['previous_battery_capacity'],
+            "timestamp": event['timestamp'],
+        }
+        for event in events.values(
+            'pk', 'drone_id', 'drone__serial_number', 'state',
+            'previous_state', 'battery_capacity',
+            'previous_battery_capacity', 'timestamp'
+        )[:limit]
+    ]
+
+
+# Long-poll: return the events after `after` as soon as there are any, or
+# an empty list once `timeout` seconds have passed. While waiting only
+# the change marker in the cache is polled; the database is queried again
+# when it moves.
+def wait_for_events(after, timeout, limit=DEFAULT_EVENT_LIMIT,
+                    drone_id=None):
+    deadline = time.monotonic() + timeout
+    while True:
+        marker = cache.get(EVENTS_CHANGED_KEY)
+        events = events_after(after, limit, drone_id)
+        if events or time.monotonic() >= deadline:
+            return events
+        while (
+            cache.get(EVENTS_CHANGED_KEY) == marker
+            and time.monotonic() < deadline
+        ):
+            time.sleep(EVENT_POLL_INTERVAL)
+
+
+def sse_message(event):
+    return (
+        f"id: {event['sequence']}\n"
+        "event: drone\n"
+        f"data: {json.dumps(event, cls=DjangoJSONEncoder)}\n\n"
+    )
+
+
+# Server-sent events stream of the change feed from `after` on, for the
+# ASGI entry point. Each connection waits on the change marker with
+# asyncio instead of holding a worker thread, and the stream ends after
+# max_age seconds.
+async def stream_events(after, drone_id=None, max_age=EVENT_STREAM_MAX_AGE):
+    fetch = sync_to_async(events_after)
+    deadline = time.monotonic() + max_age
+    last_sent = time.monotonic()
+    while time.monotonic() < deadline:
+        marker = await cache.aget(EVENTS_CHANGED_KEY)
+        events = await fetch(after, MAX_EVENT_LIMIT, drone_id)
+        for event in events:
+            yield sse_message(event)
+            after = event['sequence']
+        if events:
+            last_sent = time.monotonic()
+            continue
+        while (
+            await cache.aget(EVENTS_CHANGED_KEY) == marker
+            and time.monotonic() < deadline
+        ):
+            if time.monotonic() - last_sent >= EVENT_STREAM_HEARTBEAT:
+                yield ": keep-alive\n\n"
+                last_sent = time.monotonic()
+            await asyncio.sleep(EVENT_POLL_INTERVAL)
@@ -0,0 +1,75 @@
+import csv
+import json
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Prefetch
+from drones.models import Drone, DroneBatteryHistory, Medication
+
+# Rows fetched from the database per round trip while exporting
+EXPORT_CHUNK_SIZE = 2000
+
+DRONE_EXPORT_FIELDS = (
+    'id', 'serial_number', 'model', 'weight_limit', 'battery_capacity',
+    'state', 'current_medication_weight',
+)
+BATTERY_HISTORY_EXPORT_FIELDS = (
+    'id', 'drone_id', 'battery_level', 'sufficient_battery_capacity',
+    'state', 'timestamp',
+)
+EXPORT_FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+
+# File-like object whose write() returns the line instead of storing it,
+# so csv.writer can produce one row at a time
+class _Echo:
+    def write(self, value):
+        return value
+
+
+# Drones with the codes of their loaded medications, one dict per drone.
+# The queryset is iterated in chunks with the medications of each chunk
+# prefetched, so memory stays flat however big the fleet is.
+def drone_rows(state=None):
+    drones = Drone.objects.order_by('pk').only(*DRONE_EXPORT_FIELDS)
+    if state:
+        drones = drones.filter(state=state)
+    drones = drones.prefetch_related(Prefetch(
+        'medications', queryset=Medication.objects.only('code')
+    ))
+    for drone in drones.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+        row = {field: getattr(drone, field) for field in DRONE_EXPORT_FIELDS}
+        row['medications'] = [
+            medication.code for medication in drone.medications.all()
+        ]
+        yield row
+
+
+# Battery history samples as dicts, read as tuples without building model
+# instances
+def battery_history_rows(state=None, start=None, end=None):
+    history = DroneBatteryHistory.objects.order_by('pk')
+    if state:
+        history = history.filter(state=state)
+    if start:
+        history = history.filter(timestamp__gte=start)
+    if end:
+        history = history.filter(timestamp__lt=end)
+    rows = history.values_list(*BATTERY_HISTORY_EXPORT_FIELDS)
+    for row in rows.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+        yield dict(zip(BATTERY_HISTORY_EXPORT_FIELDS, row))
+
+
+def ndjson_lines(rows):
+    for row in rows:
+        yield json.dumps(row, cls=DjangoJSONEncoder) + '\n'
+
+
+def csv_lines(rows, fieldnames):
+    writer = csv.DictWriter(_Echo(), fieldnames=fieldnames)
+    yield writer.writeheader()
+    for row in rows:
+        if 'medications' in row:
+            row['medications'] = ';'.join(row['medications'])
+        yield writer.writerow(row)
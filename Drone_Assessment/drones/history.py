@@ -0,0 +1,379 @@
+from datetime import timedelta
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Avg, Count, F, Max, Min, OuterRef, Subquery, Sum
+from django.db.models.functions import TruncDay, TruncHour
+from django.utils import timezone
+from drones.models import (
+    Drone,
+    DroneBatteryDaily,
+    DroneEvent,
+    DroneBatteryHistory,
+    DroneBatteryHourly,
+)
+
+# Rollup rows upserted and history rows deleted per query
+ROLLUP_BATCH_SIZE = 1000
+PRUNE_BATCH_SIZE = 5000
+
+# Longest time range served from raw samples and from hourly rollups;
+# longer ranges are served from daily rollups
+RAW_HISTORY_MAX_RANGE = timedelta(days=1)
+HOURLY_HISTORY_MAX_RANGE = timedelta(days=31)
+
+# Points a battery history response is downsampled to by default, and at
+# most
+DEFAULT_HISTORY_POINTS = 500
+MAX_HISTORY_POINTS = 5000
+
+ROLLUP_FIELDS = (
+    'samples', 'min_battery_level', 'avg_battery_level', 'max_battery_level'
+)
+
+
+def battery_sample_cache_key(drone_id):
+    return f'drones:battery:last-sample:{drone_id}'
+
+
+def _sample_state(sample):
+    return (
+        sample.battery_level,
+        sample.state,
+        sample.sufficient_battery_capacity,
+    )
+
+
+# Keep the battery history samples worth recording: those whose battery
+# level, state or battery health differs from the drone's last recorded
+# sample, or whose last sample is older than the heartbeat. The last
+# recorded state of every drone is kept in the cache, so no history rows
+# are read. Drones without a remembered sample are always recorded. Several
+# samples of one drone are compared in order.
+def changed_samples(samples, now):
+    heartbeat = settings.DRONE_BATTERY_HISTORY_HEARTBEAT
+    last_samples = cache.get_many([
+        battery_sample_cache_key(sample.drone_id) for sample in samples
+    ])
+    changed = []
+    for sample in samples:
+        key = battery_sample_cache_key(sample.drone_id)
+        last = last_samples.get(key)
+        if (
+            last is None
+            or tuple(last['state']) != _sample_state(sample)
+            or heartbeat is not None
+            and now.timestamp() - last['recorded_at'] >= heartbeat
+        ):
+            changed.append(sample)
+            last_samples[key] = {
+                "state": _sample_state(sample),
+                "recorded_at": now.timestamp(),
+            }
+    return changed
+
+
+# Remember the samples just recorded as the drones' last known state
+def remember_samples(samples, now):
+    cache.set_many(
+        {
+            battery_sample_cache_key(sample.drone_id): {
+                "state": _sample_state(sample),
+                "recorded_at": now.timestamp(),
+            }
+            for sample in samples
+        },
+        timeout=None
+    )
+
+
+def _upsert_rollups(model, rows):
+    batch, written = [], 0
+    for row in rows:
+        batch.append(model(**row))
+        if len(batch) == ROLLUP_BATCH_SIZE:
+            written += _write_rollups(model, batch)
+            batch = []
+    return written + _write_rollups(model, batch)
+
+
+def _write_rollups(model, batch):
+    model.objects.bulk_create(
+        batch,
+        update_conflicts=True,
+        unique_fields=['drone', 'bucket'],
+        update_fields=ROLLUP_FIELDS,
+    )
+    return len(batch)
+
+
+def _rollup_start(model, source, field):
+    # Re-roll the latest bucket in case samples arrived after it was rolled
+    latest = model.objects.aggregate(latest=Max('bucket'))['latest']
+    if latest is not None:
+        return latest
+    return source.objects.aggregate(first=Min(field))['first']
+
+
+def _hour(moment):
+    return moment.replace(minute=0, second=0, microsecond=0)
+
+
+def _day(moment):
+    return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _new_bucket(drone_id, hour):
+    return {
+        "drone_id": drone_id,
+        "bucket": hour,
+        "samples": 0,
+        "min_battery_level": None,
+        "max_battery_level": None,
+        "level_seconds": 0,
+        "seconds": 0,
+    }
+
+
+# Count the drone as holding `level` from `since` until `until` in the
+# bucket's average, min and max
+def _hold(bucket, level, since, until):
+    seconds = (until - since).total_seconds()
+    bucket['level_seconds'] += level * seconds
+    bucket['seconds'] += seconds
+    low, high = bucket['min_battery_level'], bucket['max_battery_level']
+    bucket['min_battery_level'] = level if low is None else min(low, level)
+    bucket['max_battery_level'] = level if high is None else max(high, level)
+
+
+# Hold the drone's last level until the end of the hour and return the
+# bucket as an hourly rollup row
+def _close_bucket(bucket, last):
+    _hold(bucket, *last, bucket['bucket'] + timedelta(hours=1))
+    level_seconds, seconds = bucket.pop('level_seconds'), bucket.pop('seconds')
+    bucket['avg_battery_level'] = level_seconds / seconds
+    return bucket
+
+
+# Hourly rollups of the samples in [start, end) recorded in 'delta' mode.
+# A delta sample stands for the drone's level until its next sample, so
+# each hour's average weights every level by how long it held within the
+# hour, starting from the level carried in from the drone's previous
+# sample. An hour's min and max include the carried-in level.
+def _duration_weighted_hourly(start, end):
+    samples = DroneBatteryHistory.objects.filter(
+        timestamp__gte=start, timestamp__lt=end
+    )
+    carried = dict(Drone.objects.filter(
+        pk__in=samples.values('drone_id')
+    ).annotate(
+        carried_level=Subquery(DroneBatteryHistory.objects.filter(
+            drone=OuterRef('pk'), timestamp__lt=start
+        ).order_by('-timestamp').values('battery_level')[:1])
+    ).filter(
+        carried_level__isnull=False
+    ).values_list('pk', 'carried_level'))
+
+    bucket = previous = None
+    for drone_id, timestamp, level in samples.order_by(
+        'drone_id', 'timestamp'
+    ).values_list('drone_id', 'timestamp', 'battery_level').iterator():
+        hour = _hour(timestamp)
+        if bucket is None or bucket['drone_id'] != drone_id:
+            if bucket is not None:
+                yield _close_bucket(bucket, previous)
+            bucket = _new_bucket(drone_id, hour)
+            previous = (
+                (carried[drone_id], hour) if drone_id in carried else None
+            )
+        elif bucket['bucket'] != hour:
+            yield _close_bucket(bucket, previous)
+            bucket = _new_bucket(drone_id, hour)
+            previous = (previous[0], hour)
+        if previous is not None:
+            _hold(bucket, *previous, timestamp)
+        _hold(bucket, level, timestamp, timestamp)
+        bucket['samples'] += 1
+        previous = (level, timestamp)
+    if bucket is not None:
+        yield _close_bucket(bucket, previous)
+
+
+# Compact raw samples of every complete hour into hourly min/avg/max
+# aggregates per drone. Samples recorded in 'full' mode are evenly spaced,
+# so their plain mean is the hour's average; 'delta' samples are weighted
+# by duration. Returns the number of hourly rows written.
+def rollup_hourly(now=None):
+    end = _hour(now or timezone.now())
+    start = _rollup_start(DroneBatteryHourly, DroneBatteryHistory, 'timestamp')
+    if start is None:
+        return 0
+    if settings.DRONE_BATTERY_HISTORY_MODE == 'delta':
+        return _upsert_rollups(
+            DroneBatteryHourly, _duration_weighted_hourly(_hour(start), end)
+        )
+    rows = DroneBatteryHistory.objects.filter(
+        timestamp__gte=_hour(start), timestamp__lt=end
+    ).values(
+        'drone_id', bucket=TruncHour('timestamp')
+    ).annotate(
+        samples=Count('id'),
+        min_battery_level=Min('battery_level'),
+        avg_battery_level=Avg('battery_level'),
+        max_battery_level=Max('battery_level'),
+    ).order_by()
+    return _upsert_rollups(DroneBatteryHourly, rows.iterator())
+
+
+# Compact hourly rollups of every complete day into daily aggregates per
+# drone. In 'full' mode hourly averages are weighted by their sample
+# counts; 'delta' hourly averages are already weighted by duration, so
+# each hour counts the same however many changes it recorded. Returns the
+# number of daily rows written.
+def rollup_daily(now=None):
+    end = _day(now or timezone.now())
+    start = _rollup_start(DroneBatteryDaily, DroneBatteryHourly, 'bucket')
+    if start is None:
+        return 0
+    if settings.DRONE_BATTERY_HISTORY_MODE == 'delta':
+        level_sum, weight = Sum('avg_battery_level'), Count('pk')
+    else:
+        level_sum = Sum(F('avg_battery_level') * F('samples'))
+        weight = Sum('samples')
+    rows = DroneBatteryHourly.objects.filter(
+        bucket__gte=_day(start), bucket__lt=end
+    ).values(
+        'drone_id', day=TruncDay('bucket')
+    ).annotate(
+        total_samples=Sum('samples'),
+        min_level=Min('min_battery_level'),
+        max_level=Max('max_battery_level'),
+        level_sum=level_sum,
+        weight=weight,
+    ).order_by()
+    return _upsert_rollups(DroneBatteryDaily, (
+        {
+            "drone_id": row['drone_id'],
+            "bucket": row['day'],
+            "samples": row['total_samples'],
+            "min_battery_level": row['min_level'],
+            "avg_battery_level": row['level_sum'] / row['weight'],
+            "max_battery_level": row['max_level'],
+        }
+        for row in rows.iterator()
+    ))
+
+
+# Delete rows older than the cutoff a batch at a time, so no single
+# DELETE holds locks over millions of rows. Returns the rows deleted.
+def prune(queryset, batch_size=PRUNE_BATCH_SIZE):
+    deleted = 0
+    while True:
+        pks = list(queryset.values_list('pk', flat=True)[:batch_size])
+        if not pks:
+            return deleted
+        deleted += queryset.model.objects.filter(pk__in=pks).delete()[0]
+
+
+# Prune raw samples, hourly rollups and change feed events past their
+# retention periods. Raw samples are only pruned once their hour has been
+# rolled up.
+def apply_retention(now=None):
+    now = now or timezone.now()
+    rolled_up_to = DroneBatteryHourly.objects.aggregate(
+        latest=Max('bucket')
+    )['latest']
+    raw_cutoff = now - timedelta(
+        days=settings.DRONE_BATTERY_HISTORY_RETENTION_DAYS
+    )
+    if rolled_up_to is None:
+        raw_deleted = 0
+    else:
+        raw_deleted = prune(DroneBatteryHistory.objects.filter(
+            timestamp__lt=min(raw_cutoff, rolled_up_to)
+        ))
+    hourly_deleted = prune(DroneBatteryHourly.objects.filter(
+        bucket__lt=now - timedelta(
+            days=settings.DRONE_BATTERY_HOURLY_RETENTION_DAYS
+        )
+    ))
+    events_deleted = prune(DroneEvent.objects.filter(
+        timestamp__lt=now - timedelta(days=settings.DRONE_EVENT_RETENTION_DAYS)
+    ))
+    return {
+        "raw": raw_deleted,
+        "hourly": hourly_deleted,
+        "events": events_deleted,
+    }
+
+
+# The finest resolution that covers the range: raw samples for short
+# recent ranges, then hourly and daily rollups. Hourly and daily rollups
+# lag behind raw samples by up to an hour and a day respectively.
+def pick_resolution(start, end, now=None):
+    raw_cutoff = (now or timezone.now()) - timedelta(
+        days=settings.DRONE_BATTERY_HISTORY_RETENTION_DAYS
+    )
+    if end - start <= RAW_HISTORY_MAX_RANGE and start >= raw_cutoff:
+        return 'raw'
+    if end - start <= HOURLY_HISTORY_MAX_RANGE:
+        return 'hour'
+    return 'day'
+
+
+def _raw_rows(drone_id, start, end):
+    rows = DroneBatteryHistory.objects.filter(
+        drone_id=drone_id, timestamp__gte=start, timestamp__lt=end
+    ).order_by('timestamp').values_list('timestamp', 'battery_level')
+    for timestamp, level in rows.iterator():
+        yield timestamp, level, level, level
+
+
+def _rollup_rows(model, drone_id, start, end):
+    return model.objects.filter(
+        drone_id=drone_id, bucket__gte=start, bucket__lt=end
+    ).order_by('bucket').values_list(
+        'bucket', 'min_battery_level', 'avg_battery_level',
+        'max_battery_level'
+    ).iterator()
+
+
+# Battery history of a drone in [start, end) as (timestamp, min, avg, max)
+# tuples in time order, read from the raw samples or the rollup table
+# matching the resolution. Returns the resolution and the rows.
+def query_battery_history(drone_id, start, end, resolution=None):
+    resolution = resolution or pick_resolution(start, end)
+    if resolution == 'raw':
+        return resolution, _raw_rows(drone_id, start, end)
+    model = DroneBatteryHourly if resolution == 'hour' else DroneBatteryDaily
+    return resolution, _rollup_rows(model, drone_id, start, end)
+
+
+# Downsample time-ordered (timestamp, min, avg, max) rows in [start, end)
+# to at most `points` equal-width time buckets in a single pass. Each
+# bucket keeps the min and max of its rows, so short dips survive, and the
+# mean of their averages.
+def downsample(rows, start, end, points):
+    width = (end - start) / points
+    bucket = current = None
+    for timestamp, low, mean, high in rows:
+        index = int((timestamp - start) / width)
+        if index != bucket:
+            if current is not None:
+                yield _bucket_point(start + width * bucket, current)
+            bucket, current = index, [low, 0, 0, high]
+        current[0] = min(current[0], low)
+        current[1] += mean
+        current[2] += 1
+        current[3] = max(current[3], high)
+    if current is not None:
+        yield _bucket_point(start + width * bucket, current)
+
+
+def _bucket_point(timestamp, bucket):
+    low, total, count, high = bucket
+    return {
+        "timestamp": timestamp,
+        "min": low,
+        "avg": total / count,
+        "max": high,
+    }
@@ -0,0 +1,75 @@
+import hashlib
+import io
+import os
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from PIL import Image
+
+# Formats every thumbnail size is rendered in, by file extension
+THUMBNAIL_FORMATS = {'webp': 'WEBP', 'jpeg': 'JPEG'}
+THUMBNAIL_QUALITY = 80
+THUMBNAIL_DIRECTORY = 'medication_thumbnails'
+
+
+def content_hash(content):
+    digest = hashlib.sha256()
+    content.seek(0)
+    for chunk in iter(lambda: content.read(64 * 1024), b''):
+        digest.update(chunk)
+    content.seek(0)
+    return digest.hexdigest()
+
+
+# Storage that names files after the SHA-256 of their content, so the same
+# image uploaded twice is stored once. Files are fanned out over
+# subdirectories named after the first two hex digits of the hash.
+class ContentAddressedStorage(FileSystemStorage):
+    def save(self, name, content, max_length=None):
+        digest = content_hash(content)
+        directory, filename = os.path.split(name)
+        name = os.path.join(
+            directory,
+            digest[:2],
+            digest + os.path.splitext(filename)[1].lower()
+        )
+        if self.exists(name):
+            return name
+        return super().save(name, content, max_length)
+
+
+medication_image_storage = ContentAddressedStorage()
+
+
+# Storage of Medication.image, referenced by the field so migrations do
+# not serialize the storage instance
+def get_medication_image_storage():
+    return medication_image_storage
+
+
+# Render the thumbnails of a stored image, one per size in
+# MEDICATION_THUMBNAIL_SIZES and format in THUMBNAIL_FORMATS. Returns the
+# thumbnails as {"source": name, "sizes": {size: {extension: name}}}.
+def make_thumbnails(name, storage=medication_image_storage):
+    with storage.open(name, 'rb') as source:
+        image = Image.open(source)
+        image.load()
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'A' in image.getbands() else 'RGB')
+
+    sizes = {}
+    for size in settings.MEDICATION_THUMBNAIL_SIZES:
+        thumbnail = image.copy()
+        thumbnail.thumbnail((size, size))
+        sizes[str(size)] = {}
+        for extension, image_format in THUMBNAIL_FORMATS.items():
+            rendered = thumbnail
+            if image_format == 'JPEG' and rendered.mode != 'RGB':
+                rendered = rendered.convert('RGB')
+            output = io.BytesIO()
+            rendered.save(output, image_format, quality=THUMBNAIL_QUALITY)
+            sizes[str(size)][extension] = storage.save(
+                f'{THUMBNAIL_DIRECTORY}/{size}.{extension}',
+                ContentFile(output.getvalue())
+            )
+    return {"source": name, "sizes": sizes}
@@ -0,0 +1,197 @@
+from django.db import connection, transaction
+from django.db.models import F
+from django.shortcuts import get_object_or_404
+from django.utils import timezone
+from drones.cache import invalidate_drones
+from drones.events import record_drone_events
+from drones.models import Drone, Medication
+from drones.packing import solve_knapsack
+from drones.states import LOADABLE_STATES
+from drones.util import healthy_battery, within_weight_limit
+
+
+# Reasons a requested medication is not loaded on a drone
+INVALID_ID = 'invalid_id'
+NOT_FOUND = 'not_found'
+DUPLICATE = 'duplicate'
+ALREADY_LOADED = 'already_loaded'
+OVER_WEIGHT_LIMIT = 'over_weight_limit'
+
+# Objectives the optimal packing mode can maximize
+PACKING_OBJECTIVES = ('priority', 'weight')
+
+# How many times a load is retried when another dispatcher changed the
+# drone between our read and our write
+MAX_RESERVATION_ATTEMPTS = 3
+
+
+class ReservationConflict(Exception):
+    pass
+
+
+def _valid_id(med_id):
+    return isinstance(med_id, int) and not isinstance(med_id, bool)
+
+
+def _valid_priority(priority):
+    return (
+        isinstance(priority, (int, float))
+        and not isinstance(priority, bool)
+        and priority > 0
+    )
+
+
+def _rejection(med_id, reason):
+    return {"medication": med_id, "reason": reason}
+
+
+# Requested medications are either plain IDs or {"id", "priority"} objects.
+# Returns the IDs in request order and the priority of each valid ID.
+def parse_requested_medications(medication_data):
+    medication_ids, priorities = [], {}
+    for item in medication_data:
+        if isinstance(item, dict):
+            med_id = item.get('id')
+            priority = item.get('priority', 1)
+            if not _valid_priority(priority):
+                med_id = item
+        else:
+            med_id, priority = item, 1
+        medication_ids.append(med_id)
+        if _valid_id(med_id):
+            priorities.setdefault(med_id, priority)
+    return medication_ids, priorities
+
+
+# Decide which of the requested medications fit on the drone.
+# All requested medications are fetched with one query and the drone's
+# current payload, when medication_count says it has one, with another;
+# everything else is decided in memory.
+# By default medications are taken greedily in request order. With a
+# packing objective ('priority' or 'weight') the subset that maximizes it
+# within the drone's remaining capacity is picked instead.
+# Returns the accepted medications and the rejected requests.
+def plan_load(drone, medication_ids, packing=None, priorities=None):
+    medications = Medication.objects.in_bulk(
+        [med_id for med_id in medication_ids if _valid_id(med_id)]
+    )
+    loaded_ids = set()
+    if drone.medication_count:
+        loaded_ids = set(drone.medications.values_list('pk', flat=True))
+
+    candidates, rejected = [], []
+    seen = set()
+    for med_id in medication_ids:
+        if not _valid_id(med_id):
+            rejected.append(_rejection(med_id, INVALID_ID))
+            continue
+        if med_id in seen:
+            rejected.append(_rejection(med_id, DUPLICATE))
+        elif med_id not in medications:
+            rejected.append(_rejection(med_id, NOT_FOUND))
+        elif med_id in loaded_ids:
+            rejected.append(_rejection(med_id, ALREADY_LOADED))
+        else:
+            candidates.append(medications[med_id])
+        seen.add(med_id)
+
+    if packing in PACKING_OBJECTIVES:
+        priorities = priorities or {}
+        chosen, _ = solve_knapsack(
+            [
+                (
+                    medication.pk,
+                    medication.weight,
+                    medication.weight if packing == 'weight'
+                    else priorities.get(medication.pk, 1)
+                )
+                for medication in candidates
+            ],
+            drone.weight_limit - drone.current_medication_weight
+        )
+        chosen = set(chosen)
+        accepted = [med for med in candidates if med.pk in chosen]
+    else:
+        accepted, load_weight = [], 0
+        for medication in candidates:
+            if within_weight_limit(drone, load_weight + medication.weight):
+                accepted.append(medication)
+                load_weight += medication.weight
+
+    accepted_ids = {medication.pk for medication in accepted}
+    rejected.extend(
+        _rejection(medication.pk, OVER_WEIGHT_LIMIT)
+        for medication in candidates
+        if medication.pk not in accepted_ids
+    )
+    return accepted, rejected
+
+
+def _reservable_drones():
+    drones = Drone.objects.all()
+    if connection.features.has_select_for_update:
+        drones = drones.select_for_update()
+    return drones
+
+
+# Reserve an IDLE or LOADING drone and load the accepted medications in one
+# transaction. The drone row is locked on databases that support
+# select_for_update; everywhere else the write is a compare-and-swap on
+# the drone's version, retried a bounded number of times.
+def reserve_and_load(drone_id, medication_ids, packing=None,
+                     priorities=None, attempts=MAX_RESERVATION_ATTEMPTS):
+    for _ in range(attempts):
+        with transaction.atomic():
+            drone = get_object_or_404(
+                _reservable_drones(), pk=drone_id,
+                state__in=LOADABLE_STATES
+            )
+            if not (
+                healthy_battery(drone) and
+                drone.current_medication_weight <= drone.weight_limit
+            ):
+                return drone, [], []
+
+            accepted, rejected = plan_load(
+                drone, medication_ids, packing, priorities
+            )
+            if not accepted:
+                return drone, accepted, rejected
+
+            load_weight = sum(medication.weight for medication in accepted)
+            reserved = Drone.objects.filter(
+                pk=drone.pk, state=drone.state, version=drone.version
+            ).update(
+                current_medication_weight=(
+                    F('current_medication_weight') + load_weight
+                ),
+                medication_count=F('medication_count') + len(accepted),
+                state='LOADED',
+                version=F('version') + 1,
+                updated_at=timezone.now(),
+            )
+            if reserved:
+                # Written through the join table, since the payload
+                # columns were already updated above
+                Drone.medications.through.objects.bulk_create([
+                    Drone.medications.through(
+                        drone_id=drone.pk, medication=medication
+                    )
+                    for medication in accepted
+                ])
+                record_drone_events([(
+                    drone.pk, 'LOADED', drone.battery_capacity,
+                    drone.state, drone.battery_capacity
+                )])
+                transaction.on_commit(
+                    lambda: invalidate_drones([drone.pk])
+                )
+                drone.current_medication_weight += load_weight
+                drone.medication_count += len(accepted)
+                drone.state = 'LOADED'
+                drone.version += 1
+                return drone, accepted, rejected
+
+    raise ReservationConflict(
+        f"Drone {drone_id} was modified concurrently, try again"
+    )
@@ -0,0 +1,88 @@
+import json
+import os
+from django.core.files import File
+from django.core.management.base import BaseCommand, CommandError
+from drones.bulk import csv_rows
+from drones.catalog import create_import, run_import
+from drones.models import MedicationImport
+from drones.tasks import (
+    generate_medication_thumbnails,
+    import_medication_catalog,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Import a medication catalog from a CSV or JSON file, upserting "
+        "medications on code"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'catalog', nargs='?',
+            help="CSV file with a header row, or a JSON array of medications"
+        )
+        parser.add_argument(
+            '--images',
+            help="Zip archive of the images named in the image column"
+        )
+        parser.add_argument(
+            '--resume', type=int, metavar='IMPORT_ID',
+            help="Resume an interrupted import from its last committed chunk"
+        )
+        parser.add_argument(
+            '--background', action='store_true',
+            help="Queue the import on Celery instead of running it here"
+        )
+
+    def handle(self, *args, **options):
+        if options['resume']:
+            try:
+                medication_import = MedicationImport.objects.get(
+                    pk=options['resume']
+                )
+            except MedicationImport.DoesNotExist:
+                raise CommandError(f"Import {options['resume']} not found")
+        elif options['catalog']:
+            medication_import = self.create(
+                options['catalog'], options['images']
+            )
+        else:
+            raise CommandError("Give a catalog file or --resume IMPORT_ID")
+
+        if options['background']:
+            import_medication_catalog.delay(medication_import.pk)
+            self.stdout.write(f"Queued import {medication_import.pk}")
+            return
+
+        medication_import = run_import(medication_import, self.progress)
+        generate_medication_thumbnails.delay()
+        self.stdout.write(self.style.SUCCESS(
+            f"Import {medication_import.pk} completed: "
+            f"{medication_import.created_count} created, "
+            f"{medication_import.updated_count} updated, "
+            f"{medication_import.failed_count} failed"
+        ))
+
+    def create(self, catalog, images):
+        try:
+            with open(catalog, 'rb') as catalog_file:
+                if catalog.endswith('.json'):
+                    rows = json.load(catalog_file)
+                else:
+                    rows = csv_rows(catalog_file)
+            if not images:
+                return create_import(rows)
+            with open(images, 'rb') as images_file:
+                return create_import(rows, File(
+                    images_file, name=os.path.basename(images)
+                ))
+        except (OSError, ValueError) as e:
+            raise CommandError(str(e))
+
+    def progress(self, medication_import):
+        self.stdout.write(
+            f"Import {medication_import.pk}: "
+            f"{medication_import.processed_rows}/"
+            f"{medication_import.total_rows} rows"
+        )
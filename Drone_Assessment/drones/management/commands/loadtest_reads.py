@@ -0,0 +1,161 @@
+import asyncio
+import ssl
+import time
+from urllib.parse import urlsplit
+from django.core.management.base import BaseCommand, CommandError
+
+# Read endpoints of each path, by name: the sync views served over WSGI
+# and their async versions served over ASGI
+READ_ENDPOINTS = (
+    ('battery-level', '/drone/{drone}/battery-level/',
+     '/async/drone/{drone}/battery-level/'),
+    ('loaded-medication', '/drone/{drone}/medication/loaded/',
+     '/async/drone/{drone}/medication/loaded/'),
+    ('available-drones', '/drones/available/', '/async/drones/available/'),
+    ('all-drones', '/drones/', '/async/drones/'),
+)
+
+
+# Send one GET over a fresh connection and read the whole response.
+# Returns the status code and the seconds it took.
+async def fetch(url, timeout):
+    parts = urlsplit(url)
+    secure = parts.scheme == 'https'
+    started = time.monotonic()
+    reader, writer = await asyncio.wait_for(
+        asyncio.open_connection(
+            parts.hostname,
+            parts.port or (443 if secure else 80),
+            ssl=ssl.create_default_context() if secure else None
+        ),
+        timeout
+    )
+    try:
+        path = parts.path or '/'
+        if parts.query:
+            path += '?' + parts.query
+        writer.write((
+            f"GET {path} HTTP/1.1\r\n"
+            f"Host: {parts.netloc}\r\n"
+            "Accept: application/json\r\n"
+            "Connection: close\r\n\r\n"
+        ).encode())
+        await writer.drain()
+        response = await asyncio.wait_for(reader.read(), timeout)
+    finally:
+        writer.close()
+    status = int(response.split(b' ', 2)[1]) if response else 0
+    return status, time.monotonic() - started
+
+
+# Request url `requests` times with `concurrency` connections open at once.
+# Returns the latencies of successful requests, the failure count and the
+# wall-clock seconds.
+async def run_load(url, requests, concurrency, timeout):
+    remaining = iter(range(requests))
+    latencies, failures = [], 0
+
+    async def client():
+        nonlocal failures
+        for _ in remaining:
+            try:
+                status, latency = await fetch(url, timeout)
+            except (OSError, asyncio.TimeoutError, ValueError, IndexError):
+                status, latency = 0, None
+            if status == 200:
+                latencies.append(latency)
+            else:
+                failures += 1
+
+    started = time.monotonic()
+    await asyncio.gather(*[client() for _ in range(concurrency)])
+    return latencies, failures, time.monotonic() - started
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+def summarize(latencies, failures, duration):
+    def ms(value):
+        return round(value * 1000, 1) if value is not None else None
+
+    return {
+        "requests_per_second": round(
+            len(latencies) / duration, 1
+        ) if duration else 0,
+        "p50_ms": ms(percentile(latencies, 0.5)),
+        "p95_ms": ms(percentile(latencies, 0.95)),
+        "p99_ms": ms(percentile(latencies, 0.99)),
+        "failures": failures,
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Load-test the read endpoints on the WSGI path against their async "
+        "versions on the ASGI path, e.g. with `manage.py runserver` or "
+        "gunicorn on one port and `uvicorn Drone_Assessment.asgi:application`"
+        " on another"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--wsgi', default='http://127.0.0.1:8000',
+            help="Base URL of the WSGI server"
+        )
+        parser.add_argument(
+            '--asgi', default='http://127.0.0.1:8001',
+            help="Base URL of the ASGI server"
+        )
+        parser.add_argument(
+            '--drone', type=int, default=1,
+            help="Drone whose battery level and medications are read"
+        )
+        parser.add_argument(
+            '--endpoint', action='append',
+            choices=[name for name, _, _ in READ_ENDPOINTS],
+            help="Endpoint to test, repeatable; all of them by default"
+        )
+        parser.add_argument('--requests', type=int, default=1000)
+        parser.add_argument(
+            '--concurrency', type=int, default=100,
+            help="Connections kept open at once"
+        )
+        parser.add_argument(
+            '--timeout', type=float, default=30,
+            help="Seconds before a request counts as failed"
+        )
+
+    def handle(self, *args, **options):
+        if options['requests'] < 1 or options['concurrency'] < 1:
+            raise CommandError("--requests and --concurrency must be positive")
+
+        self.stdout.write(
+            f"{'endpoint':<20}{'path':<6}{'req/s':>10}{'p50 ms':>10}"
+            f"{'p95 ms':>10}{'p99 ms':>10}{'failed':>8}"
+        )
+        for name, wsgi_path, asgi_path in READ_ENDPOINTS:
+            if options['endpoint'] and name not in options['endpoint']:
+                continue
+            for server, base, path in (
+                ('wsgi', options['wsgi'], wsgi_path),
+                ('asgi', options['asgi'], asgi_path),
+            ):
+                result = summarize(*asyncio.run(run_load(
+                    base.rstrip('/') + path.format(drone=options['drone']),
+                    options['requests'],
+                    options['concurrency'],
+                    options['timeout'],
+                )))
+                self.stdout.write(
+                    f"{name:<20}{server:<6}"
+                    f"{result['requests_per_second']:>10}"
+                    f"{str(result['p50_ms']):>10}"
+                    f"{str(result['p95_ms']):>10}"
+                    f"{str(result['p99_ms']):>10}"
+                    f"{result['failures']:>8}"
+                )
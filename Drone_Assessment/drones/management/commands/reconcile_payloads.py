@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+from drones.payload import reconcile_payloads
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute every drone's loaded weight and medication count from "
+        "its medications and fix the drones that drifted"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help="Report drifted drones without fixing them"
+        )
+
+    def handle(self, *args, **options):
+        drifted = reconcile_payloads(dry_run=options['dry_run'])
+        for drone in drifted:
+            self.stdout.write(
+                f"{drone.serial_number}: weight "
+                f"{drone.current_medication_weight} -> {drone.loaded_weight}, "
+                f"medications {drone.medication_count} -> {drone.loaded_count}"
+            )
+        verb = "found" if options['dry_run'] else "fixed"
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(drifted)} drifted drone(s) {verb}"
+        ))
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.9 on 2026-10-18 10:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('drones', '0006_dronebatteryhistory_sufficient_battery_capacity'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='drone',
+            name='version',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.9 on 2026-10-18 10:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('drones', '0007_drone_version'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='drone',
+            index=models.Index(fields=['state', 'battery_capacity'], name='drone_state_battery_idx'),
+        ),
+    ]
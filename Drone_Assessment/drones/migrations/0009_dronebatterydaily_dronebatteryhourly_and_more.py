@@ -0,0 +1,68 @@
+# Generated by Django 4.2.9 on 2026-10-18 10:47
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('drones', '0008_drone_drone_state_battery_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DroneBatteryDaily',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket', models.DateTimeField()),
+                ('samples', models.PositiveIntegerField()),
+                ('min_battery_level', models.IntegerField()),
+                ('avg_battery_level', models.FloatField()),
+                ('max_battery_level', models.IntegerField()),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='DroneBatteryHourly',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket', models.DateTimeField()),
+                ('samples', models.PositiveIntegerField()),
+                ('min_battery_level', models.IntegerField()),
+                ('avg_battery_level', models.FloatField()),
+                ('max_battery_level', models.IntegerField()),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.AddIndex(
+            model_name='dronebatteryhistory',
+            index=models.Index(fields=['drone', 'timestamp'], name='battery_history_drone_ts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='dronebatteryhistory',
+            index=models.Index(fields=['timestamp'], name='battery_history_ts_idx'),
+        ),
+        migrations.AddField(
+            model_name='dronebatteryhourly',
+            name='drone',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='drones.drone'),
+        ),
+        migrations.AddField(
+            model_name='dronebatterydaily',
+            name='drone',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='drones.drone'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='dronebatteryhourly',
+            unique_together={('drone', 'bucket')},
+        ),
+        migrations.AlterUniqueTogether(
+            name='dronebatterydaily',
+            unique_together={('drone', 'bucket')},
+        ),
+    ]
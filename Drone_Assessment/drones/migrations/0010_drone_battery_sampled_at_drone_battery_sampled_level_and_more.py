@@ -0,0 +1,28 @@
+# Generated by Django 4.2.9 on 2026-10-18 10:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('drones', '0009_dronebatterydaily_dronebatteryhourly_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='drone',
+            name='battery_sampled_at',
+            field=models.DateTimeField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='drone',
+            name='battery_sampled_level',
+            field=models.IntegerField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='drone',
+            name='discharge_rate',
+            field=models.FloatField(default=0, editable=False),
+        ),
+    ]
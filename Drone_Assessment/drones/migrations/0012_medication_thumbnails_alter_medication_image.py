@@ -0,0 +1,24 @@
+# Generated by Django 4.2.9 on 2026-10-18 10:55
+
+from django.db import migrations, models
+import drones.images
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('drones', '0011_medicationimport'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='medication',
+            name='thumbnails',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+        migrations.AlterField(
+            model_name='medication',
+            name='image',
+            field=models.ImageField(blank=True, storage=drones.images.get_medication_image_storage, upload_to='medication_images'),
+        ),
+    ]
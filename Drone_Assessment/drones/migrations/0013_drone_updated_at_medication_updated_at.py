@@ -0,0 +1,23 @@
+# Generated by Django 4.2.9 on 2026-10-18 10:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('drones', '0012_medication_thumbnails_alter_medication_image'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='drone',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+        migrations.AddField(
+            model_name='medication',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+    ]
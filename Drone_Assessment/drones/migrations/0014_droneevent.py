@@ -0,0 +1,29 @@
+# Generated by Django 4.2.9 on 2026-10-18 10:59
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('drones', '0013_drone_updated_at_medication_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DroneEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('state', models.CharField(max_length=10)),
+                ('previous_state', models.CharField(blank=True, max_length=10)),
+                ('battery_capacity', models.IntegerField()),
+                ('previous_battery_capacity', models.IntegerField(null=True)),
+                ('timestamp', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('drone', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='drones.drone')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['drone', 'id'], name='drone_event_drone_seq_idx')],
+            },
+        ),
+    ]
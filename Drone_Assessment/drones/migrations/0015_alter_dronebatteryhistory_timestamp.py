@@ -0,0 +1,19 @@
+# Generated by Django 4.2.9 on 2026-10-18 11:03
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('drones', '0014_droneevent'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='dronebatteryhistory',
+            name='timestamp',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.9 on 2026-10-18 11:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('drones', '0015_alter_dronebatteryhistory_timestamp'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='drone',
+            index=models.Index(fields=['state', 'id'], name='drone_state_id_idx'),
+        ),
+    ]
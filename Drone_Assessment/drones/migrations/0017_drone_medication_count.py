@@ -0,0 +1,43 @@
+# Generated by Django 4.2.9 on 2026-10-18 11:13
+
+from django.db import migrations, models
+from django.db.models import Count, FloatField, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def recompute_payloads(apps, schema_editor):
+    Drone = apps.get_model('drones', 'Drone')
+    drones = list(Drone.objects.annotate(
+        loaded_weight=Coalesce(
+            Sum('medications__weight'), Value(0), output_field=FloatField()
+        ),
+        loaded_count=Count('medications'),
+    ).only('pk'))
+    for drone in drones:
+        drone.current_medication_weight = drone.loaded_weight
+        drone.medication_count = drone.loaded_count
+    Drone.objects.bulk_update(
+        drones, ['current_medication_weight', 'medication_count'],
+        batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('drones', '0016_drone_drone_state_id_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='drone',
+            name='medication_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AlterField(
+            model_name='drone',
+            name='current_medication_weight',
+            field=models.FloatField(default=0, editable=False),
+        ),
+        migrations.RunPython(recompute_payloads, migrations.RunPython.noop),
+    ]
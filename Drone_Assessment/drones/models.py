@@ -1,5 +1,7 @@
 from django.db import models
 from django.core.validators import RegexValidator
+from django.utils import timezone
+from drones.images import get_medication_image_storage
 
 
 class Drone(models.Model):
@@ -36,12 +38,56 @@ class Drone(models.Model):
     medications = models.ManyToManyField(
         'Medication', related_name='drones', blank=True
     )
-    current_medication_weight = models.FloatField(default=0, blank=True)
+    # Total weight and number of the loaded medications, maintained by
+    # every writer of the medications relation, see drones.payload
+    current_medication_weight = models.FloatField(default=0, editable=False)
+    medication_count = models.PositiveIntegerField(default=0, editable=False)
+    version = models.PositiveIntegerField(default=0, editable=False)
+    # Discharge model maintained by the battery sweep, see drones.depletion
+    discharge_rate = models.FloatField(default=0, editable=False)
+    battery_sampled_level = models.IntegerField(null=True, editable=False)
+    battery_sampled_at = models.DateTimeField(null=True, editable=False)
+    # Bumped by every write, including queryset updates, and used to
+    # answer conditional GETs
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['state', 'battery_capacity'],
+                name='drone_state_battery_idx'
+            ),
+            # Drones in a state in primary key order, for state-filtered
+            # pages and transition waves
+            models.Index(fields=['state', 'id'], name='drone_state_id_idx'),
+        ]
 
     def __repr__(self):
         return f"Drone: {self.serial_number}, {self.model}"
 
 
+# A change to a drone's state or battery capacity. The primary key is the
+# sequence number of the change feed, see drones.events.
+class DroneEvent(models.Model):
+    drone = models.ForeignKey(Drone, on_delete=models.CASCADE)
+    state = models.CharField(max_length=10)
+    previous_state = models.CharField(max_length=10, blank=True)
+    battery_capacity = models.IntegerField()
+    previous_battery_capacity = models.IntegerField(null=True)
+    timestamp = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['drone', 'id'],
+                name='drone_event_drone_seq_idx'
+            ),
+        ]
+
+    def __repr__(self):
+        return f"DroneEvent: {self.pk}, {self.drone_id}, {self.state}"
+
+
 class Medication(models.Model):
     name = models.CharField(
         max_length=100,
@@ -65,18 +111,70 @@ class Medication(models.Model):
         ],
         unique=True
     )
-    image = models.ImageField(upload_to='medication_images', blank=True)
+    image = models.ImageField(
+        upload_to='medication_images',
+        storage=get_medication_image_storage,
+        blank=True
+    )
+    # Thumbnails rendered from image by
+    # drones.tasks.generate_medication_thumbnails, see drones.images
+    thumbnails = models.JSONField(default=dict, blank=True, editable=False)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
     def __repr__(self):
         return f"Medication: {self.name}, {self.code}"
 
 
+# A medication catalog import, processed in chunks by
+# drones.tasks.import_medication_catalog. processed_rows is committed with
+# each chunk, so an interrupted import resumes where it stopped.
+class MedicationImport(models.Model):
+    status_choices = [
+        ('PENDING', 'PENDING'),
+        ('RUNNING', 'RUNNING'),
+        ('COMPLETED', 'COMPLETED'),
+        ('FAILED', 'FAILED'),
+    ]
+
+    status = models.CharField(
+        max_length=9, choices=status_choices, default='PENDING'
+    )
+    rows = models.JSONField(default=list)
+    # Zip archive holding the images the rows name in their image column
+    images = models.FileField(upload_to='medication_imports', blank=True)
+    total_rows = models.PositiveIntegerField(default=0)
+    processed_rows = models.PositiveIntegerField(default=0)
+    created_count = models.PositiveIntegerField(default=0)
+    updated_count = models.PositiveIntegerField(default=0)
+    failed_count = models.PositiveIntegerField(default=0)
+    errors = models.JSONField(default=list)
+    message = models.CharField(max_length=255, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __repr__(self):
+        return f"MedicationImport: {self.pk}, {self.status}"
+
+
 class DroneBatteryHistory(models.Model):
     drone = models.ForeignKey(Drone, on_delete=models.CASCADE)
     battery_level = models.IntegerField()
     sufficient_battery_capacity = models.BooleanField(default=False)
     state = models.CharField(max_length=10, blank=True)
-    timestamp = models.DateTimeField(auto_now_add=True)
+    # Time of the reading; ingested telemetry carries its own
+    timestamp = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['drone', 'timestamp'],
+                name='battery_history_drone_ts_idx'
+            ),
+            models.Index(
+                fields=['timestamp'],
+                name='battery_history_ts_idx'
+            ),
+        ]
 
     def __repr__(self):
         return f""""Drone: {self.drone.serial_number},
@@ -84,3 +182,29 @@ class DroneBatteryHistory(models.Model):
                     State: {self.state},
                     Timestamp: {self.timestamp}
                 """
+
+
+# Battery level aggregates of one drone over one time bucket, compacted
+# from DroneBatteryHistory by drones.tasks.rollup_battery_history
+class DroneBatteryRollup(models.Model):
+    drone = models.ForeignKey(Drone, on_delete=models.CASCADE)
+    bucket = models.DateTimeField()
+    samples = models.PositiveIntegerField()
+    min_battery_level = models.IntegerField()
+    avg_battery_level = models.FloatField()
+    max_battery_level = models.IntegerField()
+
+    class Meta:
+        abstract = True
+        unique_together = ('drone', 'bucket')
+
+    def __repr__(self):
+        return f"Drone: {self.drone_id}, Bucket: {self.bucket}"
+
+
+class DroneBatteryHourly(DroneBatteryRollup):
+    pass
+
+
+class DroneBatteryDaily(DroneBatteryRollup):
+    pass
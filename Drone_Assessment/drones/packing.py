@@ -0,0 +1,83 @@
+import time
+
+# Default time the solver may spend searching, in seconds
+DEFAULT_TIME_BUDGET = 0.05
+
+# Tolerance for float weights summing exactly to the capacity
+EPSILON = 1e-9
+
+
+def _ratio(item):
+    _, weight, value = item
+    return value / weight if weight else float('inf')
+
+
+def _chosen_keys(candidates, chain):
+    keys = []
+    while chain:
+        index, chain = chain
+        keys.append(candidates[index][0])
+    return keys[::-1]
+
+
+# Pick the subset of items with the highest total value whose total
+# weight fits within capacity. Items are (key, weight, value) tuples.
+# Runs a depth-first branch-and-bound seeded with the greedy solution and
+# pruned with the fractional (LP relaxation) bound. When the time budget
+# runs out the best subset found so far is returned.
+# Returns the chosen keys and whether the search proved them optimal.
+def solve_knapsack(items, capacity, time_budget=DEFAULT_TIME_BUDGET):
+    candidates = sorted(
+        (
+            item for item in items
+            if item[2] > 0 and 0 <= item[1] <= capacity + EPSILON
+        ),
+        key=_ratio,
+        reverse=True
+    )
+    count = len(candidates)
+
+    def bound(index, weight, value):
+        for _, item_weight, item_value in candidates[index:]:
+            if weight + item_weight <= capacity + EPSILON:
+                weight += item_weight
+                value += item_value
+            else:
+                return value + item_value * (capacity - weight) / item_weight
+        return value
+
+    best_value, best_chain, weight = 0, None, 0
+    for index, (_, item_weight, item_value) in enumerate(candidates):
+        if weight + item_weight <= capacity + EPSILON:
+            weight += item_weight
+            best_value += item_value
+            best_chain = (index, best_chain)
+
+    deadline = time.monotonic() + time_budget
+    # Each node is (next index, weight, value, chosen indices as a chain)
+    stack = [(0, 0, 0, None)]
+    visited = 0
+    while stack:
+        visited += 1
+        if visited % 1024 == 0 and time.monotonic() > deadline:
+            return _chosen_keys(candidates, best_chain), False
+
+        index, weight, value, chain = stack.pop()
+        if value > best_value + EPSILON:
+            best_value, best_chain = value, chain
+        if index == count:
+            continue
+        if bound(index, weight, value) <= best_value + EPSILON:
+            continue
+
+        _, item_weight, item_value = candidates[index]
+        stack.append((index + 1, weight, value, chain))
+        if weight + item_weight <= capacity + EPSILON:
+            stack.append((
+                index + 1,
+                weight + item_weight,
+                value + item_value,
+                (index, chain)
+            ))
+
+    return _chosen_keys(candidates, best_chain), True
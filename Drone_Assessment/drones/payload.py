@@ -0,0 +1,82 @@
+from django.db.models import (
+    Count,
+    F,
+    FloatField,
+    IntegerField,
+    OuterRef,
+    Q,
+    Subquery,
+    Sum,
+    Value,
+)
+from django.db.models.functions import Abs, Coalesce
+from django.utils import timezone
+from drones.models import Drone, Medication
+
+# Drone columns kept equal to the total weight and number of the drone's
+# medications
+PAYLOAD_FIELDS = ('current_medication_weight', 'medication_count')
+
+# Weight difference below which a drone's loaded weight is not drift but
+# float rounding of the running total
+PAYLOAD_WEIGHT_TOLERANCE = 1e-6
+
+# Drones fixed per UPDATE by a reconciliation
+RECONCILE_BATCH_SIZE = 1000
+
+
+def _loaded(aggregate, output_field):
+    return Coalesce(
+        Subquery(
+            Medication.objects.filter(drones=OuterRef('pk')).order_by().values(
+                'drones'
+            ).annotate(total=aggregate).values('total'),
+            output_field=output_field
+        ),
+        Value(0),
+        output_field=output_field
+    )
+
+
+# Recompute the payload columns of the given drones from their medications
+# with one UPDATE. Idempotent, so writers that cannot tell what changed can
+# always call it.
+def refresh_payloads(drone_ids):
+    return Drone.objects.filter(pk__in=drone_ids).update(
+        current_medication_weight=_loaded(Sum('weight'), FloatField()),
+        medication_count=_loaded(Count('pk'), IntegerField()),
+        updated_at=timezone.now(),
+    )
+
+
+# Drones whose payload columns drifted from their medications, found with
+# one annotate(Sum(...)) query over the whole fleet. Each drone carries the
+# recomputed values as loaded_weight and loaded_count.
+def drifted_payloads():
+    return Drone.objects.annotate(
+        loaded_weight=Coalesce(
+            Sum('medications__weight'), Value(0), output_field=FloatField()
+        ),
+        loaded_count=Count('medications'),
+        weight_drift=Abs(F('current_medication_weight') - F('loaded_weight')),
+    ).filter(
+        Q(weight_drift__gt=PAYLOAD_WEIGHT_TOLERANCE)
+        | ~Q(medication_count=F('loaded_count'))
+    ).order_by('pk')
+
+
+# Find drifted drones and, unless dry_run, recompute their payload columns.
+# The fix recomputes from the medications at UPDATE time, so a load that
+# lands in between is not overwritten with the totals read by the scan.
+# Returns the drifted drones.
+def reconcile_payloads(dry_run=False):
+    drifted = list(drifted_payloads().only(
+        'pk', 'serial_number', *PAYLOAD_FIELDS
+    ))
+    if not dry_run:
+        for start in range(0, len(drifted), RECONCILE_BATCH_SIZE):
+            refresh_payloads([
+                drone.pk
+                for drone in drifted[start:start + RECONCILE_BATCH_SIZE]
+            ])
+    return drifted
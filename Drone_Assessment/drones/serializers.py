@@ -4,10 +4,12 @@ from drf_yasg import openapi
 
 
 class MedicationSerializer(serializers.ModelSerializer):
+    thumbnails = serializers.SerializerMethodField()
+
     class Meta:
         model = Medication
         fields = (
-            'name', 'weight', 'code', 'image'
+            'name', 'weight', 'code', 'image', 'thumbnails'
         )
     register_medication_request_body = openapi.Schema(
         type=openapi.TYPE_OBJECT,
@@ -41,9 +43,42 @@ class MedicationSerializer(serializers.ModelSerializer):
             400: "Input validation failed",
             409: "Drone with this serial number already exists",
             500: "Internal Server Error"
+        },
+        'import_medications': {
+            202: openapi.Response(
+                description="Medication import queued",
+            ),
+            400: "Invalid catalog or images archive",
+            500: "Internal Server Error"
+        },
+        'get_medication_import': {
+            200: openapi.Response(
+                description="Medication import retrieved successfully",
+            ),
+            404: "Requested import does not exist",
+            500: "Internal Server Error"
         }
     }
 
+    # Thumbnail URLs by size and format, or None until the thumbnails of
+    # the current image have been generated
+    def get_thumbnails(self, medication):
+        if not medication.image or (
+            medication.thumbnails.get('source') != medication.image.name
+        ):
+            return None
+        storage = medication.image.storage
+        request = self.context.get('request')
+        urls = {}
+        for size, formats in medication.thumbnails['sizes'].items():
+            urls[size] = {}
+            for extension, name in formats.items():
+                url = storage.url(name)
+                if request is not None:
+                    url = request.build_absolute_uri(url)
+                urls[size][extension] = url
+        return urls
+
     def create(self, validated_data):
         medication = Medication.objects.create(
             **validated_data
@@ -51,14 +86,29 @@ class MedicationSerializer(serializers.ModelSerializer):
         return medication
 
 
+class MedicationImportSerializer(MedicationSerializer):
+    # Catalog imports upsert on code, so a code that already exists is
+    # valid; only its format is checked
+    class Meta(MedicationSerializer.Meta):
+        fields = ('name', 'weight', 'code')
+        extra_kwargs = {
+            'code': {
+                'validators': Medication._meta.get_field('code').validators
+            }
+        }
+
+
 class DroneSerializer(serializers.ModelSerializer):
     medications = MedicationSerializer(many=True, read_only=True)
+    # nested relations list views prefetch, see util.optimize_queryset
+    prefetch_related_fields = ('medications',)
 
     class Meta:
         model = Drone
         fields = (
             'serial_number', 'model', 'weight_limit',
-            'battery_capacity', 'medications', 'current_medication_weight'
+            'battery_capacity', 'medications', 'current_medication_weight',
+            'medication_count'
         )
     register_drone_request_body = openapi.Schema(
         type=openapi.TYPE_OBJECT,
@@ -90,11 +140,63 @@ class DroneSerializer(serializers.ModelSerializer):
                 items=openapi.Items(
                     type=openapi.TYPE_INTEGER,
                 ),
-                default=[1, 2]
+                default=[1, 2],
+                description=(
+                    "Medication IDs, or {id, priority} objects when "
+                    "packing by priority"
+                )
+            ),
+            'packing': openapi.Schema(
+                type=openapi.TYPE_STRING,
+                enum=['priority', 'weight'],
+                description=(
+                    "Optional. Load the subset of medications that "
+                    "maximizes total priority or weight instead of "
+                    "loading greedily in request order"
+                )
             )
         },
         required=['medications']
     )
+    bulk_register_parameters = [
+        openapi.Parameter(
+            name='mode',
+            in_=openapi.IN_QUERY,
+            type=openapi.TYPE_STRING,
+            enum=['atomic', 'best_effort'],
+            default='atomic',
+            description=(
+                "atomic registers nothing if any row is invalid, "
+                "best_effort registers the valid rows"
+            ),
+        ),
+    ]
+    assign_order_request_body = openapi.Schema(
+        type=openapi.TYPE_OBJECT,
+        properties={
+            'items': openapi.Schema(
+                type=openapi.TYPE_ARRAY,
+                items=openapi.Schema(
+                    type=openapi.TYPE_OBJECT,
+                    properties={
+                        'medication': openapi.Schema(
+                            type=openapi.TYPE_INTEGER,
+                            default=1
+                        ),
+                        'quantity': openapi.Schema(
+                            type=openapi.TYPE_INTEGER,
+                            default=1,
+                            minimum=1,
+                            maximum=1000,
+                            description="At most 10000 units per order"
+                        ),
+                    },
+                    required=['medication']
+                )
+            )
+        },
+        required=['items']
+    )
     load_drone_parameters = [
         openapi.Parameter(
             name='drone_id',
@@ -104,6 +206,184 @@ class DroneSerializer(serializers.ModelSerializer):
             description="Drone ID"
         )
     ]
+    battery_history_parameters = [
+        openapi.Parameter(
+            name='from',
+            in_=openapi.IN_QUERY,
+            type=openapi.TYPE_STRING,
+            format=openapi.FORMAT_DATETIME,
+            description="Start of the range, defaults to a day before 'to'",
+        ),
+        openapi.Parameter(
+            name='to',
+            in_=openapi.IN_QUERY,
+            type=openapi.TYPE_STRING,
+            format=openapi.FORMAT_DATETIME,
+            description="End of the range, defaults to now",
+        ),
+        openapi.Parameter(
+            name='points',
+            in_=openapi.IN_QUERY,
+            type=openapi.TYPE_INTEGER,
+            default=500,
+            description="Maximum number of points returned (at most 5000)",
+        ),
+        openapi.Parameter(
+            name='resolution',
+            in_=openapi.IN_QUERY,
+            type=openapi.TYPE_STRING,
+            enum=['raw', 'hour', 'day'],
+            description="Defaults to the finest resolution for the range",
+        ),
+    ]
+    telemetry_request_body = openapi.Schema(
+        type=openapi.TYPE_ARRAY,
+        items=openapi.Schema(
+            type=openapi.TYPE_OBJECT,
+            properties={
+                'drone': openapi.Schema(type=openapi.TYPE_INTEGER),
+                'battery_capacity': openapi.Schema(
+                    type=openapi.TYPE_INTEGER, minimum=0, maximum=100
+                ),
+                'state': openapi.Schema(
+                    type=openapi.TYPE_STRING,
+                    enum=[state for state, _ in Drone.state_choices]
+                ),
+                'timestamp': openapi.Schema(
+                    type=openapi.TYPE_STRING,
+                    format=openapi.FORMAT_DATETIME,
+                    description="When the reading was taken, defaults to now"
+                ),
+            },
+            required=['drone', 'battery_capacity']
+        )
+    )
+    drone_events_parameters = [
+        openapi.Parameter(
+            name='after',
+            in_=openapi.IN_QUERY,
+            type=openapi.TYPE_INTEGER,
+            description=(
+                "Return events with a higher sequence number, defaults to "
+                "the latest event"
+            ),
+        ),
+        openapi.Parameter(
+            name='drone',
+            in_=openapi.IN_QUERY,
+            type=openapi.TYPE_INTEGER,
+            description="Only return events of this drone",
+        ),
+        openapi.Parameter(
+            name='limit',
+            in_=openapi.IN_QUERY,
+            type=openapi.TYPE_INTEGER,
+            default=100,
+            description="Maximum number of events returned (at most 1000)",
+        ),
+        openapi.Parameter(
+            name='timeout',
+            in_=openapi.IN_QUERY,
+            type=openapi.TYPE_INTEGER,
+            default=25,
+            description=(
+                "Seconds to wait for an event when there is none yet "
+                "(at most 30)"
+            ),
+        ),
+    ]
+    transition_drone_request_body = openapi.Schema(
+        type=openapi.TYPE_OBJECT,
+        properties={
+            'state': openapi.Schema(
+                type=openapi.TYPE_STRING,
+                enum=[state for state, _ in Drone.state_choices],
+                default='DELIVERING'
+            ),
+        },
+        required=['state']
+    )
+    transition_drones_request_body = openapi.Schema(
+        type=openapi.TYPE_OBJECT,
+        properties={
+            'drones': openapi.Schema(
+                type=openapi.TYPE_ARRAY,
+                items=openapi.Items(type=openapi.TYPE_INTEGER),
+                default=[1, 2],
+                description="Drone IDs, at most 1000"
+            ),
+            'state': openapi.Schema(
+                type=openapi.TYPE_STRING,
+                enum=[state for state, _ in Drone.state_choices],
+                default='DELIVERING'
+            ),
+            'from_state': openapi.Schema(
+                type=openapi.TYPE_STRING,
+                enum=[state for state, _ in Drone.state_choices],
+                description=(
+                    "Optional. Only move drones currently in this state"
+                )
+            ),
+        },
+        required=['drones', 'state']
+    )
+    drone_wave_request_body = openapi.Schema(
+        type=openapi.TYPE_OBJECT,
+        properties={
+            'drones': openapi.Schema(
+                type=openapi.TYPE_ARRAY,
+                items=openapi.Items(type=openapi.TYPE_INTEGER),
+                default=[1, 2],
+                description="Drone IDs, at most 1000"
+            ),
+        },
+        required=['drones']
+    )
+    drones_list_parameters = [
+        openapi.Parameter(
+            name='state',
+            in_=openapi.IN_QUERY,
+            type=openapi.TYPE_STRING,
+            enum=[state for state, _ in Drone.state_choices],
+            description="Only list drones in this state",
+        ),
+    ]
+    export_parameters = [
+        openapi.Parameter(
+            name='resource',
+            in_=openapi.IN_QUERY,
+            type=openapi.TYPE_STRING,
+            enum=['drones', 'battery-history'],
+            default='drones',
+        ),
+        openapi.Parameter(
+            name='output',
+            in_=openapi.IN_QUERY,
+            type=openapi.TYPE_STRING,
+            enum=['ndjson', 'csv'],
+            default='ndjson',
+        ),
+        openapi.Parameter(
+            name='state',
+            in_=openapi.IN_QUERY,
+            type=openapi.TYPE_STRING,
+            description="Only export rows in this drone state",
+        ),
+        openapi.Parameter(
+            name='from',
+            in_=openapi.IN_QUERY,
+            type=openapi.TYPE_STRING,
+            format=openapi.FORMAT_DATETIME,
+            description="Battery history samples taken at or after",
+        ),
+        openapi.Parameter(
+            name='to',
+            in_=openapi.IN_QUERY,
+            type=openapi.TYPE_STRING,
+            format=openapi.FORMAT_DATETIME,
+            description="Battery history samples taken before",
+        ),
+    ]
     responses = {
         'register_drone': {
             201: openapi.Response(
@@ -118,7 +398,28 @@ class DroneSerializer(serializers.ModelSerializer):
                 description="Drone loaded successfully",
             ),
             304: "Not modified. Medication not loaded on Drone",
-            404: "Requested drone not available(IDLE) or does not exist",
+            400: "Invalid packing objective",
+            404: (
+                "Requested drone not available(IDLE or LOADING) or does not "
+                "exist"
+            ),
+            409: "Drone was modified concurrently, try again",
+            500: "Internal Server Error"
+        },
+        'bulk_register_drones': {
+            201: openapi.Response(
+                description="Drones registered successfully",
+            ),
+            400: "Input validation failed",
+            409: "Drone with this serial number already exists",
+            500: "Internal Server Error"
+        },
+        'assign_order': {
+            201: openapi.Response(
+                description="Order assigned to drones successfully",
+            ),
+            304: "Not modified. No medication assigned to any drone",
+            409: "Drones were modified concurrently, try again",
             500: "Internal Server Error"
         },
         'get_med_on_drone': {
@@ -135,6 +436,59 @@ class DroneSerializer(serializers.ModelSerializer):
             404: "Requested drone not available(IDLE) or does not exist",
             500: "Internal Server Error"
         },
+        'get_battery_history': {
+            200: openapi.Response(
+                description="Battery history retrieved successfully",
+            ),
+            400: "Invalid battery history parameters",
+            404: "Requested drone does not exist",
+            500: "Internal Server Error"
+        },
+        'ingest_telemetry': {
+            202: openapi.Response(
+                description="Telemetry accepted for the next flush",
+            ),
+            400: "Input validation failed",
+            503: "Telemetry buffer is full, retry after the Retry-After delay",
+            500: "Internal Server Error"
+        },
+        'get_drone_events': {
+            200: openapi.Response(
+                description="Drone events retrieved successfully",
+            ),
+            400: "Invalid drone event parameters",
+            500: "Internal Server Error"
+        },
+        'transition_drone': {
+            200: openapi.Response(
+                description="Drone transitioned successfully",
+            ),
+            400: "Invalid drone state, or LOADED, which only loading reaches",
+            404: "Requested drone does not exist",
+            409: "Drone cannot move to the requested state",
+            500: "Internal Server Error"
+        },
+        'transition_drones': {
+            200: openapi.Response(
+                description="Drones transitioned successfully",
+            ),
+            304: "Not modified. No drone transitioned",
+            400: "Input validation failed",
+            500: "Internal Server Error"
+        },
+        'get_all_drones': {
+            200: openapi.Response(
+                description="Drones retrieved successfully",
+            ),
+            500: "Internal Server Error"
+        },
+        'export_fleet': {
+            200: openapi.Response(
+                description="Export streamed successfully",
+            ),
+            400: "Invalid export parameters",
+            500: "Internal Server Error"
+        },
         'get_available_drones': {
             200: openapi.Response(
                 description="Available drones retrieved successfully",
@@ -153,3 +507,20 @@ class DroneSerializer(serializers.ModelSerializer):
             drone = Drone.objects.create(**validated_data)
         drone.save()
         return drone
+
+
+# One telemetry reading reported by a drone, see drones.telemetry
+class TelemetryReadingSerializer(serializers.Serializer):
+    drone = serializers.IntegerField(min_value=1)
+    battery_capacity = serializers.IntegerField(min_value=0, max_value=100)
+    state = serializers.ChoiceField(
+        choices=Drone.state_choices, required=False
+    )
+    timestamp = serializers.DateTimeField(required=False)
+
+
+class DroneBulkSerializer(DroneSerializer):
+    # Serial number uniqueness is checked for the whole batch with one
+    # query in drones.bulk instead of one query per row
+    class Meta(DroneSerializer.Meta):
+        extra_kwargs = {'serial_number': {'validators': []}}
@@ -0,0 +1,105 @@
+from django.db import transaction
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_init,
+    post_save,
+    pre_delete,
+)
+from django.dispatch import receiver
+from drones.cache import invalidate_drones
+from drones.events import EVENT_FIELDS, record_drone_events
+from drones.models import Drone, Medication
+from drones.payload import PAYLOAD_FIELDS, refresh_payloads
+from drones.tasks import generate_medication_thumbnails
+
+
+# Invalidated once the write commits, so a concurrent read cannot cache
+# the row as it was before the write
+@receiver([post_save, post_delete], sender=Drone)
+def invalidate_drone_cache(sender, instance, **kwargs):
+    drone_id = instance.pk
+    transaction.on_commit(lambda: invalidate_drones([drone_id]))
+
+
+# Values of the change feed fields as loaded, leaving deferred fields
+# unloaded
+def _event_fields(instance):
+    return tuple(instance.__dict__.get(field) for field in EVENT_FIELDS)
+
+
+@receiver(post_init, sender=Drone)
+def remember_event_fields(sender, instance, **kwargs):
+    instance._saved_event_fields = _event_fields(instance)
+
+
+@receiver(post_save, sender=Drone)
+def record_drone_event(sender, instance, created, **kwargs):
+    previous = (None, None) if created else instance._saved_event_fields
+    current = _event_fields(instance)
+    if current != previous:
+        record_drone_events([(instance.pk, *current, *previous)])
+        instance._saved_event_fields = current
+
+
+@receiver(post_save, sender=Medication)
+def queue_medication_thumbnails(sender, instance, **kwargs):
+    if instance.image and (
+        instance.thumbnails.get('source') != instance.image.name
+    ):
+        transaction.on_commit(
+            lambda: generate_medication_thumbnails.delay([instance.pk])
+        )
+
+
+# Keep the payload columns of drones in step with their medications when
+# the relation is changed through its managers, e.g. by the admin. Writers
+# of the join table itself update the columns on their own.
+@receiver(m2m_changed, sender=Drone.medications.through)
+def refresh_drone_payloads(sender, instance, action, reverse, pk_set,
+                           **kwargs):
+    if action == 'pre_clear' and reverse:
+        instance._cleared_drone_ids = list(
+            instance.drones.values_list('pk', flat=True)
+        )
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        refresh_payloads([instance.pk])
+        instance.refresh_from_db(fields=PAYLOAD_FIELDS)
+    elif action == 'post_clear':
+        refresh_payloads(instance.__dict__.pop('_cleared_drone_ids', []))
+    else:
+        refresh_payloads(pk_set)
+
+
+def _carrying_drones(medication_ids):
+    return Drone.medications.through.objects.filter(
+        medication_id__in=medication_ids
+    ).values('drone_id')
+
+
+@receiver(post_init, sender=Medication)
+def remember_medication_weight(sender, instance, **kwargs):
+    instance._saved_weight = instance.__dict__.get('weight')
+
+
+@receiver(post_save, sender=Medication)
+def refresh_payloads_on_weight_change(sender, instance, created, **kwargs):
+    if not created and instance.weight != instance._saved_weight:
+        refresh_payloads(_carrying_drones([instance.pk]))
+    instance._saved_weight = instance.weight
+
+
+# Deleting a medication removes it from every drone without an m2m_changed
+# signal, so the drones carrying it are looked up before the delete
+@receiver(pre_delete, sender=Medication)
+def remember_carrying_drones(sender, instance, **kwargs):
+    instance._carrying_drone_ids = list(
+        _carrying_drones([instance.pk]).values_list('drone_id', flat=True)
+    )
+
+
+@receiver(post_delete, sender=Medication)
+def refresh_payloads_on_delete(sender, instance, **kwargs):
+    refresh_payloads(instance.__dict__.pop('_carrying_drone_ids', []))
@@ -0,0 +1,134 @@
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+from drones.cache import invalidate_drones
+from drones.events import record_drone_events
+from drones.models import Drone
+
+# States each drone state may move to. A drone is packed and loaded while
+# IDLE, flies out once LOADED, delivers and returns; a drone that is not in
+# the air can be stood down to IDLE. No transition leads to LOADED: only
+# loading medications onto a drone in LOADABLE_STATES does, so a drone is
+# never LOADED with nothing on it.
+DRONE_TRANSITIONS = {
+    'IDLE': ('LOADING',),
+    'LOADING': ('IDLE',),
+    'LOADED': ('DELIVERING', 'IDLE'),
+    'DELIVERING': ('DELIVERED',),
+    'DELIVERED': ('RETURNING', 'IDLE'),
+    'RETURNING': ('IDLE',),
+}
+
+# States the transition API can move a drone to
+TRANSITION_TARGETS = frozenset(
+    target for targets in DRONE_TRANSITIONS.values() for target in targets
+)
+
+# States medications can be loaded in; loading moves the drone to LOADED
+LOADABLE_STATES = ('IDLE', 'LOADING')
+
+# States a drone enters without a payload: its medications are delivered
+# on DELIVERED and whatever it still carries is unloaded on IDLE
+UNLOADED_STATES = ('DELIVERED', 'IDLE')
+
+# Most drones moved by one bulk transition
+MAX_TRANSITION_DRONES = 1000
+
+# Reasons a drone is not transitioned
+NOT_FOUND = 'not_found'
+UNEXPECTED_STATE = 'unexpected_state'
+INVALID_TRANSITION = 'invalid_transition'
+CONFLICT = 'conflict'
+
+
+def can_transition(source, target):
+    return target in DRONE_TRANSITIONS.get(source, ())
+
+
+def _lockable_drones():
+    drones = Drone.objects.all()
+    if connection.features.has_select_for_update:
+        drones = drones.select_for_update()
+    return drones
+
+
+# Move drones to the target state in one transaction. Drones not in an
+# allowed source state, or not in `expected` when it is given, are left
+# alone. The drones sharing a current state are moved together with one
+# UPDATE ... WHERE state=<current state>, so a drone another writer moved
+# since it was read is not overwritten. Moving into one of UNLOADED_STATES
+# also clears the drones' medications and loaded weight, and every
+# transition is recorded on the change feed. Returns the transitions made
+# and the drones rejected, with their state at the time and the reason.
+def transition_drones(drone_ids, target, expected=None):
+    now = timezone.now()
+    with transaction.atomic():
+        current = {
+            pk: (state, battery_capacity)
+            for pk, state, battery_capacity in _lockable_drones().filter(
+                pk__in=drone_ids
+            ).values_list('pk', 'state', 'battery_capacity')
+        }
+
+        groups, rejected = {}, []
+        for drone_id in dict.fromkeys(drone_ids):
+            state = current.get(drone_id, (None,))[0]
+            if drone_id not in current:
+                reason = NOT_FOUND
+            elif expected is not None and state != expected:
+                reason = UNEXPECTED_STATE
+            elif not can_transition(state, target):
+                reason = INVALID_TRANSITION
+            else:
+                groups.setdefault(state, []).append(drone_id)
+                continue
+            rejected.append(
+                {"drone": drone_id, "state": state, "reason": reason}
+            )
+
+        changes = {
+            'state': target,
+            'version': F('version') + 1,
+            'updated_at': now,
+        }
+        if target in UNLOADED_STATES:
+            changes['current_medication_weight'] = 0
+            changes['medication_count'] = 0
+
+        transitioned = []
+        for state, group in groups.items():
+            moved = Drone.objects.filter(pk__in=group, state=state).update(
+                **changes
+            )
+            if moved < len(group):
+                # Only possible without row locks: find the drones this
+                # update moved by the timestamp it wrote
+                moved_ids = set(Drone.objects.filter(
+                    pk__in=group, state=target, updated_at=now
+                ).values_list('pk', flat=True))
+                rejected.extend(
+                    {"drone": drone_id, "state": state, "reason": CONFLICT}
+                    for drone_id in group if drone_id not in moved_ids
+                )
+                group = [
+                    drone_id for drone_id in group if drone_id in moved_ids
+                ]
+            transitioned.extend(
+                {"drone": drone_id, "previous_state": state, "state": target}
+                for drone_id in group
+            )
+
+        record_drone_events([
+            (
+                transition["drone"], target, current[transition["drone"]][1],
+                *current[transition["drone"]]
+            )
+            for transition in transitioned
+        ])
+        moved_ids = [transition["drone"] for transition in transitioned]
+        if target in UNLOADED_STATES and moved_ids:
+            Drone.medications.through.objects.filter(
+                drone_id__in=moved_ids
+            ).delete()
+        transaction.on_commit(lambda: invalidate_drones(moved_ids))
+    return transitioned, rejected
@@ -1,23 +1,269 @@
-from celery import shared_task
+from celery import chord, shared_task
+from django.conf import settings
+from django.db.models import F, Max, Min, Q
+from django.db.models.fields.json import KeyTextTransform
 from django.utils import timezone
-from drones.models import Drone, DroneBatteryHistory
-from drones.util import healthy_battery
+from drones.catalog import run_import
+from drones.cache import DRONE_SNAPSHOT_FIELDS, invalidate_drones
+from drones.depletion import update_discharge_rate
+from drones.images import make_thumbnails
+from drones.telemetry import flush_telemetry as flush_buffered_telemetry
+from drones.history import (
+    apply_retention,
+    changed_samples,
+    remember_samples,
+    rollup_daily,
+    rollup_hourly,
+)
+from drones.models import (
+    Drone,
+    DroneBatteryHistory,
+    Medication,
+    MedicationImport,
+)
+from drones.util import MIN_BATTERY_CAPACITY
 import logging
+import time
 
 logger = logging.getLogger(__name__)
 
+# Drones read per query by the battery sweep
+BATTERY_SWEEP_CHUNK_SIZE = 1000
+# Battery history rows written per INSERT
+BATTERY_HISTORY_BATCH_SIZE = 500
 
+# Drone columns read by the battery sweep
+BATTERY_SWEEP_FIELDS = DRONE_SNAPSHOT_FIELDS + (
+    'battery_sampled_level', 'battery_sampled_at'
+)
+DISCHARGE_MODEL_FIELDS = (
+    'discharge_rate', 'battery_sampled_level', 'battery_sampled_at'
+)
+
+
+# Drones as dicts of BATTERY_SWEEP_FIELDS, read in primary key order one
+# chunk at a time, optionally limited to the primary keys in
+# [start_pk, end_pk)
+def drone_chunks(chunk_size=BATTERY_SWEEP_CHUNK_SIZE, start_pk=None,
+                 end_pk=None):
+    drones = Drone.objects.order_by('pk')
+    if end_pk is not None:
+        drones = drones.filter(pk__lt=end_pk)
+    last_pk = start_pk - 1 if start_pk is not None else 0
+    while True:
+        rows = list(
+            drones.filter(pk__gt=last_pk).values(
+                'pk', *BATTERY_SWEEP_FIELDS
+            )[:chunk_size]
+        )
+        if rows:
+            yield rows
+        if len(rows) < chunk_size:
+            return
+        last_pk = rows[-1]['pk']
+
+
+# Fold the drones' current battery levels into their discharge models and
+# save the ones that changed. Returns the primary keys of the saved drones.
+def update_discharge_models(drones, now):
+    updated = []
+    for drone in drones:
+        estimate = update_discharge_rate(
+            drone['discharge_rate'],
+            drone['battery_sampled_level'],
+            drone['battery_sampled_at'],
+            drone['battery_capacity'],
+            now
+        )
+        if estimate is not None:
+            drone.update(zip(DISCHARGE_MODEL_FIELDS, estimate))
+            updated.append(Drone(pk=drone['pk'], updated_at=now, **{
+                field: drone[field] for field in DISCHARGE_MODEL_FIELDS
+            }))
+    Drone.objects.bulk_update(
+        updated, DISCHARGE_MODEL_FIELDS + ('updated_at',),
+        batch_size=BATTERY_HISTORY_BATCH_SIZE
+    )
+    return [drone.pk for drone in updated]
+
+
+# Split the drone primary key space into at most `shards` contiguous
+# [start_pk, end_pk) ranges
+def shard_ranges(shards):
+    bounds = Drone.objects.aggregate(first=Min('pk'), last=Max('pk'))
+    if bounds['first'] is None:
+        return []
+    first, last = bounds['first'], bounds['last']
+    size = -(-(last - first + 1) // shards)
+    return [
+        (start, min(start + size, last + 1))
+        for start in range(first, last + 1, size)
+    ]
+
+
+# Record a battery history sample for every drone, one chunk of drones at
+# a time, and return the run's metrics
+def sweep_drone_batteries(chunk_size=BATTERY_SWEEP_CHUNK_SIZE,
+                          start_pk=None, end_pk=None):
+    started = time.monotonic()
+    now = timezone.now()
+    scanned = written = 0
+    for rows in drone_chunks(chunk_size, start_pk, end_pk):
+        battery_history = [
+            DroneBatteryHistory(
+                drone_id=drone['pk'],
+                battery_level=drone['battery_capacity'],
+                sufficient_battery_capacity=(
+                    drone['battery_capacity'] >= MIN_BATTERY_CAPACITY
+                ),
+                state=drone['state']
+            )
+            for drone in rows
+        ]
+        if settings.DRONE_BATTERY_HISTORY_MODE == 'delta':
+            battery_history = changed_samples(battery_history, now)
+        DroneBatteryHistory.objects.bulk_create(
+            battery_history, batch_size=BATTERY_HISTORY_BATCH_SIZE
+        )
+        remember_samples(battery_history, now)
+        # The rows were read before the update, so caching them could put
+        # back a state or battery level another writer has since changed
+        invalidate_drones(update_discharge_models(rows, now))
+        scanned += len(rows)
+        written += len(battery_history)
+
+    return {
+        "scanned": scanned,
+        "written": written,
+        "duration": round(time.monotonic() - started, 3),
+    }
+
+
+def _log_sweep(metrics):
+    logger.info(
+        f"Drone battery levels checked at {timezone.now()}: "
+        f"{metrics['scanned']} drones scanned, "
+        f"{metrics['written']} samples written "
+        f"in {metrics['duration']}s"
+    )
+
+
+# Sweeps the whole fleet in one task, or with DRONE_BATTERY_SWEEP_SHARDS
+# above one, fans out a chord of shard sweeps over ranges of the drone
+# primary key space whose totals are reported by aggregate_battery_sweep
 @shared_task()
 def check_drone_battery():
-    drones = Drone.objects.all()
-    battery_history = [
-        DroneBatteryHistory(
-            drone=drone,
-            battery_level=drone.battery_capacity,
-            sufficient_battery_capacity=healthy_battery(drone),
-            state=drone.state
+    shards = settings.DRONE_BATTERY_SWEEP_SHARDS
+    ranges = shard_ranges(shards) if shards > 1 else []
+    if len(ranges) > 1:
+        chord(
+            check_drone_battery_shard.s(start_pk, end_pk)
+            for start_pk, end_pk in ranges
+        )(aggregate_battery_sweep.s(time.time()))
+        return {"shards": len(ranges)}
+
+    metrics = sweep_drone_batteries()
+    _log_sweep(metrics)
+    return metrics
+
+
+@shared_task()
+def check_drone_battery_shard(start_pk, end_pk):
+    return sweep_drone_batteries(start_pk=start_pk, end_pk=end_pk)
+
+
+@shared_task()
+def aggregate_battery_sweep(results, dispatched_at):
+    metrics = {
+        "shards": len(results),
+        "scanned": sum(result['scanned'] for result in results),
+        "written": sum(result['written'] for result in results),
+        "duration": round(time.time() - dispatched_at, 3),
+    }
+    _log_sweep(metrics)
+    return metrics
+
+
+# Compact raw battery samples into hourly and daily rollups, then prune
+# what is past retention
+@shared_task()
+def rollup_battery_history():
+    metrics = {
+        "hourly": rollup_hourly(),
+        "daily": rollup_daily(),
+        "pruned": apply_retention(),
+    }
+    logger.info(
+        f"Battery history rolled up at {timezone.now()}: "
+        f"{metrics['hourly']} hourly and {metrics['daily']} daily rows, "
+        f"{metrics['pruned']['raw']} raw and "
+        f"{metrics['pruned']['hourly']} hourly rows and "
+        f"{metrics['pruned']['events']} drone events pruned"
+    )
+    return metrics
+
+
+# Import a medication catalog. Re-running it for an interrupted import
+# resumes from its last committed chunk.
+@shared_task
+def import_medication_catalog(import_id):
+    medication_import = run_import(
+        MedicationImport.objects.get(pk=import_id)
+    )
+    generate_medication_thumbnails.delay()
+    logger.info(
+        f"Medication import {import_id}: "
+        f"{medication_import.created_count} created, "
+        f"{medication_import.updated_count} updated, "
+        f"{medication_import.failed_count} failed"
+    )
+
+
+# Medications with an image whose thumbnails are missing or were rendered
+# from a previous image
+def pending_thumbnails():
+    return Medication.objects.exclude(image='').alias(
+        thumbnails_source=KeyTextTransform('source', 'thumbnails')
+    ).filter(
+        Q(thumbnails_source__isnull=True)
+        | ~Q(thumbnails_source=F('image'))
+    )
+
+
+# Render the thumbnails of the given medications, or of every medication
+# whose thumbnails are pending. A medication whose image changed while its
+# thumbnails were rendered is left pending for the next run.
+@shared_task
+def generate_medication_thumbnails(medication_ids=None):
+    medications = pending_thumbnails()
+    if medication_ids is not None:
+        medications = medications.filter(pk__in=medication_ids)
+
+    generated = 0
+    for pk, image in medications.values_list('pk', 'image').iterator():
+        try:
+            thumbnails = make_thumbnails(image)
+        except Exception:
+            logger.exception(f"Thumbnails of medication {pk} failed")
+            continue
+        generated += Medication.objects.filter(pk=pk, image=image).update(
+            thumbnails=thumbnails, updated_at=timezone.now()
         )
-        for drone in drones
-    ]
-    DroneBatteryHistory.objects.bulk_create(battery_history)
-    logger.info(f"Drone battery levels checked at {timezone.now()}")
+
+    logger.info(f"Generated thumbnails of {generated} medications")
+    return generated
+
+
+# Write buffered drone telemetry, see drones.telemetry. Scheduled every
+# TELEMETRY_FLUSH_INTERVAL seconds; a run that finds another still
+# flushing does nothing.
+@shared_task
+def flush_telemetry():
+    metrics = flush_buffered_telemetry()
+    if metrics and metrics['readings']:
+        logger.info(
+            f"Telemetry flushed: {metrics['readings']} readings for "
+            f"{metrics['drones']} drones, {metrics['samples']} samples "
+            f"written in {metrics['duration']}s"
+        )
+    return metrics
@@ -0,0 +1,332 @@
+import itertools
+import json
+import logging
+import threading
+import time
+from collections import deque
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from drones.bulk import validate_rows
+from drones.cache import DRONE_SNAPSHOT_FIELDS, refresh_drone_snapshots
+from drones.depletion import update_discharge_rate
+from drones.events import record_drone_events
+from drones.history import changed_samples, remember_samples
+from drones.models import Drone, DroneBatteryHistory
+from drones.serializers import TelemetryReadingSerializer
+from drones.states import transition_drones
+from drones.util import MIN_BATTERY_CAPACITY
+
+logger = logging.getLogger(__name__)
+
+# Most readings accepted in one ingest request
+TELEMETRY_MAX_READINGS_PER_REQUEST = 5000
+
+UNKNOWN_DRONE = 'Drone does not exist.'
+
+TELEMETRY_BUFFER_KEY = 'drones:telemetry:buffer'
+# Held while a flush runs, so overlapping flushes cannot write an older
+# batch over a newer one
+TELEMETRY_FLUSH_LOCK_KEY = 'drones:telemetry:flush-lock'
+
+# Drone columns a flush reads
+TELEMETRY_DRONE_FIELDS = DRONE_SNAPSHOT_FIELDS + (
+    'battery_sampled_level', 'battery_sampled_at'
+)
+# Drone columns a flush writes directly; state changes go through
+# drones.states instead
+TELEMETRY_UPDATE_FIELDS = (
+    'battery_capacity', 'discharge_rate', 'battery_sampled_level',
+    'battery_sampled_at', 'updated_at',
+)
+
+
+# Append ARGV[2..] to the list KEYS[1] unless that would take it past
+# ARGV[1] entries. The length check and the push run as one script, so
+# concurrent ingests cannot both pass the check and overfill the buffer.
+TELEMETRY_PUSH_SCRIPT = """
+if redis.call('LLEN', KEYS[1]) + #ARGV - 1 > tonumber(ARGV[1]) then
+    return 0
+end
+for start = 2, #ARGV, 1000 do
+    redis.call('RPUSH', KEYS[1], unpack(ARGV, start, math.min(start + 999, #ARGV)))
+end
+return 1
+"""
+
+
+# Readings waiting to be flushed, as a Redis list shared by every web and
+# worker process
+class RedisTelemetryBuffer:
+    def __init__(self, url):
+        import redis
+        self.client = redis.Redis.from_url(url)
+        self.push_script = self.client.register_script(TELEMETRY_PUSH_SCRIPT)
+
+    # Append readings unless that would take the buffer past
+    # TELEMETRY_BUFFER_MAX_READINGS. Returns whether they were accepted.
+    def push(self, readings):
+        return bool(self.push_script(
+            keys=[TELEMETRY_BUFFER_KEY],
+            args=[settings.TELEMETRY_BUFFER_MAX_READINGS] + [
+                json.dumps(reading) for reading in readings
+            ]
+        ))
+
+    # Return up to `count` of the oldest readings, leaving them buffered
+    def peek(self, count):
+        return [
+            json.loads(reading)
+            for reading in self.client.lrange(
+                TELEMETRY_BUFFER_KEY, 0, count - 1
+            )
+        ]
+
+    # Remove the `count` oldest readings once they are written
+    def trim(self, count):
+        self.client.ltrim(TELEMETRY_BUFFER_KEY, count, -1)
+
+    def size(self):
+        return self.client.llen(TELEMETRY_BUFFER_KEY)
+
+
+# Readings waiting to be flushed, held in this process. Nothing else can
+# flush them, so ingest flushes inline once TELEMETRY_FLUSH_INTERVAL has
+# passed since the last flush. Meant for single-process deployments and
+# tests.
+class LocalTelemetryBuffer:
+    def __init__(self):
+        self.readings = deque()
+        self.lock = threading.Lock()
+        self.flushed_at = time.monotonic()
+
+    def push(self, readings):
+        with self.lock:
+            if len(self.readings) + len(readings) > (
+                settings.TELEMETRY_BUFFER_MAX_READINGS
+            ):
+                return False
+            self.readings.extend(readings)
+            return True
+
+    # Copies, since writing a batch parses its readings in place
+    def peek(self, count):
+        with self.lock:
+            return [
+                dict(reading)
+                for reading in itertools.islice(self.readings, count)
+            ]
+
+    def trim(self, count):
+        with self.lock:
+            for _ in range(min(count, len(self.readings))):
+                self.readings.popleft()
+
+    def size(self):
+        return len(self.readings)
+
+    def flush_due(self):
+        return (
+            time.monotonic() - self.flushed_at
+            >= settings.TELEMETRY_FLUSH_INTERVAL
+        )
+
+
+_buffer = None
+
+
+def _lockable_drones():
+    drones = Drone.objects.all()
+    if connection.features.has_select_for_update:
+        drones = drones.select_for_update()
+    return drones
+
+
+def get_telemetry_buffer():
+    global _buffer
+    if _buffer is None:
+        if settings.TELEMETRY_BUFFER == 'redis':
+            _buffer = RedisTelemetryBuffer(settings.TELEMETRY_REDIS_URL)
+        else:
+            _buffer = LocalTelemetryBuffer()
+    return _buffer
+
+
+# Validate telemetry readings as a batch; drone existence is checked with
+# one query. Returns the readings ready to buffer and the per-row errors.
+# Readings without a timestamp, or with one in the future, are stamped
+# with the time they were received.
+def validate_readings(rows):
+    validated, row_errors = validate_rows(TelemetryReadingSerializer, rows)
+    known = set(Drone.objects.filter(
+        pk__in=[data['drone'] for data in validated if data]
+    ).values_list('pk', flat=True))
+
+    now = timezone.now()
+    readings, errors = [], []
+    for index, (data, row_error) in enumerate(zip(validated, row_errors)):
+        if data and data['drone'] not in known:
+            row_error = {'drone': [UNKNOWN_DRONE]}
+        if row_error:
+            errors.append({"row": index, "errors": row_error})
+            continue
+        readings.append({
+            "drone": data['drone'],
+            "battery_capacity": data['battery_capacity'],
+            "state": data.get('state'),
+            "timestamp": min(data.get('timestamp', now), now).isoformat(),
+        })
+    return readings, errors
+
+
+# Buffer validated readings for the next flush. Returns False when the
+# buffer is full and the readings were refused.
+def ingest_readings(readings):
+    buffer = get_telemetry_buffer()
+    if not buffer.push(readings):
+        return False
+    if isinstance(buffer, LocalTelemetryBuffer) and buffer.flush_due():
+        # The readings are accepted either way; a failed flush leaves them
+        # buffered for the next one
+        try:
+            flush_telemetry()
+        except Exception:
+            logger.exception("Inline telemetry flush failed")
+    return True
+
+
+# Apply one batch of readings in one transaction, with the drones' rows
+# locked on databases that support select_for_update. The latest battery
+# level of each drone and every reading folded into its discharge model
+# are written with one bulk_update of the battery columns only, so a load
+# or transition committed meanwhile is never reverted. A reported state
+# goes through the state machine like any other transition: it is applied
+# only when the transition table allows it, with a conditional UPDATE.
+# Battery history rows for the readings worth recording are written with
+# one bulk_create, then change feed events and, once committed, the cached
+# drone snapshots as written.
+def write_readings(readings):
+    for reading in readings:
+        reading['timestamp'] = parse_datetime(reading['timestamp'])
+    readings.sort(key=lambda reading: reading['timestamp'])
+
+    with transaction.atomic():
+        drones = _lockable_drones().only(
+            'pk', 'updated_at', *TELEMETRY_DRONE_FIELDS
+        ).in_bulk({reading['drone'] for reading in readings})
+
+        previous = {
+            pk: (drone.battery_capacity, drone.discharge_rate)
+            for pk, drone in drones.items()
+        }
+        reported, history = {}, []
+        for reading in readings:
+            drone = drones.get(reading['drone'])
+            # Readings older than the drone's discharge baseline arrived
+            # late; the row already reflects something newer
+            if drone is None or (
+                drone.battery_sampled_at is not None
+                and reading['timestamp'] < drone.battery_sampled_at
+            ):
+                continue
+            level = reading['battery_capacity']
+            estimate = update_discharge_rate(
+                drone.discharge_rate,
+                drone.battery_sampled_level,
+                drone.battery_sampled_at,
+                level,
+                reading['timestamp']
+            )
+            if estimate is not None:
+                (
+                    drone.discharge_rate,
+                    drone.battery_sampled_level,
+                    drone.battery_sampled_at,
+                ) = estimate
+            drone.battery_capacity = level
+            if reading['state']:
+                reported[drone.pk] = reading['state']
+            history.append(DroneBatteryHistory(
+                drone_id=drone.pk,
+                battery_level=level,
+                sufficient_battery_capacity=level >= MIN_BATTERY_CAPACITY,
+                state=reported.get(drone.pk, drone.state),
+                timestamp=reading['timestamp'],
+            ))
+
+        # Bump updated_at, and with it the drone's ETag, only when what the
+        # API shows changed: the battery level, or the discharge rate that
+        # decides whether the drone is listed as available
+        now = timezone.now()
+        for drone in drones.values():
+            if previous[drone.pk] != (
+                drone.battery_capacity, drone.discharge_rate
+            ):
+                drone.updated_at = now
+        if settings.DRONE_BATTERY_HISTORY_MODE == 'delta':
+            history = changed_samples(history, now)
+
+        Drone.objects.bulk_update(
+            drones.values(), TELEMETRY_UPDATE_FIELDS,
+            batch_size=settings.TELEMETRY_FLUSH_BATCH_SIZE
+        )
+        DroneBatteryHistory.objects.bulk_create(
+            history, batch_size=settings.TELEMETRY_FLUSH_BATCH_SIZE
+        )
+        record_drone_events([
+            (drone.pk, drone.state, drone.battery_capacity,
+             drone.state, previous[drone.pk][0])
+            for drone in drones.values()
+            if drone.battery_capacity != previous[drone.pk][0]
+        ])
+
+        targets = {}
+        for drone_id, state in reported.items():
+            if state != drones[drone_id].state:
+                targets.setdefault(state, []).append(drone_id)
+        for target, drone_ids in targets.items():
+            transition_drones(drone_ids, target)
+
+        # Read back after the writes, so the cache gets what this
+        # transaction commits rather than what the flush read
+        snapshots = list(Drone.objects.filter(pk__in=list(drones)).values(
+            'pk', *DRONE_SNAPSHOT_FIELDS
+        ))
+        transaction.on_commit(lambda: refresh_drone_snapshots(snapshots))
+    remember_samples(history, now)
+    return len(drones), len(history)
+
+
+# Drain the buffer in batches of TELEMETRY_FLUSH_BATCH_SIZE readings. A
+# batch leaves the buffer only once it is written, so a failed write is
+# retried by the next flush. Only the lock holder removes readings and
+# ingest appends at the other end, so trimming the batch's length removes
+# exactly that batch. Returns the flush metrics, or None when another
+# flush is running.
+def flush_telemetry():
+    if not cache.add(
+        TELEMETRY_FLUSH_LOCK_KEY, 1,
+        timeout=settings.TELEMETRY_FLUSH_LOCK_TIMEOUT
+    ):
+        return None
+    started = time.monotonic()
+    buffer = get_telemetry_buffer()
+    metrics = {"readings": 0, "drones": 0, "samples": 0}
+    try:
+        while True:
+            readings = buffer.peek(settings.TELEMETRY_FLUSH_BATCH_SIZE)
+            if not readings:
+                break
+            drones, samples = write_readings(readings)
+            buffer.trim(len(readings))
+            metrics["readings"] += len(readings)
+            metrics["drones"] += drones
+            metrics["samples"] += samples
+    finally:
+        if isinstance(buffer, LocalTelemetryBuffer):
+            buffer.flushed_at = time.monotonic()
+        cache.delete(TELEMETRY_FLUSH_LOCK_KEY)
+    metrics["duration"] = round(time.monotonic() - started, 3)
+    return metrics
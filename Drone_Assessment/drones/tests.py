@@ -1,7 +1,63 @@
+import io
+import json
+import os
+import shutil
+import tempfile
+import time
+import zipfile
+from datetime import datetime, timedelta, timezone as dt_timezone
+from types import SimpleNamespace
+from unittest import mock
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db.models import F
+from django.test import LiveServerTestCase, TestCase, override_settings
 from django.urls import reverse
+from django.utils import timezone
+from django.utils.http import http_date
 from rest_framework import status
 from rest_framework.test import APITestCase
-from drones.models import Drone, Medication
+from PIL import Image
+from drones.depletion import minutes_to_reserve, update_discharge_rate
+from drones.history import (
+    apply_retention,
+    pick_resolution,
+    query_battery_history,
+    rollup_daily,
+    rollup_hourly,
+)
+from drones.models import (
+    Drone,
+    DroneBatteryDaily,
+    DroneBatteryHistory,
+    DroneBatteryHourly,
+    DroneEvent,
+    Medication,
+    MedicationImport,
+)
+from drones import (
+    assignment,
+    catalog,
+    events,
+    loading,
+    states,
+    telemetry,
+)
+from drones.cache import cache_stats, drone_cache_key
+from drones.packing import solve_knapsack
+from drones.util import available_drones
+from drones.serializers import MedicationSerializer
+from drones.tasks import (
+    aggregate_battery_sweep,
+    check_drone_battery,
+    generate_medication_thumbnails,
+    shard_ranges,
+    sweep_drone_batteries,
+    update_discharge_models,
+)
 
 
 class MedicationTests(APITestCase):
@@ -155,3 +211,1732 @@ class DroneTests(APITestCase):
         }
         response = self.client.post(url, data, format='json')
         self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class LoadingTests(APITestCase):
+    def setUp(self):
+        self.drone = Drone.objects.create(
+            serial_number='LOAD00001',
+            model='Lightweight',
+            battery_capacity=100,
+            weight_limit=100,
+        )
+        self.medications = [
+            Medication.objects.create(
+                name=f'med{index}', weight=10.0, code=f'MED_{index:05}'
+            )
+            for index in range(12)
+        ]
+
+    def load(self, medication_ids):
+        url = reverse(
+            'load-drone-with-medication',
+            kwargs={'drone_id': self.drone.pk}
+        )
+        return self.client.post(
+            url, {'medications': medication_ids}, format='json'
+        )
+
+    def test_load_reports_accepted_and_rejected(self):
+        first, second = self.medications[0].pk, self.medications[1].pk
+        response = self.load([first, 'abc', first, 9999, second])
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['data']['accepted'], [first, second])
+        self.assertEqual(response.data['data']['rejected'], [
+            {'medication': 'abc', 'reason': 'invalid_id'},
+            {'medication': first, 'reason': 'duplicate'},
+            {'medication': 9999, 'reason': 'not_found'},
+        ])
+        drone = Drone.objects.get()
+        self.assertEqual(drone.state, 'LOADED')
+        self.assertEqual(drone.current_medication_weight, 20.0)
+        self.assertEqual(drone.medications.count(), 2)
+
+    def test_load_rejects_medications_over_weight_limit(self):
+        response = self.load([med.pk for med in self.medications])
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(response.data['data']['accepted']), 10)
+        self.assertEqual(
+            [item['reason'] for item in response.data['data']['rejected']],
+            ['over_weight_limit', 'over_weight_limit']
+        )
+        self.assertEqual(Drone.objects.get().current_medication_weight, 100)
+
+    def test_load_runs_constant_number_of_queries(self):
+        with self.assertNumQueries(7):
+            self.load([self.medications[0].pk])
+
+        Drone.objects.filter(pk=self.drone.pk).update(state='IDLE')
+        self.drone.medications.clear()
+        with self.assertNumQueries(7):
+            self.load([med.pk for med in self.medications])
+
+    def test_load_retries_when_drone_changes_concurrently(self):
+        plan_load = loading.plan_load
+        calls = []
+
+        def plan_load_with_concurrent_write(drone, *args):
+            calls.append(drone.version)
+            if len(calls) == 1:
+                Drone.objects.filter(pk=drone.pk).update(version=5)
+            return plan_load(drone, *args)
+
+        with mock.patch(
+            'drones.loading.plan_load', plan_load_with_concurrent_write
+        ):
+            response = self.load([self.medications[0].pk])
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(calls, [0, 5])
+        drone = Drone.objects.get()
+        self.assertEqual(drone.version, 6)
+        self.assertEqual(drone.current_medication_weight, 10.0)
+
+    def test_load_conflict_after_bounded_retries(self):
+        plan_load = loading.plan_load
+
+        def plan_load_with_concurrent_write(drone, *args):
+            Drone.objects.filter(pk=drone.pk).update(version=F('version') + 1)
+            return plan_load(drone, *args)
+
+        with mock.patch(
+            'drones.loading.plan_load', plan_load_with_concurrent_write
+        ):
+            response = self.load([self.medications[0].pk])
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        drone = Drone.objects.get()
+        self.assertEqual(drone.state, 'IDLE')
+        self.assertEqual(drone.medications.count(), 0)
+
+    def test_packing_maximizes_priority_within_weight_limit(self):
+        heavy = Medication.objects.create(
+            name='heavy', weight=60.0, code='HEAVY_001'
+        )
+        light = [
+            Medication.objects.create(
+                name=f'light{index}', weight=45.0, code=f'LIGHT_{index:03}'
+            )
+            for index in range(2)
+        ]
+        data = {
+            'medications': [
+                {'id': heavy.pk, 'priority': 5},
+                {'id': light[0].pk, 'priority': 3},
+                {'id': light[1].pk, 'priority': 3},
+            ],
+            'packing': 'priority',
+        }
+        url = reverse(
+            'load-drone-with-medication',
+            kwargs={'drone_id': self.drone.pk}
+        )
+        response = self.client.post(url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(
+            response.data['data']['accepted'], [light[0].pk, light[1].pk]
+        )
+        self.assertEqual(response.data['data']['rejected'], [
+            {'medication': heavy.pk, 'reason': 'over_weight_limit'},
+        ])
+        self.assertEqual(Drone.objects.get().current_medication_weight, 90)
+
+    def test_unknown_packing_is_refused(self):
+        medication = Medication.objects.create(
+            name='med', weight=10.0, code='PACKING_001'
+        )
+        response = self.client.post(
+            reverse(
+                'load-drone-with-medication',
+                kwargs={'drone_id': self.drone.pk}
+            ),
+            {'medications': [medication.pk], 'packing': 'volume'},
+            format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('priority, weight', response.data['message'])
+        self.assertEqual(Drone.objects.get().medications.count(), 0)
+
+
+class PackingTests(TestCase):
+    def test_solve_knapsack_finds_optimal_subset(self):
+        items = [('a', 5, 10), ('b', 4, 40), ('c', 6, 30), ('d', 3, 50)]
+        chosen, optimal = solve_knapsack(items, 10)
+        self.assertTrue(optimal)
+        self.assertEqual(sorted(chosen), ['b', 'd'])
+
+    def test_solve_knapsack_skips_items_that_never_fit(self):
+        chosen, optimal = solve_knapsack([('a', 11, 100), ('b', 2, 1)], 10)
+        self.assertTrue(optimal)
+        self.assertEqual(chosen, ['b'])
+
+    def test_solve_knapsack_returns_best_found_when_out_of_time(self):
+        items = [(index, 1 + index % 7, 1 + index % 5) for index in range(60)]
+        chosen, _ = solve_knapsack(items, 100, time_budget=0)
+        self.assertLessEqual(sum(items[key][1] for key in chosen), 100)
+        self.assertTrue(chosen)
+
+
+class AssignmentTests(APITestCase):
+    def setUp(self):
+        self.drones = [
+            Drone.objects.create(
+                serial_number=f'ASSIGN{index:04}',
+                battery_capacity=100,
+                weight_limit=100,
+            )
+            for index in range(3)
+        ]
+        Drone.objects.create(
+            serial_number='ASSIGNLOW', battery_capacity=10, weight_limit=500
+        )
+        self.heavy = Medication.objects.create(
+            name='heavy', weight=60.0, code='HEAVY_001'
+        )
+        self.medium = Medication.objects.create(
+            name='medium', weight=40.0, code='MEDIUM_001'
+        )
+        self.light = Medication.objects.create(
+            name='light', weight=30.0, code='LIGHT_001'
+        )
+        self.url = reverse('assign-order-to-drones')
+
+    def test_assign_order_uses_fewest_drones(self):
+        data = {'items': [
+            {'medication': self.light.pk},
+            {'medication': self.medium.pk, 'quantity': 2},
+            {'medication': self.heavy.pk},
+        ]}
+        response = self.client.post(self.url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['data']['drones_dispatched'], 2)
+        self.assertEqual(response.data['data']['unassigned'], [])
+        first, second = self.drones[0], self.drones[1]
+        self.assertEqual(
+            set(first.medications.values_list('pk', flat=True)),
+            {self.heavy.pk, self.medium.pk}
+        )
+        self.assertEqual(
+            set(second.medications.values_list('pk', flat=True)),
+            {self.medium.pk, self.light.pk}
+        )
+        first.refresh_from_db()
+        self.assertEqual(first.state, 'LOADED')
+        self.assertEqual(first.current_medication_weight, 100)
+        self.assertEqual(
+            Drone.objects.get(serial_number='ASSIGNLOW').state, 'IDLE'
+        )
+
+    def test_assign_order_reports_unassigned_items(self):
+        data = {'items': [
+            {'medication': self.heavy.pk, 'quantity': 4},
+            {'medication': 9999},
+            {'medication': self.light.pk, 'quantity': 0},
+        ]}
+        response = self.client.post(self.url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['data']['drones_dispatched'], 3)
+        self.assertEqual(response.data['data']['unassigned'], [
+            {'medication': self.light.pk, 'quantity': 1,
+             'reason': 'invalid_quantity'},
+            {'medication': 9999, 'quantity': 1, 'reason': 'not_found'},
+            {'medication': self.heavy.pk, 'quantity': 1,
+             'reason': 'no_capacity'},
+        ])
+
+    def test_assign_order_refuses_oversized_quantities(self):
+        data = {'items': [
+            {'medication': self.light.pk, 'quantity': 10 ** 9},
+            {'medication': self.medium.pk, 'quantity': 1000},
+            {'medication': self.heavy.pk, 'quantity': 1000},
+        ]}
+        with mock.patch('drones.assignment.MAX_ORDER_UNITS', 1500):
+            response = self.client.post(self.url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        unassigned = response.data['data']['unassigned']
+        self.assertEqual(unassigned[:2], [
+            {'medication': self.light.pk, 'quantity': 10 ** 9,
+             'reason': 'invalid_quantity'},
+            {'medication': self.heavy.pk, 'quantity': 1000,
+             'reason': 'invalid_quantity'},
+        ])
+        self.assertTrue(all(
+            item['medication'] == self.medium.pk
+            for item in unassigned[2:]
+        ))
+
+    # Units that cannot fit are settled without scanning the drones again
+    def test_plan_assignment_skips_units_that_cannot_fit(self):
+        def drones(count, capacity):
+            return [
+                SimpleNamespace(pk=index, remaining_capacity=capacity)
+                for index in range(count)
+            ]
+
+        medications = {
+            self.heavy.pk: self.heavy, self.light.pk: self.light
+        }
+        with mock.patch(
+            'drones.assignment._place', wraps=assignment._place
+        ) as place:
+            assignments, unassigned = assignment.plan_assignment(
+                drones(3, 100.0), medications, {self.light.pk: 10}, set()
+            )
+            # One unit per drone, then one scan finds no drone left
+            self.assertEqual(place.call_count, 4)
+            place.reset_mock()
+            assignment.plan_assignment(
+                drones(1000, 50.0), medications, {self.heavy.pk: 1000}, set()
+            )
+            self.assertEqual(place.call_count, 0)
+        self.assertEqual(sorted(assignments), [0, 1, 2])
+        self.assertEqual(unassigned, [
+            {'medication': self.light.pk, 'quantity': 7,
+             'reason': 'no_capacity'},
+        ])
+
+
+class QueryCountTests(APITestCase):
+    def setUp(self):
+        medications = [
+            Medication.objects.create(
+                name=f'med{index}', weight=1.0, code=f'QUERY_{index:03}'
+            )
+            for index in range(3)
+        ]
+        for index in range(12):
+            drone = Drone.objects.create(
+                serial_number=f'QUERY{index:04}', battery_capacity=100
+            )
+            drone.medications.add(*medications)
+        self.drone = drone
+
+    def assertListQueries(self, url, expected):
+        for page_size in (2, 10):
+            with self.assertNumQueries(expected):
+                response = self.client.get(url, {'page_size': page_size})
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    # Drone lists run two validator aggregates before the page queries
+    def test_get_all_drones_query_count(self):
+        self.assertListQueries(reverse('get-all-drones'), 5)
+
+    def test_get_available_drones_query_count(self):
+        self.assertListQueries(reverse('get-available-drones'), 5)
+
+    def test_get_loaded_medication_query_count(self):
+        self.assertListQueries(
+            reverse(
+                'get-loaded-medication', kwargs={'drone_id': self.drone.pk}
+            ),
+            4
+        )
+
+    def test_get_available_drones_filters_in_database(self):
+        Drone.objects.create(serial_number='LOWBATTERY', battery_capacity=24)
+        Drone.objects.create(
+            serial_number='FULL', battery_capacity=100,
+            weight_limit=100, current_medication_weight=100
+        )
+        Drone.objects.create(
+            serial_number='BUSY', battery_capacity=100, state='LOADED'
+        )
+        response = self.client.get(
+            reverse('get-available-drones'), {'page_size': 100}
+        )
+        serial_numbers = {
+            drone['serial_number']
+            for drone in response.data['results']['data']
+        }
+        self.assertEqual(response.data['count'], 12)
+        self.assertFalse(serial_numbers & {'LOWBATTERY', 'FULL', 'BUSY'})
+
+    def test_cursor_pagination_walks_all_drones(self):
+        serial_numbers = []
+        url = reverse('get-all-drones') + '?pagination=cursor&page_size=5'
+        while url:
+            with self.assertNumQueries(4):
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertNotIn('count', response.data)
+            serial_numbers.extend(
+                drone['serial_number']
+                for drone in response.data['results']['data']
+            )
+            url = response.data['next']
+        self.assertEqual(
+            serial_numbers, [f'QUERY{index:04}' for index in range(12)]
+        )
+
+
+class ConditionalGetTests(APITestCase):
+    def setUp(self):
+        self.medication = Medication.objects.create(
+            name='med', weight=10.0, code='COND_001'
+        )
+        self.drone = Drone.objects.create(
+            serial_number='COND0001', battery_capacity=100
+        )
+
+    # A 304 costs only the validator queries, never the page queries
+    def assertNotModifiedUntilChanged(self, url, change, queries=2):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        etag = response.headers['ETag']
+
+        with self.assertNumQueries(queries):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response.headers['ETag'], etag)
+
+        change()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response.headers['ETag'], etag)
+
+    def test_all_drones_change_when_a_drone_is_added(self):
+        self.assertNotModifiedUntilChanged(
+            reverse('get-all-drones'),
+            lambda: Drone.objects.create(
+                serial_number='COND0002', battery_capacity=100
+            )
+        )
+
+    def test_available_drones_change_when_a_drone_is_loaded(self):
+        self.assertNotModifiedUntilChanged(
+            reverse('get-available-drones'),
+            lambda: loading.reserve_and_load(
+                self.drone.pk, [self.medication.pk]
+            )
+        )
+
+    def test_loaded_medication_changes_when_a_medication_is_edited(self):
+        self.drone.medications.add(self.medication)
+
+        def rename():
+            self.medication.name = 'renamed'
+            self.medication.save()
+
+        self.assertNotModifiedUntilChanged(
+            reverse(
+                'get-loaded-medication', kwargs={'drone_id': self.drone.pk}
+            ),
+            rename,
+            queries=1
+        )
+
+    def test_all_drones_change_when_a_drone_is_deleted(self):
+        self.assertNotModifiedUntilChanged(
+            reverse('get-all-drones'), self.drone.delete
+        )
+
+    # Without Last-Modified, If-Modified-Since alone never earns a 304, so
+    # deletes and updates within the same second are never missed
+    def test_if_modified_since_alone_is_not_trusted(self):
+        url = reverse('get-all-drones')
+        response = self.client.get(url)
+        self.assertNotIn('Last-Modified', response.headers)
+        since = http_date(time.time() + 60)
+
+        Drone.objects.create(serial_number='COND0002', battery_capacity=100)
+        self.drone.delete()
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=since)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [
+                drone['serial_number']
+                for drone in response.data['results']['data']
+            ],
+            ['COND0002']
+        )
+
+        Drone.objects.filter(serial_number='COND0002').update(
+            battery_capacity=50, updated_at=timezone.now()
+        )
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=since)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            response.data['results']['data'][0]['battery_capacity'], 50
+        )
+
+
+class DroneEventTests(APITestCase):
+    def setUp(self):
+        self.drone = Drone.objects.create(
+            serial_number='EVENT0001', battery_capacity=100
+        )
+
+    def event_fields(self):
+        return list(DroneEvent.objects.order_by('pk').values_list(
+            'state', 'battery_capacity', 'previous_state',
+            'previous_battery_capacity'
+        ))
+
+    def test_state_and_battery_changes_are_recorded(self):
+        self.drone.model = 'Heavyweight'
+        self.drone.save()
+        drone = Drone.objects.get(pk=self.drone.pk)
+        drone.battery_capacity = 80
+        drone.save()
+        Drone.objects.only('pk', 'model').get(pk=drone.pk).save()
+        self.assertEqual(self.event_fields(), [
+            ('IDLE', 100, '', None),
+            ('IDLE', 80, 'IDLE', 100),
+        ])
+
+    def test_loading_records_the_transition(self):
+        medication = Medication.objects.create(
+            name='med', weight=10.0, code='EVENT_001'
+        )
+        loading.reserve_and_load(self.drone.pk, [medication.pk])
+        self.assertEqual(
+            self.event_fields()[-1], ('LOADED', 100, 'IDLE', 100)
+        )
+
+    def test_long_poll_returns_events_after_sequence(self):
+        first = DroneEvent.objects.get()
+        self.drone.state = 'LOADING'
+        self.drone.save()
+
+        response = self.client.get(
+            reverse('get-drone-events'), {'after': first.pk, 'timeout': 0}
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        events = response.data['data']['events']
+        self.assertEqual(
+            [(event['state'], event['previous_state']) for event in events],
+            [('LOADING', 'IDLE')]
+        )
+        self.assertEqual(
+            response.data['data']['last_sequence'], events[0]['sequence']
+        )
+
+        response = self.client.get(
+            reverse('get-drone-events'), {'timeout': 0}
+        )
+        self.assertEqual(response.data['data']['events'], [])
+        self.assertEqual(
+            response.data['data']['last_sequence'], events[0]['sequence']
+        )
+
+    def test_long_poll_rejects_invalid_parameters(self):
+        response = self.client.get(
+            reverse('get-drone-events'), {'timeout': 60}
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    async def test_stream_sends_events_after_last_event_id(self):
+        response = await self.async_client.get(
+            reverse('stream-drone-events'), headers={'Last-Event-ID': '0'}
+        )
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        message = await anext(aiter(response.streaming_content))
+        self.assertTrue(message.startswith(b'id: '))
+        self.assertIn(b'"serial_number": "EVENT0001"', message)
+
+    def test_stream_is_refused_outside_asgi(self):
+        response = self.client.get(reverse('stream-drone-events'))
+        self.assertEqual(
+            response.status_code, status.HTTP_501_NOT_IMPLEMENTED
+        )
+
+    async def test_stream_ends_after_its_maximum_age(self):
+        messages = [
+            message async for message in events.stream_events(0, max_age=0.5)
+        ]
+        self.assertEqual(len(messages), 1)
+
+
+class DroneStateTests(APITestCase):
+    def setUp(self):
+        self.loaded = [
+            Drone.objects.create(
+                serial_number=f'STATE{index:04}', battery_capacity=100,
+                state='LOADED'
+            )
+            for index in range(3)
+        ]
+        self.idle = Drone.objects.create(
+            serial_number='STATE0100', battery_capacity=100
+        )
+
+    def loading(self):
+        response = self.transition(self.idle, 'LOADING')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return Drone.objects.get(pk=self.idle.pk)
+
+    def transition(self, drone, state):
+        return self.client.post(
+            reverse('transition-drone', kwargs={'drone_id': drone.pk}),
+            {'state': state}, format='json'
+        )
+
+    # LOADED is reached only by loading medications
+    def test_empty_drones_cannot_be_moved_to_loaded(self):
+        response = self.transition(self.idle, 'LOADED')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        drone = self.loading()
+        response = self.transition(drone, 'LOADED')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.post(reverse('transition-drones'), {
+            'drones': [drone.pk], 'state': 'LOADED'
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        drone.refresh_from_db()
+        self.assertEqual((drone.state, drone.medication_count), ('LOADING', 0))
+
+    def test_loading_drones_can_be_loaded(self):
+        drone = self.loading()
+        medication = Medication.objects.create(
+            name='med', weight=10.0, code='STATE_004'
+        )
+        response = self.client.post(
+            reverse(
+                'load-drone-with-medication', kwargs={'drone_id': drone.pk}
+            ),
+            {'medications': [medication.pk]}, format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        drone.refresh_from_db()
+        self.assertEqual((drone.state, drone.medication_count), ('LOADED', 1))
+        self.assertEqual(
+            DroneEvent.objects.filter(drone=drone).values_list(
+                'previous_state', 'state'
+            ).last(),
+            ('LOADING', 'LOADED')
+        )
+
+    def test_drone_completes_a_delivery_round_trip(self):
+        drone = self.loaded[0]
+        drone.medications.add(Medication.objects.create(
+            name='med', weight=10.0, code='STATE_003'
+        ))
+        response = self.transition(drone, 'DELIVERING')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        drone.refresh_from_db()
+        self.assertEqual(
+            (drone.current_medication_weight, drone.medication_count),
+            (10.0, 1)
+        )
+        for state in ('DELIVERED', 'RETURNING', 'IDLE'):
+            response = self.transition(drone, state)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(response.data['data']['state'], state)
+        self.assertEqual(
+            list(DroneEvent.objects.filter(drone=drone).order_by(
+                'pk'
+            ).values_list('previous_state', 'state')),
+            [('', 'LOADED'), ('LOADED', 'DELIVERING'),
+             ('DELIVERING', 'DELIVERED'), ('DELIVERED', 'RETURNING'),
+             ('RETURNING', 'IDLE')]
+        )
+        drone.refresh_from_db()
+        self.assertEqual((drone.state, drone.version), ('IDLE', 4))
+        self.assertEqual(
+            (drone.current_medication_weight, drone.medication_count),
+            (0, 0)
+        )
+
+    def test_invalid_transitions_are_refused(self):
+        response = self.transition(self.idle, 'DELIVERED')
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(
+            response.data['data']['reason'], states.INVALID_TRANSITION
+        )
+        self.assertEqual(
+            self.transition(self.idle, 'FLYING').status_code,
+            status.HTTP_400_BAD_REQUEST
+        )
+        response = self.client.post(
+            reverse('transition-drone', kwargs={'drone_id': 9999}),
+            {'state': 'IDLE'}, format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(Drone.objects.get(pk=self.idle.pk).state, 'IDLE')
+
+    def test_wave_moves_drones_in_expected_state(self):
+        wave = [drone.pk for drone in self.loaded] + [self.idle.pk, 9999]
+        with self.assertNumQueries(6):
+            response = self.client.post(reverse('transition-drones'), {
+                'drones': wave, 'state': 'IDLE', 'from_state': 'LOADED'
+            }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [move['drone'] for move in response.data['data']['transitioned']],
+            wave[:3]
+        )
+        self.assertEqual(response.data['data']['rejected'], [
+            {'drone': self.idle.pk, 'state': 'IDLE',
+             'reason': states.UNEXPECTED_STATE},
+            {'drone': 9999, 'state': None, 'reason': states.NOT_FOUND},
+        ])
+        self.assertEqual(
+            Drone.objects.filter(state='IDLE').count(), 4
+        )
+
+    def test_wave_leaves_drones_moved_concurrently(self):
+        can_transition = states.can_transition
+        raced = self.loaded[1]
+
+        def move_concurrently(source, target):
+            Drone.objects.filter(pk=raced.pk).update(state='IDLE')
+            return can_transition(source, target)
+
+        with mock.patch.object(
+            states, 'can_transition', side_effect=move_concurrently
+        ):
+            transitioned, rejected = states.transition_drones(
+                [drone.pk for drone in self.loaded], 'DELIVERING'
+            )
+        self.assertEqual(
+            [move['drone'] for move in transitioned],
+            [self.loaded[0].pk, self.loaded[2].pk]
+        )
+        self.assertEqual(rejected, [
+            {'drone': raced.pk, 'state': 'LOADED', 'reason': states.CONFLICT}
+        ])
+        self.assertEqual(Drone.objects.get(pk=raced.pk).state, 'IDLE')
+
+    def test_delivered_drone_is_unloaded_and_available_again(self):
+        medication = Medication.objects.create(
+            name='med', weight=100.0, code='STATE_001'
+        )
+        loading.reserve_and_load(self.idle.pk, [medication.pk])
+        self.transition(self.idle, 'DELIVERING')
+
+        response = self.client.post(
+            reverse('complete-delivery', kwargs={'drone_id': self.idle.pk})
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.idle.refresh_from_db()
+        self.assertEqual(
+            (self.idle.state, self.idle.current_medication_weight),
+            ('DELIVERED', 0)
+        )
+        self.assertFalse(self.idle.medications.exists())
+        self.assertNotIn(self.idle, available_drones())
+
+        response = self.client.post(
+            reverse('return-drone', kwargs={'drone_id': self.idle.pk})
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn(self.idle, available_drones())
+
+    def test_delivery_cannot_complete_before_the_drone_flies(self):
+        response = self.client.post(reverse(
+            'complete-delivery', kwargs={'drone_id': self.loaded[0].pk}
+        ))
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+
+    def test_wave_of_drones_is_returned_unloaded(self):
+        medication = Medication.objects.create(
+            name='med', weight=100.0, code='STATE_002'
+        )
+        for drone in self.loaded:
+            drone.medications.add(medication)
+        Drone.objects.filter(state='LOADED').update(
+            current_medication_weight=100
+        )
+        wave = [drone.pk for drone in self.loaded] + [self.idle.pk]
+
+        with self.assertNumQueries(6):
+            response = self.client.post(
+                reverse('return-drones'), {'drones': wave}, format='json'
+            )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['data']['transitioned']), 3)
+        self.assertEqual(
+            response.data['data']['rejected'][0]['reason'],
+            states.INVALID_TRANSITION
+        )
+        self.assertFalse(Drone.medications.through.objects.exists())
+        self.assertEqual(available_drones().count(), 4)
+        self.assertEqual(
+            self.client.post(
+                reverse('complete-deliveries'), {'drones': 'all'},
+                format='json'
+            ).status_code,
+            status.HTTP_400_BAD_REQUEST
+        )
+
+    def test_drones_list_filters_on_state(self):
+        response = self.client.get(reverse('get-all-drones') + '?state=IDLE')
+        self.assertEqual(
+            [
+                drone['serial_number']
+                for drone in response.data['results']['data']
+            ],
+            ['STATE0100']
+        )
+
+
+class PayloadTests(APITestCase):
+    def setUp(self):
+        self.medications = [
+            Medication.objects.create(
+                name=f'med{index}', weight=weight, code=f'PAYLOAD_{index}'
+            )
+            for index, weight in enumerate((10.0, 25.5, 40.0))
+        ]
+        self.drone = Drone.objects.create(
+            serial_number='PAYLOAD001', battery_capacity=100
+        )
+
+    def assertPayload(self, drone, weight, count):
+        drone = Drone.objects.get(pk=drone.pk)
+        self.assertEqual(
+            (drone.current_medication_weight, drone.medication_count),
+            (weight, count)
+        )
+
+    def test_relation_managers_keep_the_payload_in_step(self):
+        first, second, third = self.medications
+        self.drone.medications.add(first, second)
+        self.assertEqual(self.drone.medication_count, 2)
+        self.assertPayload(self.drone, 35.5, 2)
+        self.drone.medications.remove(first)
+        self.assertPayload(self.drone, 25.5, 1)
+        third.drones.add(self.drone)
+        self.assertPayload(self.drone, 65.5, 2)
+        third.drones.clear()
+        self.assertPayload(self.drone, 25.5, 1)
+        self.drone.medications.clear()
+        self.assertPayload(self.drone, 0, 0)
+
+    def test_medication_changes_reach_the_drones_carrying_it(self):
+        first, second, _ = self.medications
+        self.drone.medications.add(first, second)
+        first.weight = 12.0
+        first.save()
+        self.assertPayload(self.drone, 37.5, 2)
+        second.delete()
+        self.assertPayload(self.drone, 12.0, 1)
+
+    def test_catalog_import_refreshes_drones_carrying_updated_medications(
+        self
+    ):
+        self.drone.medications.add(self.medications[0])
+        catalog.run_import(catalog.create_import([
+            {'name': 'med0', 'weight': 15, 'code': 'PAYLOAD_0'}
+        ]))
+        self.assertPayload(self.drone, 15.0, 1)
+
+    def test_reconcile_fixes_drifted_drones(self):
+        self.drone.medications.add(*self.medications)
+        in_step = Drone.objects.create(
+            serial_number='PAYLOAD002', battery_capacity=100
+        )
+        Drone.objects.filter(pk=self.drone.pk).update(
+            current_medication_weight=5, medication_count=9
+        )
+
+        output = io.StringIO()
+        call_command('reconcile_payloads', '--dry-run', stdout=output)
+        self.assertIn('PAYLOAD001: weight 5.0 -> 75.5', output.getvalue())
+        self.assertPayload(self.drone, 5, 9)
+
+        with self.assertNumQueries(2):
+            call_command('reconcile_payloads', stdout=io.StringIO())
+        self.assertPayload(self.drone, 75.5, 3)
+        self.assertPayload(in_step, 0, 0)
+
+
+class ExportTests(APITestCase):
+    def setUp(self):
+        medication = Medication.objects.create(
+            name='paracetamol', weight=12.0, code='PARR_00123'
+        )
+        loaded = Drone.objects.create(
+            serial_number='EXPORT0001', battery_capacity=80, state='LOADED'
+        )
+        loaded.medications.add(medication)
+        idle = Drone.objects.create(
+            serial_number='EXPORT0002', battery_capacity=20
+        )
+        DroneBatteryHistory.objects.bulk_create([
+            DroneBatteryHistory(
+                drone=loaded, battery_level=80, state='LOADED'
+            ),
+            DroneBatteryHistory(drone=idle, battery_level=20, state='IDLE'),
+        ])
+        self.url = reverse('export-fleet')
+
+    def export(self, **params):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return b''.join(response.streaming_content).decode()
+
+    def test_export_drones_as_ndjson(self):
+        rows = [
+            json.loads(line)
+            for line in self.export().splitlines()
+        ]
+        self.assertEqual(
+            [row['serial_number'] for row in rows],
+            ['EXPORT0001', 'EXPORT0002']
+        )
+        self.assertEqual(rows[0]['medications'], ['PARR_00123'])
+        self.assertEqual(rows[1]['medications'], [])
+
+    def test_export_battery_history_as_csv_filtered_by_state(self):
+        lines = self.export(
+            resource='battery-history', output='csv', state='IDLE'
+        ).splitlines()
+        self.assertEqual(len(lines), 2)
+        self.assertTrue(lines[0].startswith('id,drone_id,battery_level'))
+        self.assertIn(',20,False,IDLE,', lines[1])
+
+    def test_export_rejects_invalid_parameters(self):
+        response = self.client.get(self.url, {'from': 'yesterday'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class DroneCacheTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.drone = Drone.objects.create(
+            serial_number='CACHE0001', battery_capacity=90
+        )
+        self.url = reverse(
+            'check-drone-battery-level', kwargs={'drone_id': self.drone.pk}
+        )
+
+    def test_battery_level_is_served_from_cache(self):
+        self.client.get(self.url)
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url)
+        self.assertEqual(response.data['data']['battery_level'], 90)
+        self.assertEqual(cache_stats(), {'hits': 1, 'misses': 1})
+
+    def test_save_invalidates_cached_drone_on_commit(self):
+        self.client.get(self.url)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.drone.battery_capacity = 40
+            self.drone.save()
+            self.assertIsNotNone(
+                cache.get(drone_cache_key(self.drone.pk))
+            )
+        response = self.client.get(self.url)
+        self.assertEqual(response.data['data']['battery_level'], 40)
+
+    def test_load_invalidates_cached_drone(self):
+        medication = Medication.objects.create(
+            name='paracetamol', weight=12.0, code='PARR_00123'
+        )
+        self.client.get(self.url)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(
+                reverse(
+                    'load-drone-with-medication',
+                    kwargs={'drone_id': self.drone.pk}
+                ),
+                {'medications': [medication.pk]},
+                format='json'
+            )
+        response = self.client.get(self.url)
+        self.assertEqual(response.data['data']['drone_state'], 'LOADED')
+
+    def test_battery_level_of_missing_drone(self):
+        url = reverse('check-drone-battery-level', kwargs={'drone_id': 999})
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class BatteryHistoryTaskTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.drone = Drone.objects.create(
+            serial_number='HISTORY0001', battery_capacity=90
+        )
+
+    def test_delta_mode_records_only_changes(self):
+        check_drone_battery()
+        check_drone_battery()
+        self.assertEqual(DroneBatteryHistory.objects.count(), 1)
+
+        self.drone.battery_capacity = 20
+        self.drone.save()
+        check_drone_battery()
+        self.assertEqual(
+            list(DroneBatteryHistory.objects.order_by('pk').values_list(
+                'battery_level', 'sufficient_battery_capacity'
+            )),
+            [(90, True), (20, False)]
+        )
+
+    def test_delta_mode_records_heartbeat(self):
+        check_drone_battery()
+        later = timezone.now() + timedelta(
+            seconds=settings.DRONE_BATTERY_HISTORY_HEARTBEAT
+        )
+        with mock.patch('django.utils.timezone.now', return_value=later):
+            check_drone_battery()
+        self.assertEqual(DroneBatteryHistory.objects.count(), 2)
+
+    @override_settings(DRONE_BATTERY_HISTORY_MODE='full')
+    def test_full_mode_records_every_run(self):
+        check_drone_battery()
+        check_drone_battery()
+        self.assertEqual(DroneBatteryHistory.objects.count(), 2)
+
+    def test_sweep_reads_drones_in_chunks(self):
+        for index in range(4):
+            Drone.objects.create(
+                serial_number=f'HISTORY1{index:03}', battery_capacity=50
+            )
+        # Per chunk: read drones, write history, update discharge models
+        with self.assertNumQueries(9):
+            metrics = sweep_drone_batteries(chunk_size=2)
+        self.assertEqual(metrics['scanned'], 5)
+        self.assertEqual(metrics['written'], 5)
+        self.assertEqual(DroneBatteryHistory.objects.count(), 5)
+
+    def test_sweep_does_not_cache_stale_rows(self):
+        def load_during_sweep(rows, now):
+            # Another writer loads the drone after the sweep read it
+            Drone.objects.filter(pk=self.drone.pk).update(state='LOADED')
+            return update_discharge_models(rows, now)
+
+        with mock.patch(
+            'drones.tasks.update_discharge_models',
+            side_effect=load_during_sweep
+        ):
+            sweep_drone_batteries()
+        self.assertIsNone(cache.get(drone_cache_key(self.drone.pk)))
+        response = self.client.get(reverse(
+            'check-drone-battery-level', kwargs={'drone_id': self.drone.pk}
+        ))
+        self.assertEqual(response.data['data']['drone_state'], 'LOADED')
+
+    def test_shard_ranges_cover_all_drones(self):
+        first = self.drone.pk
+        for index in range(9):
+            Drone.objects.create(
+                serial_number=f'HISTORY2{index:03}', battery_capacity=50
+            )
+        self.assertEqual(
+            shard_ranges(3),
+            [(first, first + 4), (first + 4, first + 8), (first + 8, first + 10)]
+        )
+
+    @override_settings(DRONE_BATTERY_SWEEP_SHARDS=3)
+    def test_sharded_sweep_aggregates_shard_metrics(self):
+        for index in range(9):
+            Drone.objects.create(
+                serial_number=f'HISTORY3{index:03}', battery_capacity=50
+            )
+        with mock.patch(
+            'drones.tasks.aggregate_battery_sweep.run',
+            wraps=aggregate_battery_sweep.run
+        ) as aggregate:
+            self.assertEqual(check_drone_battery(), {'shards': 3})
+        self.assertEqual(DroneBatteryHistory.objects.count(), 10)
+        results = aggregate.call_args.args[0]
+        self.assertEqual(
+            sum(result['scanned'] for result in results), 10
+        )
+
+
+class BatteryRollupTests(TestCase):
+    def setUp(self):
+        self.drone = Drone.objects.create(
+            serial_number='ROLLUP0001', battery_capacity=90
+        )
+        self.day = datetime(2026, 1, 9, tzinfo=dt_timezone.utc)
+        for minutes, level in ((610, 80), (640, 60), (675, 50), (2170, 40)):
+            self.add_sample(self.day + timedelta(minutes=minutes), level)
+        self.now = self.day + timedelta(days=1, hours=12, minutes=30)
+
+    def add_sample(self, timestamp, level):
+        sample = DroneBatteryHistory.objects.create(
+            drone=self.drone, battery_level=level
+        )
+        DroneBatteryHistory.objects.filter(pk=sample.pk).update(
+            timestamp=timestamp
+        )
+
+    def test_rollups_compact_complete_hours_and_days(self):
+        self.assertEqual(rollup_hourly(self.now), 2)
+        self.assertEqual(rollup_daily(self.now), 1)
+        self.assertEqual(
+            list(DroneBatteryHourly.objects.order_by('bucket').values_list(
+                'bucket', 'samples', 'min_battery_level',
+                'avg_battery_level', 'max_battery_level'
+            )),
+            # Each level is weighted by how long it held; 11:00-11:15
+            # still holds the 60 carried in from 10:40
+            [
+                (self.day + timedelta(hours=10), 2, 60, 72.0, 80),
+                (self.day + timedelta(hours=11), 1, 50, 52.5, 60),
+            ]
+        )
+        daily = DroneBatteryDaily.objects.get()
+        self.assertEqual(daily.bucket, self.day)
+        self.assertEqual(daily.samples, 3)
+        # The mean of the hourly averages, each hour weighing the same
+        self.assertAlmostEqual(daily.avg_battery_level, 62.25)
+
+        # Rolling up again is idempotent
+        self.assertEqual(rollup_hourly(self.now), 1)
+        self.assertEqual(DroneBatteryHourly.objects.get(
+            bucket=self.day + timedelta(hours=11)
+        ).avg_battery_level, 52.5)
+        self.assertEqual(DroneBatteryHourly.objects.count(), 2)
+
+    @override_settings(DRONE_BATTERY_HISTORY_MODE='full')
+    def test_full_mode_rollups_average_samples(self):
+        rollup_hourly(self.now)
+        rollup_daily(self.now)
+        self.assertEqual(
+            list(DroneBatteryHourly.objects.order_by('bucket').values_list(
+                'min_battery_level', 'avg_battery_level', 'max_battery_level'
+            )),
+            [(60, 70.0, 80), (50, 50.0, 50)]
+        )
+        self.assertAlmostEqual(
+            DroneBatteryDaily.objects.get().avg_battery_level, 190 / 3
+        )
+
+    def test_retention_prunes_only_rolled_up_raw_samples(self):
+        self.assertEqual(
+            apply_retention(self.now), {'raw': 0, 'hourly': 0, 'events': 0}
+        )
+        rollup_hourly(self.now)
+        later = self.now + timedelta(days=30)
+        self.assertEqual(
+            apply_retention(later), {'raw': 2, 'hourly': 0, 'events': 0}
+        )
+        self.assertEqual(DroneBatteryHistory.objects.count(), 2)
+
+    def test_query_picks_resolution_for_range(self):
+        rollup_hourly(self.now)
+        resolution, rows = query_battery_history(
+            self.drone.pk, self.day, self.day + timedelta(days=7)
+        )
+        self.assertEqual(resolution, 'hour')
+        self.assertEqual(
+            [row[1:] for row in rows], [(60, 72.0, 80), (50, 52.5, 60)]
+        )
+        self.assertEqual(
+            pick_resolution(
+                self.now - timedelta(hours=6), self.now, now=self.now
+            ),
+            'raw'
+        )
+        self.assertEqual(
+            pick_resolution(self.day - timedelta(days=90), self.day), 'day'
+        )
+
+    def test_battery_history_endpoint_downsamples_range(self):
+        url = reverse(
+            'get-battery-history', kwargs={'drone_id': self.drone.pk}
+        )
+        response = self.client.get(url, {
+            'from': (self.day + timedelta(hours=10)).isoformat(),
+            'to': (self.day + timedelta(hours=12)).isoformat(),
+            'points': 1,
+            'resolution': 'raw',
+        })
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['data']['resolution'], 'raw')
+        self.assertEqual(response.data['data']['points'], [{
+            'timestamp': self.day + timedelta(hours=10),
+            'min': 50,
+            'avg': 190 / 3,
+            'max': 80,
+        }])
+
+    def test_battery_history_endpoint_validates_parameters(self):
+        url = reverse(
+            'get-battery-history', kwargs={'drone_id': self.drone.pk}
+        )
+        response = self.client.get(url, {'points': 0})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(url, {'from': 'not-a-date'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        url = reverse('get-battery-history', kwargs={'drone_id': 999})
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class DepletionTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.drone = Drone.objects.create(
+            serial_number='DEPLETE0001', battery_capacity=90
+        )
+
+    def test_discharge_rate_is_updated_incrementally(self):
+        now = timezone.now()
+        self.assertEqual(
+            update_discharge_rate(0, None, None, 90, now), (0, 90, now)
+        )
+        later = now + timedelta(minutes=10)
+        rate, level, sampled_at = update_discharge_rate(0, 90, now, 80, later)
+        self.assertAlmostEqual(rate, 0.3)
+        self.assertEqual((level, sampled_at), (80, later))
+        self.assertIsNone(update_discharge_rate(0.3, 80, later, 80, later))
+        # Recharging restarts the baseline but keeps the learned rate
+        self.assertEqual(
+            update_discharge_rate(0.3, 80, now, 100, later),
+            (0.3, 100, later)
+        )
+        self.assertEqual(minutes_to_reserve(85, 2), 30)
+        self.assertIsNone(minutes_to_reserve(85, 0))
+
+    def test_sweep_learns_discharge_rate(self):
+        start = timezone.now()
+        with mock.patch('django.utils.timezone.now', return_value=start):
+            sweep_drone_batteries()
+        Drone.objects.filter(pk=self.drone.pk).update(battery_capacity=70)
+        later = start + timedelta(minutes=5)
+        with mock.patch('django.utils.timezone.now', return_value=later):
+            sweep_drone_batteries()
+        self.drone.refresh_from_db()
+        self.assertAlmostEqual(self.drone.discharge_rate, 1.2)
+        response = self.client.get(reverse(
+            'check-drone-battery-level', kwargs={'drone_id': self.drone.pk}
+        ))
+        self.assertAlmostEqual(
+            response.data['data']['predicted_minutes_to_reserve'], 37.5
+        )
+
+    def test_available_drones_exclude_drones_that_cannot_finish_mission(self):
+        Drone.objects.create(
+            serial_number='DEPLETE0002', battery_capacity=90,
+            discharge_rate=3.0
+        )
+        self.assertEqual(
+            list(available_drones().values_list('serial_number', flat=True)),
+            ['DEPLETE0001']
+        )
+
+
+class BulkRegisterTests(APITestCase):
+    def setUp(self):
+        Drone.objects.create(serial_number='EXISTING', battery_capacity=100)
+        self.url = reverse('bulk-register-drones')
+        self.rows = [
+            {'serial_number': 'BULK0001', 'battery_capacity': 100},
+            {'serial_number': 'EXISTING', 'battery_capacity': 100},
+            {'serial_number': 'BULK0001', 'battery_capacity': 90},
+            {'serial_number': 'BULK0002'},
+            {'serial_number': 'BULK0003', 'battery_capacity': 50},
+        ]
+
+    def test_atomic_mode_registers_nothing_when_a_row_is_invalid(self):
+        response = self.client.post(self.url, self.rows, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(
+            [error['row'] for error in response.data['errors']], [1, 2, 3]
+        )
+        self.assertEqual(
+            response.data['errors'][0]['errors']['serial_number'],
+            ['drone with this serial number already exists.']
+        )
+        self.assertEqual(Drone.objects.count(), 1)
+
+    def test_best_effort_mode_registers_valid_rows(self):
+        # One uniqueness query, the drone and event INSERTs and the
+        # savepoint pair
+        with self.assertNumQueries(5):
+            response = self.client.post(
+                self.url + '?mode=best_effort', self.rows, format='json'
+            )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['data']['created'], 2)
+        self.assertEqual(
+            set(Drone.objects.values_list('serial_number', flat=True)),
+            {'EXISTING', 'BULK0001', 'BULK0003'}
+        )
+
+    def test_register_from_csv_upload(self):
+        upload = SimpleUploadedFile(
+            'drones.csv',
+            b'serial_number,model,weight_limit,battery_capacity\n'
+            b'CSV0001,Heavyweight,450,80\n'
+            b'CSV0002,,,60\n',
+            content_type='text/csv'
+        )
+        response = self.client.post(
+            self.url, {'file': upload}, format='multipart'
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        drone = Drone.objects.get(serial_number='CSV0002')
+        self.assertEqual(drone.model, 'Lightweight')
+        self.assertEqual(drone.weight_limit, 500)
+
+
+# Store the files a test uploads in a directory removed after the test
+def use_temporary_media_root(test):
+    media_root = tempfile.mkdtemp()
+    test.addCleanup(shutil.rmtree, media_root)
+    media = override_settings(MEDIA_ROOT=media_root)
+    media.enable()
+    test.addCleanup(media.disable)
+
+
+def png_image(color='red', size=(4, 4)):
+    image = io.BytesIO()
+    Image.new('RGB', size, color).save(image, format='PNG')
+    return image.getvalue()
+
+
+class MedicationImportTests(APITestCase):
+    def setUp(self):
+        use_temporary_media_root(self)
+        Medication.objects.create(name='old', weight=1, code='ASPIRIN')
+
+    def image_archive(self):
+        archive = io.BytesIO()
+        with zipfile.ZipFile(archive, 'w') as images:
+            images.writestr('aspirin.png', png_image())
+            images.writestr('broken.png', b'not an image')
+        return SimpleUploadedFile(
+            'images.zip', archive.getvalue(), content_type='application/zip'
+        )
+
+    def test_import_catalog_with_images(self):
+        upload = SimpleUploadedFile(
+            'catalog.csv',
+            b'name,weight,code,image\n'
+            b'aspirin,5,ASPIRIN,aspirin.png\n'
+            b'ibuprofen,7,IBUPROFEN,\n'
+            b'broken,2,BROKEN,broken.png\n'
+            b'missing,2,MISSING,missing.png\n'
+            b'bad name,2,BAD,\n',
+            content_type='text/csv'
+        )
+        response = self.client.post(
+            reverse('import-medications'),
+            {'file': upload, 'images': self.image_archive()},
+            format='multipart'
+        )
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+
+        response = self.client.get(reverse(
+            'get-medication-import', args=[response.data['data']['id']]
+        ))
+        progress = response.data['data']
+        self.assertEqual(progress['status'], 'COMPLETED')
+        self.assertEqual(progress['processed_rows'], 5)
+        self.assertEqual(
+            (progress['created'], progress['updated'], progress['failed']),
+            (1, 1, 3)
+        )
+        self.assertEqual(
+            [error['row'] for error in progress['errors']], [2, 3, 4]
+        )
+
+        aspirin = Medication.objects.get(code='ASPIRIN')
+        self.assertEqual((aspirin.name, aspirin.weight), ('aspirin', 5))
+        self.assertTrue(aspirin.image.name.startswith('medication_images/'))
+        self.assertTrue(os.path.exists(aspirin.image.path))
+        self.assertEqual(Medication.objects.get(code='IBUPROFEN').image, '')
+        self.assertFalse(
+            Medication.objects.filter(code__in=['BROKEN', 'MISSING']).exists()
+        )
+
+    def test_import_rejects_empty_catalog(self):
+        response = self.client.post(
+            reverse('import-medications'), [], format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_interrupted_import_resumes_from_last_chunk(self):
+        rows = [
+            {'name': f'med{index}', 'weight': 1, 'code': f'MED{index}'}
+            for index in range(5)
+        ]
+        medication_import = catalog.create_import(rows)
+        original = catalog.import_chunk
+        calls = []
+
+        def fail_on_second_chunk(*args):
+            calls.append(args[1])
+            if len(calls) == 2:
+                raise RuntimeError('worker lost')
+            return original(*args)
+
+        with mock.patch.object(catalog, 'MEDICATION_IMPORT_CHUNK_SIZE', 2):
+            with mock.patch.object(
+                catalog, 'import_chunk', fail_on_second_chunk
+            ):
+                with self.assertRaises(RuntimeError):
+                    catalog.run_import(medication_import)
+            medication_import.refresh_from_db()
+            self.assertEqual(medication_import.status, 'FAILED')
+            self.assertEqual(medication_import.processed_rows, 2)
+
+            progress = []
+            catalog.run_import(
+                medication_import,
+                lambda current: progress.append(current.processed_rows)
+            )
+
+        self.assertEqual(progress, [4, 5])
+        self.assertEqual(medication_import.status, 'COMPLETED')
+        self.assertEqual(medication_import.created_count, 5)
+        self.assertEqual(Medication.objects.count(), 6)
+
+    def test_import_command(self):
+        path = os.path.join(settings.MEDIA_ROOT, 'catalog.json')
+        with open(path, 'w') as catalog_file:
+            json.dump([
+                {'name': 'aspirin', 'weight': 3, 'code': 'ASPIRIN'},
+                {'name': 'codeine', 'weight': 4, 'code': 'CODEINE'},
+            ], catalog_file)
+        output = io.StringIO()
+        call_command('import_medications', path, stdout=output)
+        self.assertIn('1 created, 1 updated, 0 failed', output.getvalue())
+        self.assertEqual(MedicationImport.objects.get().status, 'COMPLETED')
+        self.assertEqual(Medication.objects.get(code='ASPIRIN').weight, 3)
+
+
+class MedicationImageTests(APITestCase):
+    def setUp(self):
+        use_temporary_media_root(self)
+
+    def register(self, code, image):
+        return self.client.post(reverse('register-medication'), {
+            'name': 'paracetamol',
+            'weight': 12.0,
+            'code': code,
+            'image': SimpleUploadedFile('paracetamol.png', image),
+        }, format='multipart')
+
+    def test_identical_uploads_are_stored_once(self):
+        self.register('PAR_1', png_image())
+        self.register('PAR_2', png_image())
+        self.register('PAR_3', png_image('blue'))
+
+        first, second, third = Medication.objects.order_by('pk')
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertNotEqual(first.image.name, third.image.name)
+        self.assertRegex(
+            first.image.name, r'^medication_images/[0-9a-f]{2}/[0-9a-f]{64}\.png$'
+        )
+        stored = [
+            name for _, _, names in os.walk(
+                os.path.join(settings.MEDIA_ROOT, 'medication_images')
+            )
+            for name in names
+        ]
+        self.assertEqual(len(stored), 2)
+
+    def test_thumbnails_generated_after_upload(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.register('PAR_1', png_image(size=(1024, 256)))
+        medication = Medication.objects.get()
+
+        thumbnails = MedicationSerializer(medication).data['thumbnails']
+        self.assertEqual(set(thumbnails), {'128', '512'})
+        self.assertEqual(set(thumbnails['128']), {'webp', 'jpeg'})
+        with medication.image.storage.open(
+            medication.thumbnails['sizes']['128']['webp']
+        ) as thumbnail:
+            image = Image.open(thumbnail)
+            self.assertEqual((image.format, image.size), ('WEBP', (128, 32)))
+
+    def test_thumbnails_of_replaced_image_are_pending(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.register('PAR_1', png_image())
+        medication = Medication.objects.get()
+        Medication.objects.filter(pk=medication.pk).update(
+            image='medication_images/legacy.png'
+        )
+        medication.refresh_from_db()
+        self.assertIsNone(MedicationSerializer(medication).data['thumbnails'])
+
+        with open(medication.image.path, 'wb') as legacy:
+            legacy.write(png_image('green'))
+        self.assertEqual(generate_medication_thumbnails(), 1)
+        medication.refresh_from_db()
+        self.assertEqual(
+            medication.thumbnails['source'], 'medication_images/legacy.png'
+        )
+        self.assertEqual(generate_medication_thumbnails(), 0)
+
+
+class TelemetryTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        telemetry._buffer = None
+        self.addCleanup(setattr, telemetry, '_buffer', None)
+        self.first = Drone.objects.create(
+            serial_number='TELEMETRY1', battery_capacity=100
+        )
+        self.second = Drone.objects.create(
+            serial_number='TELEMETRY2', battery_capacity=100
+        )
+        self.now = timezone.now().replace(microsecond=0)
+        self.url = reverse('ingest-telemetry')
+
+    def reading(self, drone, battery, minutes_ago=0, **fields):
+        return {
+            'drone': drone.pk,
+            'battery_capacity': battery,
+            'timestamp': (
+                self.now - timedelta(minutes=minutes_ago)
+            ).isoformat(),
+            **fields,
+        }
+
+    def test_readings_are_buffered_then_flushed_in_bulk(self):
+        Drone.objects.filter(pk=self.first.pk).update(state='LOADED')
+        response = self.client.post(self.url, [
+            self.reading(self.first, 80, state='DELIVERING'),
+            self.reading(self.first, 90, minutes_ago=1),
+            self.reading(self.second, 50),
+            self.reading(self.second, 150),
+            {'drone': 9999, 'battery_capacity': 50},
+        ], format='json')
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response.data['data']['accepted'], 3)
+        self.assertEqual(
+            [error['row'] for error in response.data['data']['errors']],
+            [3, 4]
+        )
+        self.assertEqual(
+            Drone.objects.get(pk=self.first.pk).battery_capacity, 100
+        )
+
+        # Drone read, savepoint pair, drone UPDATE, history and event
+        # INSERTs and snapshot read, whatever the number of drones, plus a
+        # transition per reported state: savepoint pair, read, UPDATE and
+        # event INSERT
+        with self.assertNumQueries(12):
+            metrics = telemetry.flush_telemetry()
+        self.assertEqual(
+            (metrics['readings'], metrics['drones'], metrics['samples']),
+            (3, 2, 3)
+        )
+
+        first = Drone.objects.get(pk=self.first.pk)
+        self.assertEqual(
+            (first.battery_capacity, first.state), (80, 'DELIVERING')
+        )
+        self.assertEqual(first.discharge_rate, 3.0)
+        self.assertEqual(first.version, 1)
+        self.assertEqual(Drone.objects.get(pk=self.second.pk).version, 0)
+        history = DroneBatteryHistory.objects.filter(drone=first)
+        self.assertEqual(
+            list(history.order_by('timestamp').values_list(
+                'battery_level', 'timestamp'
+            )),
+            [(90, self.now - timedelta(minutes=1)), (80, self.now)]
+        )
+        events = DroneEvent.objects.filter(previous_battery_capacity=100)
+        self.assertEqual(
+            list(events.order_by('pk').values_list(
+                'drone_id', 'state', 'battery_capacity'
+            )),
+            [(self.first.pk, 'LOADED', 80), (self.second.pk, 'IDLE', 50)]
+        )
+        self.assertTrue(DroneEvent.objects.filter(
+            drone=first, previous_state='LOADED', state='DELIVERING'
+        ).exists())
+
+    def test_reported_states_follow_the_transition_table(self):
+        self.client.post(self.url, [
+            self.reading(self.first, 90, state='DELIVERED')
+        ], format='json')
+        telemetry.flush_telemetry()
+        self.assertEqual(Drone.objects.get(pk=self.first.pk).state, 'IDLE')
+
+    # A load committed between the flush's read and its write survives
+    def test_flush_does_not_revert_concurrent_loads(self):
+        medication = Medication.objects.create(
+            name='med', weight=10.0, code='TELEMETRY_1'
+        )
+        update_discharge_rate = telemetry.update_discharge_rate
+
+        def load_concurrently(*args):
+            loading.reserve_and_load(self.first.pk, [medication.pk])
+            return update_discharge_rate(*args)
+
+        self.client.post(
+            self.url, [self.reading(self.first, 90)], format='json'
+        )
+        with mock.patch.object(
+            telemetry, 'update_discharge_rate',
+            side_effect=load_concurrently
+        ):
+            telemetry.flush_telemetry()
+        first = Drone.objects.get(pk=self.first.pk)
+        self.assertEqual(
+            (first.state, first.battery_capacity,
+             first.current_medication_weight),
+            ('LOADED', 90, 10.0)
+        )
+        self.assertEqual(
+            self.client.get(reverse(
+                'check-drone-battery-level', kwargs={'drone_id': first.pk}
+            )).data['data']['drone_state'],
+            'LOADED'
+        )
+
+    def test_unchanged_readings_keep_updated_at(self):
+        updated_at = Drone.objects.get(pk=self.first.pk).updated_at
+        self.client.post(self.url, [
+            self.reading(self.first, 100), self.reading(self.second, 90),
+        ], format='json')
+        telemetry.flush_telemetry()
+        first = Drone.objects.get(pk=self.first.pk)
+        self.assertEqual(first.battery_sampled_at, self.now)
+        self.assertEqual(first.updated_at, updated_at)
+        self.assertGreater(
+            Drone.objects.get(pk=self.second.pk).updated_at, updated_at
+        )
+
+    def test_late_readings_do_not_overwrite_newer_ones(self):
+        self.client.post(
+            self.url, [self.reading(self.first, 70)], format='json'
+        )
+        telemetry.flush_telemetry()
+        self.client.post(
+            self.url, [self.reading(self.first, 75, minutes_ago=5)],
+            format='json'
+        )
+        telemetry.flush_telemetry()
+        self.assertEqual(
+            Drone.objects.get(pk=self.first.pk).battery_capacity, 70
+        )
+
+    def test_failed_flush_keeps_its_readings(self):
+        self.client.post(self.url, [
+            self.reading(self.first, 80), self.reading(self.second, 70)
+        ], format='json')
+        with mock.patch(
+            'drones.telemetry.write_readings',
+            side_effect=[RuntimeError('database unavailable')]
+        ), self.assertRaises(RuntimeError):
+            telemetry.flush_telemetry()
+        self.assertEqual(telemetry.get_telemetry_buffer().size(), 2)
+
+        metrics = telemetry.flush_telemetry()
+        self.assertEqual(metrics['readings'], 2)
+        self.assertEqual(telemetry.get_telemetry_buffer().size(), 0)
+        self.assertEqual(
+            Drone.objects.get(pk=self.second.pk).battery_capacity, 70
+        )
+
+    @override_settings(TELEMETRY_BUFFER_MAX_READINGS=2)
+    def test_full_buffer_refuses_readings(self):
+        response = self.client.post(self.url, [
+            self.reading(self.first, 90), self.reading(self.second, 90)
+        ], format='json')
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        response = self.client.post(
+            self.url, [self.reading(self.first, 80)], format='json'
+        )
+        self.assertEqual(
+            response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE
+        )
+        self.assertEqual(response['Retry-After'], '2')
+
+
+class AsyncReadTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.medication = Medication.objects.create(
+            name='med', weight=10.0, code='ASYNC_001'
+        )
+        self.drones = [
+            Drone.objects.create(
+                serial_number=f'ASYNC{index:04}', battery_capacity=100
+            )
+            for index in range(7)
+        ]
+        self.drones[0].medications.add(self.medication)
+
+    # Each async endpoint answers exactly like its sync counterpart
+    async def test_async_views_match_sync_views(self):
+        drone_id = self.drones[0].pk
+        for name, kwargs, query in (
+            ('check-drone-battery-level', {'drone_id': drone_id}, ''),
+            ('get-loaded-medication', {'drone_id': drone_id}, ''),
+            ('get-available-drones', {}, '?page=2'),
+            ('get-all-drones', {}, '?page_size=3&page=2'),
+            ('get-all-drones', {}, '?pagination=cursor&page_size=3'),
+        ):
+            expected = await sync_to_async(self.client.get)(
+                reverse(name, kwargs=kwargs) + query
+            )
+            response = await self.async_client.get(
+                reverse(f'{name}-async', kwargs=kwargs) + query
+            )
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            expected, actual = expected.json(), response.json()
+            for link in ('next', 'previous'):
+                if link in expected and expected[link]:
+                    expected[link] = expected[link].replace('/async', '')
+                    actual[link] = actual[link].replace('/async', '')
+            self.assertEqual(actual, expected)
+
+    async def test_cursor_pages_walk_all_drones_both_ways(self):
+        url = reverse('get-all-drones-async') + '?pagination=cursor&page_size=3'
+        serial_numbers, pages = [], []
+        while url:
+            response = await self.async_client.get(url)
+            page = response.json()
+            pages.append(page)
+            serial_numbers.extend(
+                drone['serial_number'] for drone in page['results']['data']
+            )
+            url = page['next']
+        self.assertEqual(
+            serial_numbers, [f'ASYNC{index:04}' for index in range(7)]
+        )
+
+        response = await self.async_client.get(pages[-1]['previous'])
+        self.assertEqual(
+            response.json()['results']['data'], pages[-2]['results']['data']
+        )
+
+    async def test_not_modified(self):
+        url = reverse('get-all-drones-async')
+        response = await self.async_client.get(url)
+        etag = response.headers['ETag']
+        response = await self.async_client.get(
+            url, headers={'If-None-Match': etag}
+        )
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    async def test_unknown_drone_and_method(self):
+        for name in (
+            'check-drone-battery-level-async', 'get-loaded-medication-async'
+        ):
+            response = await self.async_client.get(
+                reverse(name, kwargs={'drone_id': 9999})
+            )
+            self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        response = await self.async_client.post(
+            reverse('get-all-drones-async')
+        )
+        self.assertEqual(
+            response.status_code, status.HTTP_405_METHOD_NOT_ALLOWED
+        )
+
+
+class ReadLoadTestCommandTests(LiveServerTestCase):
+    def test_compares_both_paths(self):
+        drone = Drone.objects.create(
+            serial_number='LOAD0001', battery_capacity=100
+        )
+        output = io.StringIO()
+        call_command(
+            'loadtest_reads',
+            wsgi=self.live_server_url,
+            asgi=self.live_server_url,
+            drone=drone.pk,
+            endpoint=['battery-level', 'all-drones'],
+            requests=6,
+            concurrency=3,
+            stdout=output,
+        )
+        rows = output.getvalue().splitlines()[1:]
+        self.assertEqual(
+            [row.split()[:2] for row in rows],
+            [['battery-level', 'wsgi'], ['battery-level', 'asgi'],
+             ['all-drones', 'wsgi'], ['all-drones', 'asgi']]
+        )
+        self.assertEqual([row.split()[-1] for row in rows], ['0'] * 4)
@@ -1,4 +1,28 @@
-from rest_framework.pagination import PageNumberPagination
+import asyncio
+import hashlib
+import math
+from functools import wraps
+from http import HTTPStatus
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db.models import Count, F, Max, Prefetch
+from django.utils import timezone
+from django.http import JsonResponse
+from django.utils.cache import get_conditional_response
+from django.utils.dateparse import parse_datetime
+from django.utils.http import quote_etag
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import (
+    Cursor,
+    CursorPagination,
+    PageNumberPagination,
+)
+from rest_framework.request import Request
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+from drones.models import Drone, Medication
+
+# Minimum battery capacity (%) a drone needs to take a load
+MIN_BATTERY_CAPACITY = 25
 
 
 class ResultPagination(PageNumberPagination):
@@ -7,9 +31,135 @@ class ResultPagination(PageNumberPagination):
     max_page_size = 100
 
 
+# Keyset pagination on the primary key. Pages are fetched with
+# WHERE pk > cursor instead of COUNT(*) and OFFSET, so walking the whole
+# table stays linear.
+class ResultCursorPagination(CursorPagination):
+    page_size = 5
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    ordering = 'pk'
+
+
+# Clients pick cursor pagination with ?pagination=cursor
+def get_pagination(request):
+    if request.query_params.get('pagination') == 'cursor':
+        return ResultCursorPagination()
+    return ResultPagination()
+
+
+async def _apage_number(pagination, request, queryset, page_size):
+    count = await queryset.acount()
+    last_page = max(math.ceil(count / page_size), 1)
+    number = request.query_params.get(pagination.page_query_param, 1)
+    if number in pagination.last_page_strings:
+        number = last_page
+    try:
+        number = int(number)
+    except (TypeError, ValueError):
+        raise NotFound(pagination.invalid_page_message)
+    if not 1 <= number <= last_page:
+        raise NotFound(pagination.invalid_page_message)
+
+    start = (number - 1) * page_size
+    page = [obj async for obj in queryset[start:start + page_size]]
+    url = request.build_absolute_uri()
+    previous = None
+    if number == 2:
+        previous = remove_query_param(url, pagination.page_query_param)
+    elif number > 2:
+        previous = replace_query_param(
+            url, pagination.page_query_param, number - 1
+        )
+    return page, {
+        "count": count,
+        "next": replace_query_param(
+            url, pagination.page_query_param, number + 1
+        ) if number < last_page else None,
+        "previous": previous,
+    }
+
+
+# Keyset pages on the primary key, with the same cursors as
+# ResultCursorPagination so clients can switch between the two paths
+async def _acursor_page(pagination, request, queryset, page_size):
+    pagination.base_url = request.build_absolute_uri()
+    cursor = pagination.decode_cursor(request)
+    if cursor is None:
+        cursor = Cursor(offset=0, reverse=False, position=None)
+    if cursor.position is not None:
+        queryset = queryset.filter(**{
+            'pk__lt' if cursor.reverse else 'pk__gt': cursor.position
+        })
+    if cursor.reverse:
+        queryset = queryset.order_by('-pk')
+
+    page = [
+        obj async for obj in
+        queryset[cursor.offset:cursor.offset + page_size + 1]
+    ]
+    has_more = len(page) > page_size
+    page = page[:page_size]
+    if cursor.reverse:
+        page.reverse()
+
+    has_next = cursor.position is not None if cursor.reverse else has_more
+    has_previous = has_more if cursor.reverse else cursor.position is not None
+    return page, {
+        "next": pagination.encode_cursor(Cursor(
+            offset=0, reverse=False, position=str(page[-1].pk)
+        )) if has_next and page else None,
+        "previous": pagination.encode_cursor(Cursor(
+            offset=0, reverse=True, position=str(page[0].pk)
+        )) if has_previous and page else None,
+    }
+
+
+# One page of a queryset ordered by pk for async views, read with the async
+# ORM. Takes the same query parameters as get_pagination's paginators and
+# returns the page's objects with the count and links the paginated
+# response wraps the results in. Raises NotFound on an invalid page or
+# cursor.
+async def apaginate(request, queryset):
+    request = Request(request)
+    pagination = get_pagination(request)
+    page_size = pagination.get_page_size(request)
+    if isinstance(pagination, ResultCursorPagination):
+        return await _acursor_page(pagination, request, queryset, page_size)
+    return await _apage_number(pagination, request, queryset, page_size)
+
+
 # check if the battery capacity is of drone is at least 25%
 def healthy_battery(drone):
-    return drone.battery_capacity >= 25
+    return drone.battery_capacity >= MIN_BATTERY_CAPACITY
+
+
+# Drones that can take a load: IDLE, with spare capacity and a battery
+# predicted to stay healthy for a typical mission at the drone's estimated
+# discharge rate. Served by the (state, battery_capacity) index on Drone.
+def available_drones(queryset=None):
+    if queryset is None:
+        queryset = Drone.objects.all()
+    return queryset.filter(
+        state='IDLE',
+        battery_capacity__gte=MIN_BATTERY_CAPACITY,
+        current_medication_weight__lt=F('weight_limit'),
+    ).filter(
+        battery_capacity__gte=(
+            F('discharge_rate') * settings.DRONE_TYPICAL_MISSION_MINUTES
+            + MIN_BATTERY_CAPACITY
+        )
+    )
+
+
+# Drones, restricted to the state in the ?state= query parameter when
+# given. Served by the (state, id) index on Drone.
+def drones_in_state(params):
+    drones = Drone.objects.all()
+    state = params.get('state')
+    if state:
+        drones = drones.filter(state=state)
+    return drones
 
 
 # Check if the weight of medications is within the weight limit of the drone
@@ -18,3 +168,134 @@ def within_weight_limit(drone, med_weight):
         drone.current_medication_weight + med_weight
         <= drone.weight_limit
     )
+
+
+# Parse an ISO 8601 query parameter, reading naive values in the current
+# time zone. Returns None when the value is not a valid datetime.
+def parse_query_datetime(value):
+    try:
+        parsed = parse_datetime(value)
+    except ValueError:
+        return None
+    if parsed is not None and timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+# Prefetches for the relations a serializer declares in
+# prefetch_related_fields, each restricted to the nested serializer's fields
+def serializer_prefetches(serializer_class):
+    prefetches = []
+    for name in getattr(serializer_class, 'prefetch_related_fields', ()):
+        nested = serializer_class._declared_fields[name].child
+        prefetches.append(Prefetch(name, queryset=optimize_queryset(
+            nested.Meta.model.objects.all(), type(nested)
+        )))
+    return prefetches
+
+
+# Restrict a queryset to the columns a serializer renders and prefetch the
+# relations it nests, so list views run a fixed number of queries
+# regardless of page size
+def optimize_queryset(queryset, serializer_class):
+    concrete_fields = {
+        field.name for field in queryset.model._meta.concrete_fields
+    }
+    return queryset.only('pk', *[
+        name for name in serializer_class.Meta.fields
+        if name in concrete_fields
+    ]).prefetch_related(*serializer_prefetches(serializer_class))
+
+
+# ETag of a response rendered from the given (row count, latest
+# updated_at) pairs. Any insert, update or delete changes one of them.
+# No Last-Modified is derived from them: the latest updated_at does not
+# move when a row is deleted, and HTTP dates drop sub-second updates.
+def resource_etag(*versions):
+    return hashlib.md5(
+        repr(versions).encode(), usedforsecurity=False
+    ).hexdigest()
+
+
+def _version(queryset):
+    version = queryset.aggregate(count=Count('pk'), updated=Max('updated_at'))
+    return version['count'], version['updated']
+
+
+# ETag of a list of the given drones with their nested medications.
+# Medications are versioned as a whole table, which is cheaper than
+# joining them to the drones and only errs on the side of a full response.
+def drone_list_etag(drones):
+    return resource_etag(_version(drones), _version(Medication.objects))
+
+
+# ETag of the medications loaded on a drone, or None when the drone does
+# not exist
+def loaded_medication_etag(drone_id):
+    drone = Drone.objects.filter(pk=drone_id).values(
+        'pk', 'updated_at'
+    ).annotate(
+        loaded=Count('medications'),
+        loaded_updated=Max('medications__updated_at'),
+    ).order_by('pk').first()
+    if drone is None:
+        return None
+    return resource_etag(
+        (1, drone['updated_at']),
+        (drone['loaded'], drone['loaded_updated']),
+    )
+
+
+def _set_etag(response, etag):
+    if response.status_code in (200, 304):
+        response.headers.setdefault('ETag', etag)
+    return response
+
+
+# Answer GETs with 304 Not Modified when the client's If-None-Match still
+# matches. etag(request, *args, **kwargs) returns the current ETag from a
+# cheap aggregate query, so unchanged resources are never serialized.
+# Async views run it on the ORM's thread.
+def conditional(etag_func):
+    def decorator(view):
+        if asyncio.iscoroutinefunction(view):
+            @wraps(view)
+            async def async_wrapper(request, *args, **kwargs):
+                etag = await sync_to_async(etag_func)(
+                    request, *args, **kwargs
+                )
+                if etag is None:
+                    return await view(request, *args, **kwargs)
+                etag = quote_etag(etag)
+                response = get_conditional_response(request, etag=etag)
+                if response is None:
+                    response = await view(request, *args, **kwargs)
+                return _set_etag(response, etag)
+            return async_wrapper
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            etag = etag_func(request, *args, **kwargs)
+            if etag is None:
+                return view(request, *args, **kwargs)
+            etag = quote_etag(etag)
+            response = get_conditional_response(request, etag=etag)
+            if response is None:
+                response = view(request, *args, **kwargs)
+            return _set_etag(response, etag)
+        return wrapper
+    return decorator
+
+
+# Restrict an async view to GET (and HEAD), the async counterpart of
+# @api_view(['GET']) for views DRF cannot serve
+def async_get_view(view):
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            return JsonResponse(
+                {"status": "Error", "message": "Method not allowed"},
+                status=HTTPStatus.METHOD_NOT_ALLOWED
+            )
+        return await view(request, *args, **kwargs)
+    return wrapper
@@ -1,18 +1,77 @@
 from drones.serializers import MedicationSerializer, DroneSerializer
-from drones.models import Drone, Medication
+from drones.models import Drone, Medication, MedicationImport
+from drones.tasks import import_medication_catalog
+from drones.assignment import assign_order
+from drones.bulk import (
+    BULK_REGISTER_MAX_ROWS,
+    bulk_register_drones,
+    csv_rows,
+)
+from drones.cache import aget_drone_snapshot, get_drone_snapshot
+from drones.catalog import create_import, import_progress
+from drones.depletion import minutes_to_reserve
+from drones.history import (
+    DEFAULT_HISTORY_POINTS,
+    MAX_HISTORY_POINTS,
+    downsample,
+    query_battery_history,
+)
+from drones.events import (
+    latest_sequence,
+    parse_feed_params,
+    stream_events,
+    wait_for_events,
+)
+from drones.telemetry import (
+    TELEMETRY_MAX_READINGS_PER_REQUEST,
+    ingest_readings,
+    validate_readings,
+)
+from drones.export import (
+    BATTERY_HISTORY_EXPORT_FIELDS,
+    DRONE_EXPORT_FIELDS,
+    EXPORT_FORMATS,
+    battery_history_rows,
+    csv_lines,
+    drone_rows,
+    ndjson_lines,
+)
+from drones.states import (
+    MAX_TRANSITION_DRONES,
+    NOT_FOUND,
+    TRANSITION_TARGETS,
+    transition_drones,
+)
+from drones.loading import (
+    PACKING_OBJECTIVES,
+    ReservationConflict,
+    parse_requested_medications,
+    reserve_and_load,
+)
 from .util import (
-    ResultPagination,
-    healthy_battery,
-    within_weight_limit
+    apaginate,
+    async_get_view,
+    available_drones,
+    conditional,
+    drone_list_etag,
+    drones_in_state,
+    get_pagination,
+    loaded_medication_etag,
+    optimize_queryset,
+    parse_query_datetime,
 )
 
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
 from http import HTTPStatus as HTTPSStatus
+from django.conf import settings
 from django.db import IntegrityError
 from django.shortcuts import get_object_or_404
-from itertools import takewhile
-from django.http import Http404
+from django.core.handlers.asgi import ASGIRequest
+from django.http import Http404, JsonResponse, StreamingHttpResponse
+from asgiref.sync import sync_to_async
+from django.utils import timezone
+from datetime import timedelta
 from drf_yasg.utils import swagger_auto_schema
 
 
@@ -61,6 +120,77 @@ def register_drone(request):
         return response
 
 
+@swagger_auto_schema(
+    method='POST',
+    operation_description=(
+        "Register many drones from a JSON array of drones, or from a CSV "
+        "file with a header row uploaded as the multipart field 'file'"
+    ),
+    manual_parameters=DroneSerializer.bulk_register_parameters,
+    responses=DroneSerializer.responses['bulk_register_drones']
+)
+@api_view(['POST'])
+def bulk_register_drones_view(request):
+    try:
+        if 'file' in request.FILES:
+            rows = csv_rows(request.FILES['file'])
+        else:
+            rows = request.data
+        mode = request.query_params.get('mode', 'atomic')
+
+        if (
+            not isinstance(rows, list)
+            or not 0 < len(rows) <= BULK_REGISTER_MAX_ROWS
+            or mode not in ('atomic', 'best_effort')
+        ):
+            response = Response({
+                "status": "Error",
+                "message": (
+                    "Expected a JSON array or CSV file of 1 to "
+                    f"{BULK_REGISTER_MAX_ROWS} drones"
+                )
+            })
+            response.status_code = HTTPSStatus.BAD_REQUEST
+            return response
+
+        created, errors = bulk_register_drones(
+            rows, atomic=mode == 'atomic'
+        )
+
+        if created:
+            response = Response({
+                "status": "created",
+                "message": f"{created} drones registered successfully",
+                "data": {"created": created, "errors": errors}
+            })
+            response.status_code = HTTPSStatus.CREATED
+            return response
+
+        response = Response({
+            "status": "Error",
+            "message": "Input validation failed",
+            "errors": errors
+        })
+        response.status_code = HTTPSStatus.BAD_REQUEST
+        return response
+
+    except IntegrityError:
+        response = Response({
+            "status": "Error",
+            "message": "Drone with this serial number already exists"
+        })
+        response.status_code = HTTPSStatus.CONFLICT
+        return response
+
+    except Exception as e:
+        response = Response({
+            "status": "Error",
+            "message": f"An error occurred: {str(e)}"
+        })
+        response.status_code = HTTPSStatus.INTERNAL_SERVER_ERROR
+        return response
+
+
 @swagger_auto_schema(
         method='POST',
         operation_description="Register a medication",
@@ -106,6 +236,90 @@ def register_medication(request):
         return response
 
 
+@swagger_auto_schema(
+    method='POST',
+    operation_description=(
+        "Import a medication catalog, upserting medications on code. Send "
+        "a JSON array of medications, or a CSV file with a header row as "
+        "the multipart field 'file'. Images named in the image column are "
+        "read from a zip archive sent as the multipart field 'images'. "
+        "The import runs in the background; poll its progress with the "
+        "returned ID."
+    ),
+    responses=MedicationSerializer.responses['import_medications']
+)
+@api_view(['POST'])
+def import_medications(request):
+    try:
+        if 'file' in request.FILES:
+            rows = csv_rows(request.FILES['file'])
+        else:
+            rows = request.data
+        medication_import = create_import(rows, request.FILES.get('images'))
+        import_medication_catalog.delay(medication_import.pk)
+
+        response = Response({
+            "status": "accepted",
+            "message": "Medication import queued",
+            "data": import_progress(medication_import)
+        })
+        response.status_code = HTTPSStatus.ACCEPTED
+        return response
+
+    except ValueError as e:
+        response = Response({
+            "status": "Error",
+            "message": str(e)
+        })
+        response.status_code = HTTPSStatus.BAD_REQUEST
+        return response
+
+    except Exception as e:
+        response = Response({
+            "status": "Error",
+            "message": f"An error occurred: {str(e)}"
+        })
+        response.status_code = HTTPSStatus.INTERNAL_SERVER_ERROR
+        return response
+
+
+@swagger_auto_schema(
+    method='GET',
+    operation_description="Get the progress of a medication import",
+    responses=MedicationSerializer.responses['get_medication_import']
+)
+@api_view(['GET'])
+def get_medication_import(request, import_id):
+    try:
+        medication_import = get_object_or_404(
+            MedicationImport.objects.defer('rows'), pk=import_id
+        )
+
+        response = Response({
+            "status": "success",
+            "message": "Medication import retrieved successfully",
+            "data": import_progress(medication_import)
+        })
+        response.status_code = HTTPSStatus.OK
+        return response
+
+    except Http404:
+        response = Response({
+            "status": "Error",
+            "message": "Requested import does not exist"
+        })
+        response.status_code = HTTPSStatus.NOT_FOUND
+        return response
+
+    except Exception as e:
+        response = Response({
+            "status": "Error",
+            "message": f"An error occurred: {str(e)}"
+        })
+        response.status_code = HTTPSStatus.INTERNAL_SERVER_ERROR
+        return response
+
+
 @swagger_auto_schema(
     method='POST',
     operation_description="Load a drone with medication",
@@ -115,43 +329,45 @@ def register_medication(request):
 @api_view(['POST'])
 def load_drone_with_medication(request, drone_id):
     try:
-        drone = get_object_or_404(
-            Drone,
-            pk=drone_id,
-            state='IDLE',
-        )
-        medication_data = request.data.get('medications', [])
-
-        if (
-            healthy_battery(drone) and
-            drone.current_medication_weight <= drone.weight_limit
-        ):
-            medications = [
-                medication
-                for med_id in takewhile(
-                    lambda med_id: isinstance(med_id, int)
-                    and Medication.objects.filter(pk=med_id).exists(),
-                    medication_data
+        packing = request.data.get('packing')
+        if packing is not None and packing not in PACKING_OBJECTIVES:
+            response = Response({
+                "status": "Error",
+                "message": (
+                    "Invalid packing, expected one of: "
+                    f"{', '.join(PACKING_OBJECTIVES)}"
                 )
-                if (medication := Medication.objects.get(pk=med_id))
-                and within_weight_limit(drone, medication.weight)
-                and medication not in drone.medications.all()
-            ]
-            drone.current_medication_weight += sum(
-                medication.weight for medication in medications
-            )
+            })
+            response.status_code = HTTPSStatus.BAD_REQUEST
+            return response
 
-            if medications:
-                drone.medications.add(*medications)
-                drone.state = 'LOADED'
-                drone.save()
+        medication_data = request.data.get('medications', [])
+        if not isinstance(medication_data, list):
+            medication_data = []
+        medication_ids, priorities = parse_requested_medications(
+            medication_data
+        )
 
-                response = Response({
-                    "status": "created",
-                    "message": "Medication loaded successfully"
-                })
-                response.status_code = HTTPSStatus.CREATED
-                return response
+        drone, accepted, rejected = reserve_and_load(
+            drone_id,
+            medication_ids,
+            packing=packing,
+            priorities=priorities,
+        )
+
+        if accepted:
+            response = Response({
+                "status": "created",
+                "message": "Medication loaded successfully",
+                "data": {
+                    "accepted": [
+                        medication.pk for medication in accepted
+                    ],
+                    "rejected": rejected,
+                }
+            })
+            response.status_code = HTTPSStatus.CREATED
+            return response
 
         response = Response({
             "status": "Not Modified",
@@ -163,11 +379,348 @@ def load_drone_with_medication(request, drone_id):
     except Http404:
         response = Response({
             "status": "Error",
-            "message": "Requested drone not available(IDLE) or does not exist"
+            "message": (
+                "Requested drone not available(IDLE or LOADING) or does not "
+                "exist"
+            )
         })
         response.status_code = HTTPSStatus.NOT_FOUND
         return response
 
+    except ReservationConflict as e:
+        response = Response({
+            "status": "Error",
+            "message": str(e)
+        })
+        response.status_code = HTTPSStatus.CONFLICT
+        return response
+
+    except Exception as e:
+        response = Response({
+            "status": "Error",
+            "message": f"An error occurred: {str(e)}"
+        })
+        response.status_code = HTTPSStatus.INTERNAL_SERVER_ERROR
+        return response
+
+
+@swagger_auto_schema(
+    method='POST',
+    operation_description="Assign an order of medications across drones",
+    request_body=DroneSerializer.assign_order_request_body,
+    responses=DroneSerializer.responses["assign_order"]
+)
+@api_view(['POST'])
+def assign_order_to_drones(request):
+    try:
+        items = request.data.get('items', [])
+        if not isinstance(items, list):
+            items = []
+
+        assignments, unassigned = assign_order(items)
+
+        if assignments:
+            response = Response({
+                "status": "created",
+                "message": "Order assigned successfully",
+                "data": {
+                    "drones_dispatched": len(assignments),
+                    "assignments": assignments,
+                    "unassigned": unassigned,
+                }
+            })
+            response.status_code = HTTPSStatus.CREATED
+            return response
+
+        response = Response({
+            "status": "Not Modified",
+            "message": "No medication assigned"
+        })
+        response.status_code = HTTPSStatus.NOT_MODIFIED
+        return response
+
+    except ReservationConflict as e:
+        response = Response({
+            "status": "Error",
+            "message": str(e)
+        })
+        response.status_code = HTTPSStatus.CONFLICT
+        return response
+
+    except Exception as e:
+        response = Response({
+            "status": "Error",
+            "message": f"An error occurred: {str(e)}"
+        })
+        response.status_code = HTTPSStatus.INTERNAL_SERVER_ERROR
+        return response
+
+
+def valid_state(state):
+    return state in {choice for choice, _ in Drone.state_choices}
+
+
+def valid_drone_ids(drone_ids):
+    return (
+        isinstance(drone_ids, list)
+        and 0 < len(drone_ids) <= MAX_TRANSITION_DRONES
+        and all(
+            isinstance(drone_id, int) and not isinstance(drone_id, bool)
+            for drone_id in drone_ids
+        )
+    )
+
+
+# Move one drone to a state and answer with the transition, or why the
+# drone could not make it
+def transition_response(drone_id, state, message):
+    transitioned, rejected = transition_drones([drone_id], state)
+
+    if transitioned:
+        response = Response({
+            "status": "success",
+            "message": message,
+            "data": transitioned[0]
+        })
+        response.status_code = HTTPSStatus.OK
+        return response
+
+    if rejected[0]["reason"] == NOT_FOUND:
+        response = Response({
+            "status": "Error",
+            "message": "Requested drone does not exist"
+        })
+        response.status_code = HTTPSStatus.NOT_FOUND
+        return response
+
+    response = Response({
+        "status": "Error",
+        "message": (
+            f"Drone cannot move from {rejected[0]['state']} to {state}"
+        ),
+        "data": rejected[0]
+    })
+    response.status_code = HTTPSStatus.CONFLICT
+    return response
+
+
+# Move a wave of drones to a state and answer with the transitions made
+# and the drones left alone
+def wave_response(drone_ids, state, from_state, message):
+    transitioned, rejected = transition_drones(drone_ids, state, from_state)
+
+    if transitioned:
+        response = Response({
+            "status": "success",
+            "message": message,
+            "data": {
+                "transitioned": transitioned,
+                "rejected": rejected,
+            }
+        })
+        response.status_code = HTTPSStatus.OK
+        return response
+
+    response = Response({
+        "status": "Not Modified",
+        "message": "No drone transitioned"
+    })
+    response.status_code = HTTPSStatus.NOT_MODIFIED
+    return response
+
+
+def invalid_drone_ids_response(extra=""):
+    response = Response({
+        "status": "Error",
+        "message": (
+            "Expected 'drones' as a list of 1 to "
+            f"{MAX_TRANSITION_DRONES} drone IDs{extra}"
+        )
+    })
+    response.status_code = HTTPSStatus.BAD_REQUEST
+    return response
+
+
+@swagger_auto_schema(
+    method='POST',
+    operation_description=(
+        "Move a drone to another state. Allowed moves: IDLE to LOADING, "
+        "LOADING to IDLE, LOADED to DELIVERING or IDLE, DELIVERING to "
+        "DELIVERED, DELIVERED to RETURNING or IDLE and RETURNING to IDLE. "
+        "Moving to DELIVERED or IDLE unloads the drone. Drones become "
+        "LOADED only by loading medications."
+    ),
+    request_body=DroneSerializer.transition_drone_request_body,
+    responses=DroneSerializer.responses["transition_drone"]
+)
+@api_view(['POST'])
+def transition_drone(request, drone_id):
+    try:
+        state = request.data.get('state')
+        if not valid_state(state):
+            response = Response({
+                "status": "Error",
+                "message": "Invalid drone state"
+            })
+            response.status_code = HTTPSStatus.BAD_REQUEST
+            return response
+
+        if state not in TRANSITION_TARGETS:
+            response = Response({
+                "status": "Error",
+                "message": (
+                    f"Drones cannot be moved to {state}, load medications "
+                    "onto them instead"
+                )
+            })
+            response.status_code = HTTPSStatus.BAD_REQUEST
+            return response
+
+        return transition_response(
+            drone_id, state, "Drone transitioned successfully"
+        )
+
+    except Exception as e:
+        response = Response({
+            "status": "Error",
+            "message": f"An error occurred: {str(e)}"
+        })
+        response.status_code = HTTPSStatus.INTERNAL_SERVER_ERROR
+        return response
+
+
+@swagger_auto_schema(
+    method='POST',
+    operation_description=(
+        "Move a wave of drones to another state in one transaction. Drones "
+        "that cannot make the move are reported and left alone."
+    ),
+    request_body=DroneSerializer.transition_drones_request_body,
+    responses=DroneSerializer.responses["transition_drones"]
+)
+@api_view(['POST'])
+def transition_drones_view(request):
+    try:
+        drone_ids = request.data.get('drones')
+        state = request.data.get('state')
+        from_state = request.data.get('from_state')
+        if not (
+            valid_drone_ids(drone_ids)
+            and state in TRANSITION_TARGETS
+            and (from_state is None or valid_state(from_state))
+        ):
+            return invalid_drone_ids_response(" and a valid 'state'")
+
+        return wave_response(
+            drone_ids, state, from_state, "Drones transitioned successfully"
+        )
+
+    except Exception as e:
+        response = Response({
+            "status": "Error",
+            "message": f"An error occurred: {str(e)}"
+        })
+        response.status_code = HTTPSStatus.INTERNAL_SERVER_ERROR
+        return response
+
+
+@swagger_auto_schema(
+    method='POST',
+    operation_description=(
+        "Complete the delivery of a DELIVERING drone: its medications are "
+        "unloaded, its loaded weight reset and it moves to DELIVERED"
+    ),
+    responses=DroneSerializer.responses["transition_drone"]
+)
+@api_view(['POST'])
+def complete_delivery(request, drone_id):
+    try:
+        return transition_response(
+            drone_id, 'DELIVERED', "Delivery completed successfully"
+        )
+
+    except Exception as e:
+        response = Response({
+            "status": "Error",
+            "message": f"An error occurred: {str(e)}"
+        })
+        response.status_code = HTTPSStatus.INTERNAL_SERVER_ERROR
+        return response
+
+
+@swagger_auto_schema(
+    method='POST',
+    operation_description=(
+        "Return a drone to IDLE from LOADING, LOADED, DELIVERED or "
+        "RETURNING. Anything still loaded is unloaded, so the drone is "
+        "available again."
+    ),
+    responses=DroneSerializer.responses["transition_drone"]
+)
+@api_view(['POST'])
+def return_drone(request, drone_id):
+    try:
+        return transition_response(
+            drone_id, 'IDLE', "Drone returned successfully"
+        )
+
+    except Exception as e:
+        response = Response({
+            "status": "Error",
+            "message": f"An error occurred: {str(e)}"
+        })
+        response.status_code = HTTPSStatus.INTERNAL_SERVER_ERROR
+        return response
+
+
+@swagger_auto_schema(
+    method='POST',
+    operation_description=(
+        "Complete the deliveries of many DELIVERING drones in one "
+        "transaction"
+    ),
+    request_body=DroneSerializer.drone_wave_request_body,
+    responses=DroneSerializer.responses["transition_drones"]
+)
+@api_view(['POST'])
+def complete_deliveries(request):
+    try:
+        drone_ids = request.data.get('drones')
+        if not valid_drone_ids(drone_ids):
+            return invalid_drone_ids_response()
+
+        return wave_response(
+            drone_ids, 'DELIVERED', None, "Deliveries completed successfully"
+        )
+
+    except Exception as e:
+        response = Response({
+            "status": "Error",
+            "message": f"An error occurred: {str(e)}"
+        })
+        response.status_code = HTTPSStatus.INTERNAL_SERVER_ERROR
+        return response
+
+
+@swagger_auto_schema(
+    method='POST',
+    operation_description=(
+        "Return many drones to IDLE, unloaded, in one transaction"
+    ),
+    request_body=DroneSerializer.drone_wave_request_body,
+    responses=DroneSerializer.responses["transition_drones"]
+)
+@api_view(['POST'])
+def return_drones(request):
+    try:
+        drone_ids = request.data.get('drones')
+        if not valid_drone_ids(drone_ids):
+            return invalid_drone_ids_response()
+
+        return wave_response(
+            drone_ids, 'IDLE', None, "Drones returned successfully"
+        )
+
     except Exception as e:
         response = Response({
             "status": "Error",
@@ -183,11 +736,16 @@ def load_drone_with_medication(request, drone_id):
     responses=DroneSerializer.responses["get_med_on_drone"]
 )
 @api_view(['GET'])
+@conditional(
+    lambda request, drone_id: loaded_medication_etag(drone_id)
+)
 def get_loaded_medication(request, drone_id):
     try:
-        drone = get_object_or_404(Drone, pk=drone_id)
-        medications = drone.medications.all()
-        pagination = ResultPagination()
+        drone = get_object_or_404(Drone.objects.only('pk'), pk=drone_id)
+        medications = optimize_queryset(
+            drone.medications.order_by('pk'), MedicationSerializer
+        )
+        pagination = get_pagination(request)
         result = pagination.paginate_queryset(medications, request)
         serializer = MedicationSerializer(result, many=True)
 
@@ -208,6 +766,19 @@ def get_loaded_medication(request, drone_id):
         return response
 
 
+# Battery level response data of a drone snapshot
+def battery_level_data(drone):
+    return {
+        "drone": drone["serial_number"],
+        "battery_level": drone["battery_capacity"],
+        "drone_state": drone["state"],
+        "discharge_rate": drone["discharge_rate"],
+        "predicted_minutes_to_reserve": minutes_to_reserve(
+            drone["battery_capacity"], drone["discharge_rate"]
+        ),
+    }
+
+
 @swagger_auto_schema(
     method='GET',
     operation_description="Check battery level of a drone",
@@ -216,20 +787,92 @@ def get_loaded_medication(request, drone_id):
 @api_view(['GET'])
 def check_drone_battery_level(request, drone_id):
     try:
-        drone = get_object_or_404(Drone, pk=drone_id)
+        drone = get_drone_snapshot(drone_id)
 
         response = Response({
             "status": "success",
             "message": "Battery level checked successfully",
+            "data": battery_level_data(drone)
+        })
+        response.status_code = HTTPSStatus.OK
+        return response
+
+    except Http404:
+        response = Response({
+            "status": "Error",
+            "message": "Requested drone does not exist"
+        })
+        response.status_code = HTTPSStatus.NOT_FOUND
+        return response
+
+    except Exception as e:
+        response = Response({
+            "status": "Error",
+            "message": f"An error occurred: {str(e)}"
+        })
+        response.status_code = HTTPSStatus.INTERNAL_SERVER_ERROR
+        return response
+
+
+@swagger_auto_schema(
+    method='GET',
+    operation_description="Retrieve the battery history of a drone",
+    manual_parameters=DroneSerializer.battery_history_parameters,
+    responses=DroneSerializer.responses["get_battery_history"]
+)
+@api_view(['GET'])
+def get_battery_history(request, drone_id):
+    try:
+        end = request.query_params.get('to')
+        end = parse_query_datetime(end) if end else timezone.now()
+        start = request.query_params.get('from')
+        if start:
+            start = parse_query_datetime(start)
+        elif end:
+            start = end - timedelta(days=1)
+        points = request.query_params.get('points', DEFAULT_HISTORY_POINTS)
+        points = int(points) if str(points).isdigit() else 0
+        resolution = request.query_params.get('resolution')
+
+        if (
+            start is None or end is None or start >= end
+            or not 0 < points <= MAX_HISTORY_POINTS
+            or resolution not in (None, 'raw', 'hour', 'day')
+        ):
+            response = Response({
+                "status": "Error",
+                "message": "Invalid battery history parameters"
+            })
+            response.status_code = HTTPSStatus.BAD_REQUEST
+            return response
+
+        if not Drone.objects.filter(pk=drone_id).exists():
+            raise Http404
+
+        resolution, rows = query_battery_history(
+            drone_id, start, end, resolution
+        )
+
+        response = Response({
+            "status": "success",
+            "message": "Battery history retrieved successfully",
             "data": {
-                "drone": drone.serial_number,
-                "battery_level": drone.battery_capacity,
-                "drone_state": drone.state,
+                "drone": drone_id,
+                "resolution": resolution,
+                "points": list(downsample(rows, start, end, points)),
             }
         })
         response.status_code = HTTPSStatus.OK
         return response
 
+    except Http404:
+        response = Response({
+            "status": "Error",
+            "message": "Requested drone does not exist"
+        })
+        response.status_code = HTTPSStatus.NOT_FOUND
+        return response
+
     except Exception as e:
         response = Response({
             "status": "Error",
@@ -245,17 +888,16 @@ def check_drone_battery_level(request, drone_id):
     responses=DroneSerializer.responses["get_available_drones"]
 )
 @api_view(['GET'])
+@conditional(
+    lambda request: drone_list_etag(available_drones())
+)
 def get_available_drones(request):
     try:
-        drones = Drone.objects.filter(state='IDLE')
-
-        available_drones = [
-            drone for drone in drones
-            if healthy_battery(drone)
-            and drone.current_medication_weight <= 500
-        ]
-        pagination = ResultPagination()
-        result = pagination.paginate_queryset(available_drones, request)
+        drones = optimize_queryset(
+            available_drones().order_by('pk'), DroneSerializer
+        )
+        pagination = get_pagination(request)
+        result = pagination.paginate_queryset(drones, request)
         serializer = DroneSerializer(result, many=True)
 
         response = pagination.get_paginated_response({
@@ -278,9 +920,13 @@ def get_available_drones(request):
 @api_view(['GET'])
 def get_drones_list_and_medication_list(request):
     try:
-        drones = Drone.objects.all()
-        medications = Medication.objects.all()
-        pagination = ResultPagination()
+        drones = optimize_queryset(
+            Drone.objects.order_by('pk'), DroneSerializer
+        )
+        medications = optimize_queryset(
+            Medication.objects.order_by('pk'), MedicationSerializer
+        )
+        pagination = get_pagination(request)
         result = pagination.paginate_queryset(drones, request)
         drone_serializer = DroneSerializer(result, many=True)
         medication_serializer = MedicationSerializer(medications, many=True)
@@ -305,11 +951,23 @@ def get_drones_list_and_medication_list(request):
         return response
 
 
+@swagger_auto_schema(
+    method='GET',
+    operation_description="Retrieve drones, optionally in one state",
+    manual_parameters=DroneSerializer.drones_list_parameters,
+    responses=DroneSerializer.responses["get_all_drones"]
+)
 @api_view(['GET'])
+@conditional(
+    lambda request: drone_list_etag(drones_in_state(request.query_params))
+)
 def get_all_drones(request):
     try:
-        drones = Drone.objects.all()
-        pagination = ResultPagination()
+        drones = optimize_queryset(
+            drones_in_state(request.query_params).order_by('pk'),
+            DroneSerializer
+        )
+        pagination = get_pagination(request)
         result = pagination.paginate_queryset(drones, request)
         serializer = DroneSerializer(result, many=True)
 
@@ -328,3 +986,340 @@ def get_all_drones(request):
         })
         response.status_code = HTTPSStatus.INTERNAL_SERVER_ERROR
         return response
+
+
+@swagger_auto_schema(
+    method='POST',
+    operation_description=(
+        "Ingest a batch of telemetry readings for any number of drones. "
+        "Valid readings are buffered and written to the drones and their "
+        "battery history by the next flush, a few seconds later; invalid "
+        "ones are reported per row. When the buffer is full nothing is "
+        "accepted and the response is 503 with a Retry-After header."
+    ),
+    request_body=DroneSerializer.telemetry_request_body,
+    responses=DroneSerializer.responses['ingest_telemetry']
+)
+@api_view(['POST'])
+def ingest_telemetry(request):
+    try:
+        rows = request.data
+        if isinstance(rows, dict):
+            rows = rows.get('readings')
+        if not isinstance(rows, list) or not (
+            0 < len(rows) <= TELEMETRY_MAX_READINGS_PER_REQUEST
+        ):
+            response = Response({
+                "status": "Error",
+                "message": (
+                    "Expected a JSON array of 1 to "
+                    f"{TELEMETRY_MAX_READINGS_PER_REQUEST} readings"
+                )
+            })
+            response.status_code = HTTPSStatus.BAD_REQUEST
+            return response
+
+        readings, errors = validate_readings(rows)
+        if not readings:
+            response = Response({
+                "status": "Error",
+                "message": "Input validation failed",
+                "errors": errors
+            })
+            response.status_code = HTTPSStatus.BAD_REQUEST
+            return response
+
+        if not ingest_readings(readings):
+            response = Response({
+                "status": "Error",
+                "message": "Telemetry buffer is full, retry later"
+            })
+            response.status_code = HTTPSStatus.SERVICE_UNAVAILABLE
+            response['Retry-After'] = settings.TELEMETRY_FLUSH_INTERVAL
+            return response
+
+        response = Response({
+            "status": "accepted",
+            "message": f"{len(readings)} readings accepted",
+            "data": {"accepted": len(readings), "errors": errors}
+        })
+        response.status_code = HTTPSStatus.ACCEPTED
+        return response
+
+    except Exception as e:
+        response = Response({
+            "status": "Error",
+            "message": f"An error occurred: {str(e)}"
+        })
+        response.status_code = HTTPSStatus.INTERNAL_SERVER_ERROR
+        return response
+
+
+@swagger_auto_schema(
+    method='GET',
+    operation_description=(
+        "Long-poll the drone change feed. Returns the state and battery "
+        "capacity changes after the given sequence number as soon as there "
+        "are any, or an empty list when the timeout passes. Pass the "
+        "returned last_sequence as 'after' on the next poll. The same feed "
+        "is streamed as server-sent events at /drones/events/stream/ when "
+        "served over ASGI."
+    ),
+    manual_parameters=DroneSerializer.drone_events_parameters,
+    responses=DroneSerializer.responses["get_drone_events"]
+)
+@api_view(['GET'])
+def get_drone_events(request):
+    try:
+        params = parse_feed_params(request.query_params)
+        if params is None:
+            response = Response({
+                "status": "Error",
+                "message": "Invalid drone event parameters"
+            })
+            response.status_code = HTTPSStatus.BAD_REQUEST
+            return response
+
+        after = params['after']
+        if after is None:
+            after = latest_sequence()
+        events = wait_for_events(
+            after, params['timeout'], params['limit'], params['drone']
+        )
+
+        response = Response({
+            "status": "success",
+            "message": "Drone events retrieved successfully",
+            "data": {
+                "events": events,
+                "last_sequence": events[-1]['sequence'] if events else after,
+            }
+        })
+        response.status_code = HTTPSStatus.OK
+        return response
+
+    except Exception as e:
+        response = Response({
+            "status": "Error",
+            "message": f"An error occurred: {str(e)}"
+        })
+        response.status_code = HTTPSStatus.INTERNAL_SERVER_ERROR
+        return response
+
+
+# Server-sent events stream of the drone change feed. Only served from the
+# ASGI entry point, where each open stream is a coroutine rather than a
+# worker thread; a WSGI server would buffer the endless stream and tie up
+# a worker for good. Reconnecting clients resume from their Last-Event-ID.
+async def stream_drone_events(request):
+    if request.method != 'GET':
+        return JsonResponse(
+            {"status": "Error", "message": "Method not allowed"},
+            status=HTTPSStatus.METHOD_NOT_ALLOWED
+        )
+    if not isinstance(request, ASGIRequest):
+        return JsonResponse(
+            {
+                "status": "Error",
+                "message": (
+                    "Event streams need the ASGI server, long-poll "
+                    "/drones/events/ instead"
+                )
+            },
+            status=HTTPSStatus.NOT_IMPLEMENTED
+        )
+
+    params = parse_feed_params(
+        request.GET, request.headers.get('Last-Event-ID')
+    )
+    if params is None:
+        return JsonResponse(
+            {"status": "Error", "message": "Invalid drone event parameters"},
+            status=HTTPSStatus.BAD_REQUEST
+        )
+
+    after = params['after']
+    if after is None:
+        after = await sync_to_async(latest_sequence)()
+    response = StreamingHttpResponse(
+        stream_events(after, params['drone']),
+        content_type='text/event-stream'
+    )
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+# Async versions of the hot read endpoints, served under /async/ from the
+# ASGI entry point. They answer exactly like their sync counterparts, but
+# read through the async ORM and cache, so a slow dashboard connection
+# waits as a coroutine instead of holding a threadpool worker for the whole
+# request. Compare both paths with `manage.py loadtest_reads`.
+def async_error(message, status):
+    return JsonResponse({"status": "Error", "message": message}, status=status)
+
+
+# Paginated response of a queryset, in the shape of get_pagination's
+# paginators
+async def async_page_response(request, queryset, serializer_class, message):
+    page, links = await apaginate(request, queryset)
+    return JsonResponse({
+        **links,
+        "results": {
+            "status": "success",
+            "message": message,
+            "data": serializer_class(page, many=True).data
+        }
+    }, status=HTTPSStatus.OK)
+
+
+@async_get_view
+async def check_drone_battery_level_async(request, drone_id):
+    try:
+        drone = await aget_drone_snapshot(drone_id)
+        return JsonResponse({
+            "status": "success",
+            "message": "Battery level checked successfully",
+            "data": battery_level_data(drone)
+        }, status=HTTPSStatus.OK)
+
+    except Http404:
+        return async_error(
+            "Requested drone does not exist", HTTPSStatus.NOT_FOUND
+        )
+
+    except Exception as e:
+        return async_error(
+            f"An error occurred: {str(e)}", HTTPSStatus.INTERNAL_SERVER_ERROR
+        )
+
+
+@async_get_view
+@conditional(
+    lambda request, drone_id: loaded_medication_etag(drone_id)
+)
+async def get_loaded_medication_async(request, drone_id):
+    try:
+        drone = await Drone.objects.only('pk').aget(pk=drone_id)
+        return await async_page_response(
+            request,
+            optimize_queryset(
+                drone.medications.order_by('pk'), MedicationSerializer
+            ),
+            MedicationSerializer,
+            "Loaded medications retrieved successfully"
+        )
+
+    except Drone.DoesNotExist:
+        return async_error(
+            "Requested drone does not exist", HTTPSStatus.NOT_FOUND
+        )
+
+    except Exception as e:
+        return async_error(
+            f"An error occurred: {str(e)}", HTTPSStatus.INTERNAL_SERVER_ERROR
+        )
+
+
+@async_get_view
+@conditional(
+    lambda request: drone_list_etag(available_drones())
+)
+async def get_available_drones_async(request):
+    try:
+        return await async_page_response(
+            request,
+            optimize_queryset(
+                available_drones().order_by('pk'), DroneSerializer
+            ),
+            DroneSerializer,
+            "Available drones retrieved successfully"
+        )
+
+    except Exception as e:
+        return async_error(
+            f"An error occurred: {str(e)}", HTTPSStatus.INTERNAL_SERVER_ERROR
+        )
+
+
+@async_get_view
+@conditional(
+    lambda request: drone_list_etag(drones_in_state(request.GET))
+)
+async def get_all_drones_async(request):
+    try:
+        return await async_page_response(
+            request,
+            optimize_queryset(
+                drones_in_state(request.GET).order_by('pk'), DroneSerializer
+            ),
+            DroneSerializer,
+            "Drones retrieved successfully"
+        )
+
+    except Exception as e:
+        return async_error(
+            f"An error occurred: {str(e)}", HTTPSStatus.INTERNAL_SERVER_ERROR
+        )
+
+
+@swagger_auto_schema(
+    method='GET',
+    operation_description="Stream an export of drones or battery history",
+    manual_parameters=DroneSerializer.export_parameters,
+    responses=DroneSerializer.responses["export_fleet"]
+)
+@api_view(['GET'])
+def export_fleet(request):
+    try:
+        resource = request.query_params.get('resource', 'drones')
+        output = request.query_params.get('output', 'ndjson')
+        state = request.query_params.get('state')
+        start = request.query_params.get('from')
+        end = request.query_params.get('to')
+        start = parse_query_datetime(start) if start else None
+        end = parse_query_datetime(end) if end else None
+        invalid_range = (
+            start is None and 'from' in request.query_params
+            or end is None and 'to' in request.query_params
+        )
+
+        if (
+            resource not in ('drones', 'battery-history')
+            or output not in EXPORT_FORMATS
+            or invalid_range
+        ):
+            response = Response({
+                "status": "Error",
+                "message": "Invalid export parameters"
+            })
+            response.status_code = HTTPSStatus.BAD_REQUEST
+            return response
+
+        if resource == 'drones':
+            rows = drone_rows(state)
+            fieldnames = DRONE_EXPORT_FIELDS + ('medications',)
+        else:
+            rows = battery_history_rows(state, start, end)
+            fieldnames = BATTERY_HISTORY_EXPORT_FIELDS
+
+        if output == 'csv':
+            lines = csv_lines(rows, fieldnames)
+        else:
+            lines = ndjson_lines(rows)
+
+        response = StreamingHttpResponse(
+            lines, content_type=EXPORT_FORMATS[output]
+        )
+        response['Content-Disposition'] = (
+            f'attachment; filename="{resource}.{output}"'
+        )
+        return response
+
+    except Exception as e:
+        response = Response({
+            "status": "Error",
+            "message": f"An error occurred: {str(e)}"
+        })
+        response.status_code = HTTPSStatus.INTERNAL_SERVER_ERROR
+        return response